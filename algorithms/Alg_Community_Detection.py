@@ -1,16 +1,18 @@
-from neo4j import GraphDatabase
+import graph_db
+from graph_schema import ensure_schema
+from instrumentation import phase
+from recommender.cache import invalidate
 
-# Connection configuration
-URI = "bolt://localhost:7687"
-USERNAME = "neo4j"
-PASSWORD = "SuperPasswort"
 
 class CommunityDetectionLouvain:
-    def __init__(self, uri, username, password):
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+    def __init__(self, driver=None):
+        # An injected driver belongs to the caller; only the shared driver is closed by close()
+        self._owns_driver = driver is None
+        self.driver = driver or graph_db.get_driver()
 
     def close(self):
-        self.driver.close()
+        if self._owns_driver:
+            graph_db.close_driver()
 
     def create_user_similarity_projection(self):
         """
@@ -28,7 +30,7 @@ class CommunityDetectionLouvain:
             '
         )
         """
-        with self.driver.session() as session:
+        with graph_db.session(self.driver) as session:
             result = session.run(query)
             print("Graph projection created.")
             print(result.single())
@@ -44,17 +46,21 @@ class CommunityDetectionLouvain:
         })
         YIELD communityCount, modularity
         """
-        with self.driver.session() as session:
+        with graph_db.session(self.driver) as session:
             result = session.run(query)
             for record in result:
                 print(f"Louvain completed: {record['communityCount']} communities, modularity = {record['modularity']:.4f}")
 
 # Main runner
 if __name__ == "__main__":
-    detector = CommunityDetectionLouvain(URI, USERNAME, PASSWORD)
+    detector = CommunityDetectionLouvain()
 
     try:
-        detector.create_user_similarity_projection()
-        detector.run_louvain_algorithm()
+        ensure_schema()
+        with phase("project"):
+            detector.create_user_similarity_projection()
+        with phase("louvain"):
+            detector.run_louvain_algorithm()
+        invalidate()
     finally:
         detector.close()
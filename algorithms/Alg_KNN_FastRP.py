@@ -1,111 +1,124 @@
-from neo4j import GraphDatabase
-
-# Neo4j connection settings
-uri = "bolt://localhost:7687"
-user = "neo4j"
-password = "SuperPasswort"
-driver = GraphDatabase.driver(uri, auth=(user, password))
-
-
-def delete_existing_graph(tx, name="userGraph"):
-    """
-    Deletes an existing GDS (Graph Data Science) projection if it exists.
-    :param tx: Neo4j transaction
-    :param name (str): Name of the graph projection to delete
-    """
-    tx.run(f"""
-            CALL gds.graph.exists('{name}') YIELD exists
-            WITH exists
-            CALL apoc.do.when(
-                exists,
-                'CALL gds.graph.drop("{name}") YIELD graphName RETURN graphName',
-                'RETURN "Graph was not present" AS graphName',
-                {{}}
-            ) YIELD value RETURN value.graphName;
-            """)
-
-
-def create_projection_fastrp(tx, name="userGraph"):
+import argparse
+
+import numpy as np
+
+import graph_db
+from algorithms.embedding_store import EmbeddingStore
+from algorithms.projections import ProjectionManager
+from data.incremental_load import finish_refresh, get_dirty_users
+from graph_schema import ensure_schema
+from recommender.cache import invalidate
+
+
+# Bipartite User-Book graph with the rating as weight; FastRP and KNN both run on it
+RATING_GRAPH = {
+    "name": "userGraph",
+    "nodes": ["User", "Book"],
+    "relationships": {"RATED": {"type": "RATED", "orientation": "UNDIRECTED", "properties": ["rating"]}},
+    # size of an up-to-date projection, from the count store (UNDIRECTED projects every edge twice)
+    "counts": """
+        CALL { MATCH (u:User) RETURN count(u) AS users }
+        CALL { MATCH (b:Book) RETURN count(b) AS books }
+        CALL { MATCH ()-[r:RATED]->() RETURN count(r) AS ratings }
+        RETURN users + books AS nodeCount, 2 * ratings AS relationshipCount
+        """,
+}
+
+
+def estimate_fastrp(tx, name="userGraph", dim=64):
     """
-    Projects a graph with 'User' and 'Book' nodes and 'RATED' relationships
-    for FastRP embedding calculation.
     :param tx: Neo4j transaction
-    :param name (str): Name for the graph projection
-    :return: list[dict]: Metadata about the projected graph
-    """
-    query = f"""
-    CALL gds.graph.project(
-      '{name}',
-      ['User', 'Book'],
-      {{
-        RATED: {{
-          type: 'RATED',
-          orientation: 'UNDIRECTED',
-          properties: ['rating']
-        }}
-      }}
-    )
-    YIELD graphName, nodeCount, relationshipCount;
+    :param name (str): Name of the graph
+    :param dim (int): Embedding dimension
+    :return: int: Upper bound of the memory gds.fastRP.mutate needs (bytes)
     """
-    return tx.run(query).data()
+    return tx.run("""
+    CALL gds.fastRP.mutate.estimate($graph, {
+      mutateProperty: 'embedding',
+      embeddingDimension: $dim,
+      relationshipWeightProperty: 'rating'
+    })
+    YIELD bytesMax
+    RETURN bytesMax;
+    """, {"graph": name, "dim": dim}).single()["bytesMax"]
 
 
 def run_fastrp(tx, name="userGraph", dim=64):
     """
-    Calculates FastRP embeddings on the projected graph and writes them to the nodes.
+    Calculates FastRP embeddings and adds them to the projection as the node property 'embedding'
+    (nothing is written to the database; export_embeddings moves them to the embedding store).
     :param tx: Neo4j transaction
     :param name (str): Name of the graph
     :param dim (int): Embedding dimension
-    :return: list[dict]: Number of node properties written
+    :return: list[dict]: Number of node properties added to the projection
     """
-    # calculate and create the embeddings
-    query = f"""
-    CALL gds.fastRP.write('{name}', {{
-      writeProperty: 'embedding',
-      embeddingDimension: {dim},
+    return tx.run("""
+    CALL gds.fastRP.mutate($graph, {
+      mutateProperty: 'embedding',
+      embeddingDimension: $dim,
       relationshipWeightProperty: 'rating'
-    }})
-    YIELD nodePropertiesWritten;
-    """
-    return tx.run(query).data()
+    })
+    YIELD nodePropertiesWritten
+    RETURN nodePropertiesWritten;
+    """, {"graph": name, "dim": dim}).data()
 
 
-def create_graph_with_dummy_relation(tx):
+def stream_embeddings(tx, label, key, name="userGraph", dim=64, chunk=10000):
     """
-    Creates a user-only graph projection with dummy relationships,
-    enabling KNN comparison based on embeddings.
+    Reads the embeddings of one node label from the projection into a float32 array.
     :param tx: Neo4j transaction
+    :param label (str): 'User' or 'Book'
+    :param key (str): Property that identifies the node ('id' or 'isbn')
+    :param name (str): Name of the graph
+    :param dim (int): Embedding dimension
+    :param chunk (int): Rows allocated at a time
+    :return: tuple[list, np.ndarray]: Node keys and their embeddings
+    """
+    result = tx.run("""
+    CALL gds.graph.nodeProperty.stream($graph, 'embedding', [$label])
+    YIELD nodeId, propertyValue
+    RETURN gds.util.asNode(nodeId)[$key] AS key, propertyValue AS embedding;
+    """, {"graph": name, "label": label, "key": key})
+    keys, blocks = [], []
+    block, filled = np.empty((chunk, dim), dtype=np.float32), 0
+    for record in result:
+        keys.append(record["key"])
+        block[filled] = record["embedding"]
+        filled += 1
+        if filled == chunk:
+            blocks.append(block)
+            block, filled = np.empty((chunk, dim), dtype=np.float32), 0
+    blocks.append(block[:filled])
+    return keys, np.concatenate(blocks)
+
+
+def export_embeddings(session, name="userGraph", dim=64, store=None):
     """
-    # project a new graph
-    # create dummy relations between the users
-    # add the embeddings
-    # we need relations between the users to compare them
-    tx.run(f"""
-    CALL gds.graph.project(
-        'userGraph',
-        ['User'],
-        {{
-            DUMMY: {{
-                type: 'DUMMY',
-                orientation: 'UNDIRECTED'
-            }}
-        }},
-        {{
-            nodeProperties: ['embedding']
-        }}
-    );
-    """)
-
-def run_knn_write(tx, top_k=5, similarity_cutoff=0.8):
+    Stores the embeddings of the projection as a new, active version of the embedding store.
+    :param session: Neo4j session
+    :param name (str): Name of the graph
+    :param dim (int): Embedding dimension
+    :param store (EmbeddingStore): Target store (default: data/embeddings/store)
+    :return: str: Name of the new version
     """
-    Performs k-Nearest Neighbors on the user graph using embeddings.
+    user_ids, user_vectors = session.execute_read(stream_embeddings, "User", "id", name, dim)
+    isbns, book_vectors = session.execute_read(stream_embeddings, "Book", "isbn", name, dim)
+    return (store or EmbeddingStore()).write(user_ids, user_vectors, isbns, book_vectors, source="gds",
+                                             params={"embeddingDimension": dim, "relationshipWeightProperty": "rating"})
+
+
+def run_knn_write(tx, name="userGraph", top_k=5, similarity_cutoff=0.8):
+    """
+    Performs k-Nearest Neighbors between the users of the projection, based on their embeddings.
     Writes 'SIMILAR_TO' relationships between users.
     :param tx: Neo4j transaction
+    :param name (str): Name of the graph (with the 'embedding' property from run_fastrp)
     :param top_k (int): Number of nearest neighbors
     :param similarity_cutoff (float): Minimum similarity threshold
     """
     tx.run("""
-    CALL gds.knn.write('userGraph', {
+    CALL gds.knn.write($graph, {
+        nodeLabels: ['User'],
         nodeProperties: ['embedding'],
         topK: $topK,
         similarityCutoff: $cutoff,
@@ -113,7 +126,29 @@ def run_knn_write(tx, top_k=5, similarity_cutoff=0.8):
         writeProperty: 'similarity'
     })
     YIELD nodesCompared, relationshipsWritten;
-    """, {"topK": top_k, "cutoff": similarity_cutoff})
+    """, {"graph": name, "topK": top_k, "cutoff": similarity_cutoff})
+
+
+def estimate_knn(tx, name="userGraph", top_k=5, similarity_cutoff=0.8):
+    """
+    :param tx: Neo4j transaction
+    :param name (str): Name of the graph (with the 'embedding' property from run_fastrp)
+    :param top_k (int): Number of nearest neighbors
+    :param similarity_cutoff (float): Minimum similarity threshold
+    :return: int: Upper bound of the memory gds.knn.write needs (bytes)
+    """
+    return tx.run("""
+    CALL gds.knn.write.estimate($graph, {
+        nodeLabels: ['User'],
+        nodeProperties: ['embedding'],
+        topK: $topK,
+        similarityCutoff: $cutoff,
+        writeRelationshipType: 'SIMILAR_TO',
+        writeProperty: 'similarity'
+    })
+    YIELD bytesMax
+    RETURN bytesMax;
+    """, {"graph": name, "topK": top_k, "cutoff": similarity_cutoff}).single()["bytesMax"]
 
 
 def get_similar_books(tx, user_id=8, limit=10):
@@ -138,27 +173,67 @@ def get_similar_books(tx, user_id=8, limit=10):
 
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
-    with driver.session() as session:
-        print("Removing existing GDS projection if present...")
-        session.execute_write(delete_existing_graph)
-
-        print("Creating FastRP projection...")
-        session.execute_write(create_projection_fastrp)
-
-        print("Generating FastRP embeddings...")
-        session.execute_write(run_fastrp)
-
-        print("\nCleaning up old GDS graph...")
-        session.execute_write(delete_existing_graph)
-
-        print("Projecting user-only graph with dummy relationships and embeddings...")
-        session.execute_write(create_graph_with_dummy_relation)
-
-        print("Running KNN algorithm (topK=20, cutoff=0.8)...")
-        session.execute_write(run_knn_write, top_k=20)
+    parser = argparse.ArgumentParser(description="FastRP embeddings and KNN similarity on a reusable GDS projection.")
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--cutoff", type=float, default=0.8)
+    parser.add_argument("--refresh", action="store_true", help="Project again even if the projection is current")
+    parser.add_argument("--drop", action="store_true", help="Drop the projection at the end instead of keeping it")
+    parser.add_argument("--if-dirty", action="store_true",
+                        help="Only run if the delta load marked users dirty since the last KNN refresh")
+    args = parser.parse_args()
+
+    ensure_schema()
+    projections = ProjectionManager()
+    name = RATING_GRAPH["name"]
+    # FastRP and KNN are recomputed for all users, so a successful run refreshes every dirty user
+    dirty_users, dirty_read_at = graph_db.read(get_dirty_users, "knn")
+    if args.if_dirty and not dirty_users:
+        print("No dirty users, KNN is up to date.")
+        graph_db.close_driver()
+        raise SystemExit(0)
+    with graph_db.session() as session:
+        with projections.phase("project"):
+            projection = projections.ensure(RATING_GRAPH, refresh=args.refresh)
+        print(f"Projection {name} {projection['status']}: {projection['nodeCount']} nodes, "
+              f"{projection['relationshipCount']} relationships")
+
+        print("Generating FastRP embeddings in the projection...")
+        with projections.phase("fastrp"):
+            projections.require_memory(session.execute_read(estimate_fastrp, name, args.dim), "gds.fastRP.mutate")
+            # a reused projection still holds the embeddings of the previous run
+            projections.drop_node_properties(name, ["embedding"])
+            session.execute_write(run_fastrp, name, args.dim)
+
+        print("Storing the embeddings...")
+        with projections.phase("export_embeddings"):
+            version = export_embeddings(session, name, args.dim)
+        print(f"Embedding version {version} is active.")
+        indexed = EmbeddingStore().vector_index_version()
+        if indexed is not None:
+            print(f"The vector index still holds {indexed}; run "
+                  f"`python -m algorithms.embedding_store --vector-index` to export {version}.")
+
+        print(f"Running KNN algorithm on the same projection (topK={args.top_k}, cutoff={args.cutoff})...")
+        with projections.phase("knn"):
+            projections.require_memory(session.execute_read(estimate_knn, name, args.top_k, args.cutoff),
+                                       "gds.knn.write")
+            session.execute_write(run_knn_write, name, args.top_k, args.cutoff)
+        invalidate()
+        finish_refresh("knn", dirty_users, dirty_read_at)
+        print(f"{len(dirty_users)} dirty users refreshed.")
+
+        if args.drop:
+            with projections.phase("drop"):
+                projections.drop(name)
 
         print("Recommended books for user 19:")
-        books = session.execute_read(get_similar_books, user_id=19) # 11676
+        with projections.phase("recommend"):
+            books = session.execute_read(get_similar_books, user_id=19) # 11676
         for book in books:
             print(f"   ➤ {book['title']} ({book['avgRating']:.2f}, {book['votes']} votes)")
-    driver.close()
\ No newline at end of file
+    graph_db.close_driver()
+
+    print("Time per phase:")
+    for phase_name, seconds in projections.timings.items():
+        print(f"   {phase_name:<18} {seconds:8.2f} s")
@@ -0,0 +1,193 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from algorithms.embedding_store import EmbeddingStore
+from algorithms.fastrp_local import DATA_DIR, load_embeddings
+
+# Default location of the user index (next to the FastRP embeddings)
+INDEX_PATH = os.path.join(DATA_DIR, "embeddings", "user_ivf")
+
+
+def normalize(vectors):
+    """
+    L2-normalizes every row, so that dot products are cosine similarities.
+    :param vectors (np.ndarray): Row vectors
+    :return: np.ndarray: Normalized float32 copy (zero rows stay zero)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def assign_to_centroids(vectors, centroids, block=8192):
+    """
+    Returns the most similar centroid of every vector, computed block-wise to bound memory.
+    :param vectors (np.ndarray): Normalized vectors
+    :param centroids (np.ndarray): Normalized centroids
+    :param block (int): Rows per matrix product
+    :return: np.ndarray: Centroid index per vector
+    """
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block):
+        labels[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, clusters, iterations=10, seed=42):
+    """
+    Clusters normalized vectors by cosine similarity (coarse quantizer of the IVF index).
+    :param vectors (np.ndarray): Normalized training vectors
+    :param clusters (int): Number of centroids
+    :param iterations (int): Number of Lloyd iterations
+    :param seed (int): Random seed for the initial centroids
+    :return: np.ndarray: Normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_to_centroids(vectors, centroids)
+        membership = sparse.csr_matrix((np.ones(len(vectors), dtype=np.float32), (labels, np.arange(len(vectors)))),
+                                       shape=(clusters, len(vectors)))
+        sums = np.asarray(membership @ vectors)
+        empty = np.asarray(membership.sum(axis=1)).ravel() == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index for cosine top-k search over user embeddings.
+    The vectors are grouped by their nearest centroid and stored contiguously, so a query
+    only scores the `nprobe` lists whose centroids are closest to it instead of every user.
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors):
+        """
+        :param centroids (np.ndarray): Normalized centroids, one per list
+        :param offsets (np.ndarray): Start of every list in `ids` / `vectors` (length = lists + 1)
+        :param ids (np.ndarray): User IDs ordered by list
+        :param vectors (np.ndarray): Normalized vectors ordered by list
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self._by_id = np.argsort(ids, kind="stable")
+
+    @classmethod
+    def build(cls, ids, vectors, lists=None, iterations=10, training_size=100_000, seed=42):
+        """
+        Trains the centroids on a sample of the vectors and fills the inverted lists.
+        :param ids (np.ndarray): User IDs
+        :param vectors (np.ndarray): Embeddings in the same order
+        :param lists (int): Number of inverted lists (defaults to 4 * sqrt(n))
+        :param iterations (int): k-means iterations
+        :param training_size (int): Maximum number of vectors used to train the centroids
+        :param seed (int): Random seed
+        :return: IVFIndex
+        """
+        vectors = normalize(vectors)
+        n = len(vectors)
+        lists = min(n, lists or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, training_size), replace=False)]
+        centroids = spherical_kmeans(sample, lists, iterations, seed)
+
+        labels = assign_to_centroids(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(lists + 1)).astype(np.int64)
+        return cls(centroids, offsets, np.asarray(ids)[order], vectors[order])
+
+    def vector(self, user_id):
+        """
+        :param user_id (int): User ID
+        :return: np.ndarray: Stored (normalized) vector of the user
+        """
+        slot = min(np.searchsorted(self.ids, user_id, sorter=self._by_id), len(self.ids) - 1)
+        position = self._by_id[slot]
+        if self.ids[position] != user_id:
+            raise KeyError(user_id)
+        return self.vectors[position]
+
+    def search(self, query, k=20, nprobe=8, similarity_cutoff=0.0, exclude=None):
+        """
+        Approximate cosine top-k search.
+        :param query (np.ndarray): Query vector
+        :param k (int): Number of neighbours (topK)
+        :param nprobe (int): Number of inverted lists that are scanned
+        :param similarity_cutoff (float): Minimum similarity (similarityCutoff)
+        :param exclude (int): ID to leave out, usually the querying user
+        :return: tuple[np.ndarray, np.ndarray]: Neighbour IDs and similarities, most similar first
+        """
+        query = normalize(np.asarray(query).reshape(1, -1))[0]
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probed])
+        scores = self.vectors[candidates] @ query
+        if exclude is not None:
+            scores[self.ids[candidates] == exclude] = -np.inf
+
+        keep = min(k, len(candidates))
+        if keep == 0:
+            return np.empty(0, dtype=self.ids.dtype), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, keep - 1)[:keep]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        best = best[scores[best] >= similarity_cutoff]
+        return self.ids[candidates[best]], scores[best]
+
+    def search_user(self, user_id, k=20, nprobe=8, similarity_cutoff=0.0):
+        """
+        Finds the most similar other users of an indexed user.
+        :param user_id (int): User ID
+        :return: tuple[np.ndarray, np.ndarray]: Neighbour IDs and similarities, most similar first
+        """
+        return self.search(self.vector(user_id), k, nprobe, similarity_cutoff, exclude=user_id)
+
+    def save(self, prefix):
+        """
+        Stores the index as .npy files that load() can memory-map.
+        :param prefix (str): Output path without extension
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        for name in ("centroids", "offsets", "ids", "vectors"):
+            np.save(f"{prefix}_{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, prefix, mmap=True):
+        """
+        Opens a saved index; with mmap the vectors are paged in on demand and shared between processes.
+        :param prefix (str): Path without extension
+        :param mmap (bool): Memory-map the arrays instead of reading them
+        :return: IVFIndex
+        """
+        mode = "r" if mmap else None
+        return cls(*(np.load(f"{prefix}_{name}.npy", mmap_mode=mode)
+                     for name in ("centroids", "offsets", "ids", "vectors")))
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ANN index over the local FastRP user embeddings.")
+    parser.add_argument("--embeddings", default=os.path.join(DATA_DIR, "embeddings", "fastrp"),
+                        help="Prefix written by fastrp_local.py")
+    parser.add_argument("--store", action="store_true",
+                        help="Use the active version of the embedding store instead of --embeddings")
+    parser.add_argument("--output", default=INDEX_PATH, help="Output prefix of the index")
+    parser.add_argument("--lists", type=int, help="Number of inverted lists (default 4 * sqrt(users))")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.store:
+        version = EmbeddingStore().open()
+        user_ids, embeddings = version.user_ids, version.user_vectors
+    else:
+        user_ids, _, embeddings = load_embeddings(args.embeddings)
+    index = IVFIndex.build(user_ids, embeddings[:len(user_ids)], lists=args.lists)
+    index.save(args.output)
+    print(f"Index with {len(index.centroids)} lists over {len(user_ids)} users written to {args.output} "
+          f"in {time.time() - start_time:.2f} seconds")
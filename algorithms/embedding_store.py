@@ -0,0 +1,373 @@
+"""
+Versioned, memory-mapped store of the FastRP embeddings, kept outside the graph.
+
+Every version is an immutable folder under data/embeddings/store/ (v000001, v000002, ...):
+  users.npy / user_vectors.npy   User IDs (sorted) and float32 embeddings in the same order
+  books.npy / book_vectors.npy   ISBNs (sorted, UTF-8 bytes) and their embeddings (optional)
+  meta.json                      Dimension, counts, source and parameters of the run
+A version is written into a hidden folder and renamed into place once complete. The file
+CURRENT names the active version and is replaced atomically, so switching (or rolling back)
+versions never touches the graph and readers see either the old or the new version, never a
+mix. Lookups by node ID are binary searches on the mapped ID arrays.
+
+Optionally the current user embeddings are exported into a Neo4j vector index for top-k
+lookups on the server. This is the only path that writes embeddings onto nodes; it uses its own
+property (embeddingVector), so removing the 'embedding' property of older runs leaves the index
+intact, and the file VECTOR_INDEX records which version the index holds.
+
+Usage: python -m algorithms.embedding_store [--import data/embeddings/fastrp] [--activate v000002]
+                                            [--prune 2] [--vector-index] [--drop-graph-property]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import graph_db
+from algorithms.fastrp_local import DATA_DIR, load_embeddings
+from data.graph_snapshot import sorted_positions
+from instrumentation import register_queries
+
+STORE_DIR = os.path.join(DATA_DIR, "embeddings", "store")
+# Rows copied per step when a version is written (bounds the memory for large stores)
+COPY_ROWS = 65536
+
+# --- Optional vector index (Neo4j 5.13+) ---
+VECTOR_INDEX = "user_embedding"
+# Not 'embedding': drop_graph_property() removes that property left by older gds.fastRP.write runs
+VECTOR_PROPERTY = "embeddingVector"
+VECTOR_EXPORT_BATCH = 5000
+
+SET_VECTORS_QUERY = """
+    UNWIND $rows AS row
+    MATCH (u:User {id: row.id})
+    CALL db.create.setNodeVectorProperty(u, $property, row.embedding)
+    """
+VECTOR_NEIGHBOURS_QUERY = """
+    MATCH (target:User {id: $userId})
+    CALL db.index.vector.queryNodes($index, $k + 1, target[$property]) YIELD node, score
+    WITH node, score WHERE node <> target
+    RETURN node.id AS userId, score
+    ORDER BY score DESC
+    LIMIT $k
+    """
+DROP_GRAPH_PROPERTY_QUERY = """
+    MATCH (n:User|Book) WHERE n.embedding IS NOT NULL
+    CALL { WITH n REMOVE n.embedding } IN TRANSACTIONS OF 10000 ROWS
+    """
+
+register_queries("embeddings", globals())
+
+
+def _copy_rows(path, vectors, order):
+    """
+    Writes vectors[order] into a new .npy file block by block.
+    """
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(order), vectors.shape[1]))
+    for start in range(0, len(order), COPY_ROWS):
+        out[start:start + COPY_ROWS] = vectors[order[start:start + COPY_ROWS]]
+    out.flush()
+    del out
+
+
+class EmbeddingVersion:
+    """
+    One immutable version of the store; all arrays are read-only memory maps.
+    """
+
+    def __init__(self, path, user_ids, user_vectors, isbns, book_vectors, meta):
+        self.path = path
+        self.user_ids = user_ids
+        self.user_vectors = user_vectors
+        self.isbns = isbns
+        self.book_vectors = book_vectors
+        self.meta = meta
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        :param path (str): Folder of the version
+        :param mmap (bool): Memory-map the arrays instead of reading them
+        :return: EmbeddingVersion
+        """
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        has_books = os.path.exists(os.path.join(path, "books.npy"))
+        return cls(path, np.load(os.path.join(path, "users.npy"), mmap_mode=mode),
+                   np.load(os.path.join(path, "user_vectors.npy"), mmap_mode=mode),
+                   np.load(os.path.join(path, "books.npy"), mmap_mode=mode) if has_books else None,
+                   np.load(os.path.join(path, "book_vectors.npy"), mmap_mode=mode) if has_books else None, meta)
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def dim(self):
+        return self.user_vectors.shape[1]
+
+    def user_rows(self, user_ids):
+        """
+        :param user_ids (array-like): User IDs
+        :return: np.ndarray: Row of every user (-1 if the version has no embedding for it)
+        """
+        return sorted_positions(self.user_ids, np.atleast_1d(np.asarray(user_ids, dtype=np.int64)))
+
+    def user_vector(self, user_id):
+        """
+        :param user_id (int): User ID
+        :return: np.ndarray: Embedding of the user, or None
+        """
+        row = self.user_rows([user_id])[0]
+        return self.user_vectors[row] if row >= 0 else None
+
+    def user_vectors_for(self, user_ids):
+        """
+        :param user_ids (array-like): User IDs
+        :return: np.ndarray: One float32 row per ID in the given order (zeros for users without embedding)
+        """
+        rows = self.user_rows(user_ids)
+        vectors = np.zeros((len(rows), self.dim), dtype=np.float32)
+        vectors[rows >= 0] = self.user_vectors[rows[rows >= 0]]
+        return vectors
+
+    def book_vector(self, isbn):
+        """
+        :param isbn (str): ISBN
+        :return: np.ndarray: Embedding of the book, or None
+        """
+        if self.isbns is None:
+            return None
+        row = sorted_positions(self.isbns, np.array([isbn.encode("utf-8")], dtype=np.bytes_))[0]
+        return self.book_vectors[row] if row >= 0 else None
+
+
+class EmbeddingStore:
+    """
+    Folder of embedding versions plus the CURRENT pointer (see the module docstring).
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+
+    def versions(self):
+        """
+        :return: list[str]: Names of all complete versions, oldest first
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith("v") and os.path.exists(os.path.join(self.root, name, "meta.json")))
+
+    def current(self):
+        """
+        :return: str: Name of the active version, or None
+        """
+        try:
+            with open(os.path.join(self.root, "CURRENT"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open(self, version=None, mmap=True):
+        """
+        :param version (str): Version name (default: the active version)
+        :param mmap (bool): Memory-map the arrays instead of reading them
+        :return: EmbeddingVersion
+        """
+        version = version or self.current()
+        if version is None:
+            raise FileNotFoundError(f"No active embedding version in {self.root}")
+        return EmbeddingVersion.open(os.path.join(self.root, version), mmap)
+
+    def write(self, user_ids, user_vectors, isbns=None, book_vectors=None, params=None, source="", activate=True):
+        """
+        Stores a new version (rows sorted by ID) and optionally makes it the active one.
+        :param user_ids (np.ndarray): User IDs, one per row of `user_vectors`
+        :param user_vectors (np.ndarray): User embeddings (any float type, stored as float32)
+        :param isbns (np.ndarray): Optional ISBNs, one per row of `book_vectors`
+        :param book_vectors (np.ndarray): Optional book embeddings
+        :param params (dict): Parameters of the run (kept in meta.json)
+        :param source (str): Where the embeddings come from, e.g. 'gds' or 'local'
+        :param activate (bool): Switch CURRENT to the new version
+        :return: str: Name of the new version
+        """
+        os.makedirs(self.root, exist_ok=True)
+        versions = self.versions()
+        name = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+        # a hidden folder: readers never see a half-written version, a concurrent writer fails here
+        temporary = os.path.join(self.root, f".{name}.tmp")
+        os.makedirs(temporary)
+
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        order = np.argsort(user_ids, kind="stable")
+        np.save(os.path.join(temporary, "users.npy"), user_ids[order])
+        _copy_rows(os.path.join(temporary, "user_vectors.npy"), user_vectors, order)
+        if isbns is not None:
+            isbns = np.array([str(isbn).encode("utf-8") for isbn in isbns], dtype=np.bytes_)
+            order = np.argsort(isbns, kind="stable")
+            np.save(os.path.join(temporary, "books.npy"), isbns[order])
+            _copy_rows(os.path.join(temporary, "book_vectors.npy"), book_vectors, order)
+        meta = {"version": name, "dim": int(np.shape(user_vectors)[1]), "users": len(user_ids),
+                "books": 0 if isbns is None else len(isbns), "source": source, "params": params or {},
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(os.path.join(temporary, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.rename(temporary, os.path.join(self.root, name))
+        if activate:
+            self.activate(name)
+        return name
+
+    def activate(self, version):
+        """
+        Points CURRENT to a version (atomic replace, so readers never see a partial file).
+        :param version (str): Version name
+        """
+        if version not in self.versions():
+            raise ValueError(f"Unknown embedding version {version}")
+        temporary = os.path.join(self.root, ".CURRENT.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(temporary, os.path.join(self.root, "CURRENT"))
+
+    def vector_index_version(self):
+        """
+        :return: str: Version exported by export_vector_index, or None
+        """
+        try:
+            with open(os.path.join(self.root, "VECTOR_INDEX"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_vector_index_version(self, version):
+        """
+        Records which version the vector index holds (atomic replace, like CURRENT).
+        :param version (str): Version name
+        """
+        temporary = os.path.join(self.root, ".VECTOR_INDEX.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(temporary, os.path.join(self.root, "VECTOR_INDEX"))
+
+    def prune(self, keep=2):
+        """
+        Deletes old versions, keeping the newest `keep`, the active one and the one in the vector index.
+        Processes that still map a deleted version keep reading it until they close it.
+        :param keep (int): Number of versions to keep
+        :return: list[str]: Deleted versions
+        """
+        protected = {self.current(), self.vector_index_version()}
+        versions = self.versions()
+        deleted = [name for name in versions[:max(len(versions) - keep, 0)] if name not in protected]
+        for name in deleted:
+            shutil.rmtree(os.path.join(self.root, name))
+        return deleted
+
+
+def import_local(prefix, store=None, activate=True):
+    """
+    Stores embeddings written by fastrp_local.write_embeddings as a new version.
+    :param prefix (str): Path without extension
+    :param store (EmbeddingStore): Target store (default: STORE_DIR)
+    :param activate (bool): Switch CURRENT to the new version
+    :return: str: Name of the new version
+    """
+    user_ids, isbns, vectors = load_embeddings(prefix)
+    return (store or EmbeddingStore()).write(user_ids, vectors[:len(user_ids)], isbns, vectors[len(user_ids):],
+                                             source="local", activate=activate)
+
+
+# --- Vector index export ---
+def export_vector_index(store, version=None, index=VECTOR_INDEX, batch_size=VECTOR_EXPORT_BATCH):
+    """
+    Writes the user embeddings of a version as vector properties, creates a cosine vector index
+    over them, for top-k lookups on the server (see vector_neighbours), and records the version
+    in the store.
+    :param store (EmbeddingStore): Store of the version
+    :param version (str): Version to export (default: the active version)
+    :param index (str): Name of the vector index
+    :param batch_size (int): Users per write transaction
+    :return: str: Name of the exported version
+    """
+    name = version or store.current()
+    version = store.open(name)
+
+    def set_vectors(tx, rows):
+        tx.run(SET_VECTORS_QUERY, rows=rows, property=VECTOR_PROPERTY)
+
+    for start in range(0, len(version.user_ids), batch_size):
+        ids = version.user_ids[start:start + batch_size].tolist()
+        vectors = version.user_vectors[start:start + batch_size].tolist()
+        graph_db.write(set_vectors, [{"id": user_id, "embedding": vector} for user_id, vector in zip(ids, vectors)])
+    # index names, labels and OPTIONS cannot be parameters; the dimension is an int from meta.json
+    graph_db.run_write(f"""
+        CREATE VECTOR INDEX {index} IF NOT EXISTS FOR (u:User) ON (u.{VECTOR_PROPERTY})
+        OPTIONS {{indexConfig: {{`vector.dimensions`: {int(version.dim)}, `vector.similarity_function`: 'cosine'}}}}
+        """)
+    graph_db.run_read("CALL db.awaitIndexes($seconds)", timeout=310, seconds=300)
+    store.set_vector_index_version(name)
+    return name
+
+
+def vector_neighbours(user_id, k=20, index=VECTOR_INDEX):
+    """
+    Top-k most similar users from the vector index (after export_vector_index; the index keeps the
+    exported version until it is exported again, see EmbeddingStore.vector_index_version).
+    :param user_id (int): User ID
+    :param k (int): Number of neighbours
+    :return: list[dict]: userId and cosine score, most similar first
+    """
+    return graph_db.run_read(VECTOR_NEIGHBOURS_QUERY, userId=int(user_id), k=k, index=index,
+                             property=VECTOR_PROPERTY)
+
+
+def drop_graph_property():
+    """
+    Removes the 'embedding' properties that gds.fastRP.write put onto User and Book nodes in earlier runs.
+    """
+    # CALL { } IN TRANSACTIONS needs an auto-commit transaction
+    with graph_db.session() as session:
+        session.run(DROP_GRAPH_PROPERTY_QUERY).consume()
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--import", dest="import_prefix", help="Add the embeddings of fastrp_local.py as a version")
+    parser.add_argument("--activate", help="Make this version the current one")
+    parser.add_argument("--prune", type=int, help="Keep only this many versions (and the current one)")
+    parser.add_argument("--vector-index", action="store_true", help="Export the current version to a vector index")
+    parser.add_argument("--drop-graph-property", action="store_true",
+                        help="Remove 'embedding' properties that older runs wrote onto the nodes")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store)
+    if args.import_prefix:
+        print(f"Imported {args.import_prefix} as {import_local(args.import_prefix, store)}")
+    if args.activate:
+        store.activate(args.activate)
+    if args.prune is not None:
+        print(f"Deleted versions: {', '.join(store.prune(args.prune)) or 'none'}")
+    try:
+        if args.vector_index:
+            print(f"Vector index {VECTOR_INDEX} holds version {export_vector_index(store)}")
+        if args.drop_graph_property:
+            drop_graph_property()
+            print("Embedding properties removed from the graph.")
+    finally:
+        graph_db.close_driver()
+
+    current, indexed = store.current(), store.vector_index_version()
+    for name in store.versions():
+        meta = store.open(name).meta
+        print(f"{'*' if name == current else ' '} {name}  {meta['source']:<6} dim {meta['dim']:<4} "
+              f"{meta['users']} users, {meta['books']} books  {meta['created']}"
+              f"{'  (vector index)' if name == indexed else ''}")
+    if indexed is not None and indexed != current:
+        print(f"Warning: the vector index still holds {indexed}; export again with --vector-index")
@@ -0,0 +1,148 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Location of the filtered CSV files
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def build_rating_graph(data_dir=DATA_DIR):
+    """
+    Reads the filtered CSV files and builds the bipartite User-Book graph that
+    `create_projection_fastrp` projects: all User and Book nodes, RATED edges with the rating.
+    :param data_dir (str): Folder with the filtered CSV files
+    :return: tuple: user IDs (np.ndarray), ISBNs (np.ndarray), ratings as CSR matrix (users x books)
+    """
+    users = pd.read_csv(os.path.join(data_dir, "filtered_users.csv"), encoding="latin-1", usecols=["User-ID"])
+    books = pd.read_csv(os.path.join(data_dir, "filtered_books.csv"), encoding="latin-1", usecols=["ISBN"],
+                        dtype=object)
+    ratings = pd.read_csv(os.path.join(data_dir, "filtered_ratings.csv"), encoding="latin-1",
+                          dtype={"ISBN": object})
+
+    user_index = pd.Index(users["User-ID"].drop_duplicates())
+    book_index = pd.Index(books["ISBN"].drop_duplicates())
+    rows = user_index.get_indexer(ratings["User-ID"])
+    cols = book_index.get_indexer(ratings["ISBN"])
+    edges = pd.DataFrame({"row": rows, "col": cols, "rating": ratings["Book-Rating"]})
+    edges = edges[(edges["row"] >= 0) & (edges["col"] >= 0)].drop_duplicates(["row", "col"], keep="last")
+    matrix = sparse.csr_matrix(
+        (edges["rating"].to_numpy(np.float32), (edges["row"].to_numpy(), edges["col"].to_numpy())),
+        shape=(len(user_index), len(book_index)),
+    )
+    return user_index.to_numpy(np.int64), book_index.to_numpy().astype(str), matrix
+
+
+def fastrp(ratings, embedding_dimension=64, iteration_weights=(0.0, 1.0, 1.0), normalization_strength=0.0,
+           node_self_influence=0.0, relationship_weight_property="rating", random_seed=42, out=None):
+    """
+    FastRP on the undirected bipartite RATED graph, with the defaults of gds.fastRP:
+    very sparse random projection of every node, then repeated multiplication with the
+    degree-normalized adjacency matrix; every intermediate result is L2-normalized and
+    added with its iteration weight.
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :param embedding_dimension (int): Length of the embeddings (embeddingDimension)
+    :param iteration_weights (tuple[float]): Weight of every propagation step (iterationWeights)
+    :param normalization_strength (float): Degree exponent applied to the random vectors (normalizationStrength)
+    :param node_self_influence (float): Weight of the initial random vector (nodeSelfInfluence)
+    :param relationship_weight_property (str): 'rating' to weight the edges, None for an unweighted graph
+    :param random_seed (int): Seed of the random projection (randomSeed)
+    :param out (np.ndarray): Optional (users + books) x dimension float32 target, e.g. a memory map
+    :return: np.ndarray: Embeddings, users first, then books
+    """
+    weights = ratings.astype(np.float32)
+    if relationship_weight_property is None:
+        weights.data[:] = 1.0
+    adjacency = sparse.bmat([[None, weights], [weights.T, None]], format="csr", dtype=np.float32)
+    n = adjacency.shape[0]
+
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    inverse_degree = np.divide(1.0, degree, out=np.zeros_like(degree), where=degree > 0)
+    transition = sparse.diags(inverse_degree.astype(np.float32)).dot(adjacency).tocsr()
+
+    # very sparse random projection: +/- sqrt(3) with probability 1/6 each, 0 otherwise
+    rng = np.random.default_rng(random_seed)
+    scale = np.float32(np.sqrt(3.0))
+    initial = rng.choice(np.array([scale, 0.0, -scale], dtype=np.float32),
+                         size=(n, embedding_dimension), p=[1 / 6, 2 / 3, 1 / 6])
+    if normalization_strength:
+        initial *= np.power(np.maximum(degree, 1.0), normalization_strength, dtype=np.float32)[:, None]
+
+    if out is None:
+        out = np.zeros((n, embedding_dimension), dtype=np.float32)
+    out[:] = node_self_influence * initial
+
+    current = initial
+    for weight in iteration_weights:
+        current = transition.dot(current)
+        norms = np.linalg.norm(current, axis=1, keepdims=True)
+        np.divide(current, norms, out=current, where=norms > 0)
+        if weight:
+            out += np.float32(weight) * current
+    return out
+
+
+def write_embeddings(prefix, user_ids, isbns, ratings, **params):
+    """
+    Computes the embeddings straight into a memory-mapped `<prefix>.npy` file and stores
+    the node order next to it (`<prefix>_users.npy`, `<prefix>_books.npy`).
+    :param prefix (str): Output path without extension
+    :param user_ids (np.ndarray): User IDs in row order
+    :param isbns (np.ndarray): ISBNs in row order (after the users)
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :return: np.memmap: The written embeddings
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    dim = params.get("embedding_dimension", 64)
+    out = np.lib.format.open_memmap(f"{prefix}.npy", mode="w+", dtype=np.float32,
+                                    shape=(len(user_ids) + len(isbns), dim))
+    fastrp(ratings, out=out, **params)
+    out.flush()
+    np.save(f"{prefix}_users.npy", user_ids)
+    np.save(f"{prefix}_books.npy", isbns)
+    return out
+
+
+def load_embeddings(prefix):
+    """
+    Opens embeddings written by write_embeddings without reading them into memory.
+    :param prefix (str): Path without extension
+    :return: tuple: user IDs, ISBNs, read-only memory-mapped embeddings (users first)
+    """
+    user_ids = np.load(f"{prefix}_users.npy")
+    isbns = np.load(f"{prefix}_books.npy")
+    return user_ids, isbns, np.load(f"{prefix}.npy", mmap_mode="r")
+
+
+def load_user_embeddings(prefix):
+    """
+    Returns the user part of stored embeddings keyed by user ID,
+    e.g. for MatrixRecommender.from_csv(embeddings=...).
+    :param prefix (str): Path without extension
+    :return: dict[int, np.ndarray]: Embedding per user ID
+    """
+    user_ids, _, vectors = load_embeddings(prefix)
+    return dict(zip(user_ids.tolist(), vectors[:len(user_ids)]))
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute FastRP embeddings locally from the filtered CSVs.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "embeddings", "fastrp"),
+                        help="Output path without extension")
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension")
+    parser.add_argument("--unweighted", action="store_true", help="Ignore the rating as relationship weight")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    user_ids, isbns, ratings = build_rating_graph(args.data_dir)
+    print(f"Graph built: {len(user_ids)} users, {len(isbns)} books, {ratings.nnz} ratings")
+
+    write_embeddings(args.output, user_ids, isbns, ratings, embedding_dimension=args.dim,
+                     relationship_weight_property=None if args.unweighted else "rating", random_seed=args.seed)
+    print(f"FastRP embeddings written to {args.output}.npy in {time.time() - start_time:.2f} seconds")
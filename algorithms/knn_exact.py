@@ -0,0 +1,169 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import graph_db
+from algorithms.ann_index import normalize
+from algorithms.embedding_store import EmbeddingStore
+from algorithms.fastrp_local import DATA_DIR, load_embeddings
+from recommender.cache import invalidate
+
+# Vectors of the current worker process (attached from shared memory)
+_shared = {}
+
+
+def top_k_block(vectors, start, stop, top_k, similarity_cutoff):
+    """
+    Exact cosine top-k for the rows start..stop: one BLAS matrix product against all vectors,
+    then argpartition per row, so only k candidates per row are ever sorted.
+    :param vectors (np.ndarray): All normalized vectors
+    :param start (int): First row of the block
+    :param stop (int): Row after the last row of the block
+    :param top_k (int): Neighbours per row (topK)
+    :param similarity_cutoff (float): Minimum similarity (similarityCutoff)
+    :return: tuple[np.ndarray]: Source rows, target rows and similarities of the kept pairs
+    """
+    scores = vectors[start:stop] @ vectors.T
+    scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+    k = min(top_k, vectors.shape[0] - 1)
+    if k <= 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    targets = np.argpartition(scores, -k, axis=1)[:, -k:]
+    similarities = np.take_along_axis(scores, targets, axis=1)
+    sources = np.repeat(np.arange(start, stop), k).reshape(-1, k)
+
+    keep = similarities >= similarity_cutoff
+    return sources[keep], targets[keep], similarities[keep]
+
+
+def _attach(name, shape, dtype):
+    """
+    Worker initializer: maps the shared vectors into this process without copying them.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    _shared["memory"] = block
+    _shared["vectors"] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _run_block(start, stop, top_k, similarity_cutoff):
+    vectors = _shared["vectors"]
+    return top_k_block(vectors, start, stop, top_k, similarity_cutoff)
+
+
+def exact_knn(ids, vectors, top_k=20, similarity_cutoff=0.8, block_size=2048, workers=None):
+    """
+    Computes the exact cosine top-k neighbours of every vector, like gds.knn.write with
+    sampling disabled. Row blocks are spread over a process pool; the normalized vectors
+    live in shared memory, so workers read them without pickling or copying.
+    :param ids (np.ndarray): Node IDs in row order
+    :param vectors (np.ndarray): Embeddings in the same order
+    :param top_k (int): Neighbours per node (topK)
+    :param similarity_cutoff (float): Minimum similarity (similarityCutoff)
+    :param block_size (int): Rows per matrix product
+    :param workers (int): Number of processes (1 runs in this process)
+    :return: pd.DataFrame: Edge list with columns source, target, similarity
+    """
+    normalized = normalize(vectors)
+    ids = np.asarray(ids)
+    blocks = [(start, min(start + block_size, len(normalized))) for start in range(0, len(normalized), block_size)]
+
+    if workers == 1:
+        parts = [top_k_block(normalized, start, stop, top_k, similarity_cutoff) for start, stop in blocks]
+    else:
+        memory = shared_memory.SharedMemory(create=True, size=max(1, normalized.nbytes))
+        try:
+            np.ndarray(normalized.shape, dtype=normalized.dtype, buffer=memory.buf)[:] = normalized
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(memory.name, normalized.shape, normalized.dtype)) as pool:
+                futures = [pool.submit(_run_block, start, stop, top_k, similarity_cutoff) for start, stop in blocks]
+                parts = [future.result() for future in futures]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    if not parts:
+        return pd.DataFrame({"source": ids[:0], "target": ids[:0], "similarity": np.empty(0, np.float32)})
+    sources, targets, similarities = (np.concatenate(column) for column in zip(*parts))
+    return pd.DataFrame({"source": ids[sources], "target": ids[targets], "similarity": similarities})
+
+
+def write_similar_to(tx, batch, sources=None):
+    """
+    Replaces the SIMILAR_TO relationships of the batch's source users: their outgoing edges of an
+    earlier run are deleted first, in the same transaction, so neighbours that fell out of the
+    top-k do not linger. All edges of a source must be in the same batch (see source_batches).
+    :param tx: Neo4j transaction
+    :param batch (list[dict]): Edges with source, target and similarity
+    :param sources (list[int]): Users whose edges are replaced (default: the sources of `batch`;
+                                pass users without any kept neighbour too, so their old edges go)
+    """
+    if sources is None:
+        sources = sorted({row["source"] for row in batch})
+    tx.run("""
+           UNWIND $sources AS sourceId
+           MATCH (:User {id: sourceId})-[s:SIMILAR_TO]->()
+           DELETE s
+           """, sources=sources)
+    tx.run("""
+           UNWIND $rows AS row
+           MATCH (source:User {id: row.source})
+           MATCH (target:User {id: row.target})
+           MERGE (source)-[s:SIMILAR_TO]->(target)
+           SET s.similarity = row.similarity
+           """, rows=batch)
+
+
+def source_batches(user_ids, edges, users_per_batch=500):
+    """
+    Splits the edge list into write batches along source users, so each batch holds all edges of its sources.
+    :param user_ids (np.ndarray): All users the KNN ran over
+    :param edges (pd.DataFrame): Result of exact_knn
+    :param users_per_batch (int): Source users per batch
+    :Yields: tuple[list[int], list[dict]]: Source users and their edges
+    """
+    user_ids = np.asarray(user_ids)
+    edges = edges.astype({"source": int, "target": int, "similarity": float})
+    rows = pd.Index(user_ids).get_indexer(edges["source"])
+    order = np.argsort(rows, kind="stable")
+    edges, rows = edges.iloc[order], rows[order]
+    for start in range(0, len(user_ids), users_per_batch):
+        first, last = np.searchsorted(rows, [start, start + users_per_batch])
+        yield ([int(user_id) for user_id in user_ids[start:start + users_per_batch]],
+               edges.iloc[first:last].to_dict("records"))
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact KNN over the local FastRP user embeddings.")
+    parser.add_argument("--embeddings", default=os.path.join(DATA_DIR, "embeddings", "fastrp"))
+    parser.add_argument("--store", action="store_true",
+                        help="Use the active version of the embedding store instead of --embeddings")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--cutoff", type=float, default=0.8)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "embeddings", "similar_to.parquet"))
+    parser.add_argument("--write", action="store_true", help="Also write SIMILAR_TO relationships to Neo4j")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.store:
+        version = EmbeddingStore().open()
+        user_ids, embeddings = version.user_ids, version.user_vectors
+    else:
+        user_ids, _, embeddings = load_embeddings(args.embeddings)
+    edges = exact_knn(user_ids, embeddings[:len(user_ids)], args.top_k, args.cutoff, workers=args.workers)
+    edges.to_parquet(args.output, index=False)
+    print(f"{len(edges)} SIMILAR_TO edges written to {args.output} in {time.time() - start_time:.2f} seconds")
+
+    if args.write:
+        for sources, batch in source_batches(user_ids, edges, users_per_batch=max(1, 10000 // args.top_k)):
+            graph_db.write(write_similar_to, batch, sources)
+        graph_db.close_driver()
+        invalidate()
+        print("SIMILAR_TO relationships written.")
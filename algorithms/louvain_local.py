@@ -0,0 +1,170 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import graph_db
+from algorithms.fastrp_local import DATA_DIR, build_rating_graph
+from recommender.cache import invalidate
+
+# Default output of the community labels
+COMMUNITIES_FILE = os.path.join(DATA_DIR, "communities.csv")
+
+
+def co_rating_graph(ratings, min_rating=6, max_book_raters=500):
+    """
+    Builds the weighted user-user graph of create_user_similarity_projection as a sparse product:
+    weight(u1, u2) = number of books both rated with at least `min_rating`.
+    Books with more positive raters than `max_book_raters` are left out, since every one of them
+    would add a dense clique of pairs that says little about taste.
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :param min_rating (int): Minimum rating of a positive rating (r.rating >= 6)
+    :param max_book_raters (int): Popularity cap per book (None disables it)
+    :return: sparse.csr_matrix: Symmetric users x users weight matrix without self loops
+    """
+    positive = (ratings >= min_rating).astype(np.float32).tocsc()
+    if max_book_raters is not None:
+        raters = np.diff(positive.indptr)
+        positive = positive[:, np.flatnonzero(raters <= max_book_raters)]
+    positive = positive.tocsr()
+    weights = (positive @ positive.T).tocsr()
+    weights.setdiag(0)
+    weights.eliminate_zeros()
+    return weights
+
+
+def modularity(weights, labels, resolution=1.0):
+    """
+    :param weights (sparse.csr_matrix): Symmetric weight matrix
+    :param labels (np.ndarray): Community per node
+    :param resolution (float): Resolution parameter (gamma)
+    :return: float: Weighted modularity of the partition
+    """
+    total = weights.sum()
+    if total == 0:
+        return 0.0
+    membership = sparse.csr_matrix((np.ones(len(labels)), (np.arange(len(labels)), labels)))
+    internal = (membership.T @ weights @ membership).diagonal().sum()
+    community_degree = membership.T @ np.asarray(weights.sum(axis=1)).ravel()
+    return float(internal / total - resolution * np.sum((community_degree / total) ** 2))
+
+
+def local_moving(weights, resolution, rng, max_iterations=20, tolerance=1e-7):
+    """
+    Louvain phase 1: moves single nodes into the neighbouring community with the largest
+    modularity gain until no node moves anymore.
+    :param weights (sparse.csr_matrix): Symmetric weight matrix of the current level
+    :param resolution (float): Resolution parameter
+    :param rng (np.random.Generator): Source of the node order
+    :param max_iterations (int): Maximum number of passes over all nodes
+    :param tolerance (float): Minimum gain for a move
+    :return: tuple[np.ndarray, bool]: Community per node (0..c-1) and whether any node moved
+    """
+    n = weights.shape[0]
+    indptr, indices, data = weights.indptr, weights.indices, weights.data
+    degree = np.asarray(weights.sum(axis=1)).ravel()
+    total = degree.sum()
+    labels = np.arange(n)
+    community_degree = degree.copy()
+
+    moved_any = False
+    for _ in range(max_iterations):
+        moves = 0
+        for node in rng.permutation(n):
+            start, stop = indptr[node], indptr[node + 1]
+            neighbours = indices[start:stop]
+            if len(neighbours) == 0 or (len(neighbours) == 1 and neighbours[0] == node):
+                continue
+            current = labels[node]
+            community_degree[current] -= degree[node]
+
+            others = neighbours != node
+            communities, inverse = np.unique(labels[neighbours[others]], return_inverse=True)
+            links = np.bincount(inverse, weights=data[start:stop][others])
+            gains = links - resolution * community_degree[communities] * degree[node] / total
+
+            stay = np.searchsorted(communities, current)
+            stay_gain = gains[stay] if stay < len(communities) and communities[stay] == current \
+                else -resolution * community_degree[current] * degree[node] / total
+            best = np.argmax(gains)
+            if gains[best] > stay_gain + tolerance:
+                labels[node] = communities[best]
+                moves += 1
+            community_degree[labels[node]] += degree[node]
+        moved_any |= moves > 0
+        if moves == 0:
+            break
+
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels, moved_any
+
+
+def louvain(weights, resolution=1.0, max_levels=10, max_iterations=20, seed=42):
+    """
+    Weighted Louvain community detection on a CSR adjacency matrix: local moving,
+    then aggregation of every community into a single node, repeated until nothing moves.
+    :param weights (sparse.csr_matrix): Symmetric weight matrix
+    :param resolution (float): Resolution parameter (gamma)
+    :param max_levels (int): Maximum number of aggregation levels (maxLevels)
+    :param max_iterations (int): Maximum local moving passes per level (maxIterations)
+    :param seed (int): Seed of the node order
+    :return: tuple[np.ndarray, float]: Community per node and final modularity
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(weights.shape[0])
+    level_weights = weights.tocsr()
+    for _ in range(max_levels):
+        level_labels, moved = local_moving(level_weights, resolution, rng, max_iterations)
+        if not moved:
+            break
+        labels = level_labels[labels]
+        membership = sparse.csr_matrix((np.ones(len(level_labels)), (np.arange(len(level_labels)), level_labels)))
+        level_weights = (membership.T @ level_weights @ membership).tocsr()
+    return labels, modularity(weights, labels, resolution)
+
+
+def write_communities(tx, batch):
+    """
+    Writes the 'community' property of a batch of users.
+    :param tx: Neo4j transaction
+    :param batch (list[dict]): Rows with userId and community
+    """
+    tx.run("""
+           UNWIND $rows AS row
+           MATCH (u:User {id: row.userId})
+           SET u.community = row.community
+           """, rows=batch)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Louvain on the co-rating graph, computed locally.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--min-rating", type=int, default=6)
+    parser.add_argument("--max-book-raters", type=int, default=500, help="Popularity cap per book")
+    parser.add_argument("--output", default=COMMUNITIES_FILE)
+    parser.add_argument("--write", action="store_true", help="Also write the 'community' property to Neo4j")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    user_ids, _, ratings = build_rating_graph(args.data_dir)
+    weights = co_rating_graph(ratings, args.min_rating, args.max_book_raters)
+    print(f"Co-rating graph built: {len(user_ids)} users, {weights.nnz // 2} weighted pairs.")
+
+    labels, score = louvain(weights)
+    print(f"Louvain completed: {labels.max() + 1} communities, modularity = {score:.4f}")
+
+    communities = pd.DataFrame({"userId": user_ids, "community": labels})
+    communities.to_csv(args.output, index=False)
+    print(f"Communities written to {args.output} in {time.time() - start_time:.2f} seconds")
+
+    if args.write:
+        rows = communities.astype(int).to_dict("records")
+        for start in range(0, len(rows), 10000):
+            graph_db.write(write_communities, rows[start:start + 10000])
+        graph_db.close_driver()
+        invalidate()
+        print("Community labels written.")
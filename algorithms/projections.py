@@ -0,0 +1,182 @@
+"""
+Named GDS projections that are created once and reused by later runs.
+
+A projection is described by a spec (name, node labels, relationship projection and a Cypher
+query returning the nodeCount and relationshipCount an up-to-date projection has). ensure()
+keeps an existing projection of that name as long as its counts still match the database and
+it is younger than PROJECTION_MAX_AGE; otherwise it is dropped and projected again. Changed
+rating values of existing edges do not change any count, so they are picked up when the
+projection expires or with refresh=True.
+
+Before projecting, the memory is estimated with gds.graph.project.estimate and compared with
+the free heap of the server; the same check is available for algorithm estimates. Every step
+can run inside phase(), which records its wall time in `timings` and, with tracing enabled, in
+the query spans of instrumentation.py.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from neo4j.exceptions import ClientError
+
+import graph_db
+import instrumentation
+from instrumentation import register_queries
+
+# Projections older than this are rebuilt (seconds; NEO4J_PROJECTION_MAX_AGE)
+PROJECTION_MAX_AGE = float(os.environ.get("NEO4J_PROJECTION_MAX_AGE", 24 * 3600))
+# Timeout of projecting and dropping (seconds)
+PROJECTION_TIMEOUT = 3600
+# Share of the free heap an estimate may use before ensure()/require_memory() refuse to run
+HEAP_FRACTION = 0.9
+
+PROJECTION_INFO_QUERY = """
+    CALL gds.graph.list($graph)
+    YIELD graphName, nodeCount, relationshipCount, creationTime, sizeInBytes
+    RETURN graphName, nodeCount, relationshipCount, sizeInBytes,
+           duration.inSeconds(creationTime, datetime()).seconds AS ageSeconds
+    """
+PROJECT_ESTIMATE_QUERY = """
+    CALL gds.graph.project.estimate($nodes, $relationships)
+    YIELD requiredMemory, bytesMin, bytesMax, nodeCount, relationshipCount
+    RETURN requiredMemory, bytesMin, bytesMax, nodeCount, relationshipCount
+    """
+PROJECT_QUERY = """
+    CALL gds.graph.project($graph, $nodes, $relationships)
+    YIELD graphName, nodeCount, relationshipCount, projectMillis
+    RETURN graphName, nodeCount, relationshipCount, projectMillis
+    """
+DROP_QUERY = "CALL gds.graph.drop($graph, false) YIELD graphName RETURN graphName"
+DROP_NODE_PROPERTIES_QUERY = """
+    CALL gds.graph.nodeProperties.drop($graph, $properties, {failIfMissing: false})
+    YIELD propertiesRemoved
+    RETURN propertiesRemoved
+    """
+FREE_HEAP_QUERY = "CALL gds.systemMonitor() YIELD freeHeap RETURN freeHeap"
+
+register_queries("projection", globals())
+
+
+class ProjectionManager:
+    """
+    Creates, reuses and drops named projections and records the time spent in each phase.
+    """
+
+    def __init__(self, max_age=PROJECTION_MAX_AGE, heap_fraction=HEAP_FRACTION):
+        """
+        :param max_age (float): Maximum age of a reused projection in seconds
+        :param heap_fraction (float): Share of the free heap an estimate may use (None: no check)
+        """
+        self.max_age = max_age
+        self.heap_fraction = heap_fraction
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times a block: adds its duration to timings[name] and marks it as a tracing phase.
+        :param name (str): Phase name
+        """
+        started = time.perf_counter()
+        try:
+            with instrumentation.phase(name):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    # --- Catalog ---
+    def info(self, name):
+        """
+        :param name (str): Projection name
+        :return: dict: nodeCount, relationshipCount, sizeInBytes and ageSeconds, or None if it does not exist
+        """
+        records = graph_db.run_read(PROJECTION_INFO_QUERY, graph=name)
+        return records[0] if records else None
+
+    def drop(self, name):
+        """
+        Drops a projection if it exists.
+        :param name (str): Projection name
+        :return: bool: Whether a projection was dropped
+        """
+        return bool(graph_db.run_write(DROP_QUERY, timeout=PROJECTION_TIMEOUT, graph=name))
+
+    def drop_node_properties(self, name, properties):
+        """
+        Removes properties that an earlier run mutated into a reused projection.
+        :param name (str): Projection name
+        :param properties (list[str]): Node properties
+        """
+        graph_db.run_write(DROP_NODE_PROPERTIES_QUERY, graph=name, properties=list(properties))
+
+    # --- Memory ---
+    def free_heap(self):
+        """
+        :return: int: Free heap of the server in bytes, or None if the GDS version cannot report it
+        """
+        try:
+            records = graph_db.run_read(FREE_HEAP_QUERY)
+        except ClientError:
+            return None
+        return records[0]["freeHeap"] if records else None
+
+    def estimate(self, spec):
+        """
+        :param spec (dict): Projection spec
+        :return: dict: requiredMemory, bytesMin, bytesMax, nodeCount and relationshipCount of projecting it
+        """
+        return graph_db.run_read(PROJECT_ESTIMATE_QUERY, nodes=spec["nodes"],
+                                 relationships=spec["relationships"])[0]
+
+    def require_memory(self, bytes_max, what, released=0):
+        """
+        Refuses to run a step whose estimate does not fit into the free heap.
+        :param bytes_max (int): Upper bound of the estimate in bytes
+        :param what (str): Name of the step for the error message
+        :param released (int): Bytes freed before the step runs (e.g. a stale projection it replaces)
+        """
+        if self.heap_fraction is None:
+            return
+        free = self.free_heap()
+        if free is not None:
+            free += released
+        if free is not None and bytes_max > self.heap_fraction * free:
+            raise RuntimeError(f"{what} needs up to {bytes_max / 2 ** 20:.0f} MiB, but only {free / 2 ** 20:.0f} MiB "
+                               f"of heap are free")
+
+    # --- Lifecycle ---
+    def is_current(self, spec, info):
+        """
+        :param spec (dict): Projection spec
+        :param info (dict): Result of info()
+        :return: bool: The projection still matches the database and has not expired
+        """
+        if info["ageSeconds"] > self.max_age:
+            return False
+        expected = graph_db.run_read(spec["counts"])[0]
+        return (info["nodeCount"], info["relationshipCount"]) == (expected["nodeCount"],
+                                                                   expected["relationshipCount"])
+
+    def ensure(self, spec, refresh=False):
+        """
+        Returns a projection that matches the database: the existing one if it is still current,
+        otherwise a new one (after checking its memory estimate).
+        :param spec (dict): Projection spec with name, nodes, relationships and counts
+        :param refresh (bool): Project again even if the existing projection is current
+        :return: dict: status ('reused', 'created' or 'recreated'), nodeCount, relationshipCount
+        """
+        info = self.info(spec["name"])
+        if info is not None and not refresh and self.is_current(spec, info):
+            return {"status": "reused", "nodeCount": info["nodeCount"],
+                    "relationshipCount": info["relationshipCount"]}
+        # The stale projection is only dropped once the new one is known to fit into the heap it frees
+        with self.phase("estimate"):
+            self.require_memory(self.estimate(spec)["bytesMax"], f"Projection {spec['name']}",
+                                released=info["sizeInBytes"] if info is not None else 0)
+        if info is not None:
+            with self.phase("drop"):
+                self.drop(spec["name"])
+        result = graph_db.run_write(PROJECT_QUERY, timeout=PROJECTION_TIMEOUT, graph=spec["name"],
+                                    nodes=spec["nodes"], relationships=spec["relationships"])[0]
+        return {"status": "created" if info is None else "recreated", "nodeCount": result["nodeCount"],
+                "relationshipCount": result["relationshipCount"]}
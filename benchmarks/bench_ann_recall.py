@@ -0,0 +1,73 @@
+"""
+Recall and query speed of the IVF index against exact cosine KNN.
+
+Uses the local FastRP user embeddings if they exist, otherwise clustered synthetic vectors.
+
+Usage: python -m benchmarks.bench_ann_recall --users 100000 --queries 500
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from algorithms.ann_index import IVFIndex, normalize
+from algorithms.fastrp_local import DATA_DIR, load_embeddings
+
+
+def synthetic_embeddings(users, dim=64, clusters=200, seed=42):
+    """
+    :return: tuple[np.ndarray, np.ndarray]: user IDs and clustered float32 vectors
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, users)] + 0.5 * rng.normal(size=(users, dim)).astype(np.float32)
+    return np.arange(1, users + 1), vectors
+
+
+def exact_top_k(vectors, queries, k):
+    """
+    :return: np.ndarray: Row indices of the exact top-k neighbours of every query row (self excluded)
+    """
+    scores = vectors[queries] @ vectors.T
+    scores[np.arange(len(queries)), queries] = -np.inf
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000, help="Synthetic users (without embeddings)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--embeddings", default=os.path.join(DATA_DIR, "embeddings", "fastrp"))
+    args = parser.parse_args()
+
+    if os.path.exists(f"{args.embeddings}.npy"):
+        user_ids, _, embeddings = load_embeddings(args.embeddings)
+        vectors = normalize(embeddings[:len(user_ids)])
+    else:
+        user_ids, vectors = synthetic_embeddings(args.users)
+        vectors = normalize(vectors)
+    print(f"{len(user_ids)} users, {vectors.shape[1]} dimensions")
+
+    started = time.perf_counter()
+    index = IVFIndex.build(user_ids, vectors)
+    print(f"build: {time.perf_counter() - started:.2f}s, {len(index.centroids)} lists")
+
+    rng = np.random.default_rng(0)
+    queries = rng.choice(len(user_ids), args.queries, replace=False)
+    started = time.perf_counter()
+    truth = exact_top_k(vectors, queries, args.k)
+    exact_seconds = time.perf_counter() - started
+    print(f"exact: {args.queries / exact_seconds:8.0f} queries/s")
+
+    for nprobe in (1, 4, 8, 16, 32):
+        hits = 0
+        started = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            found, _ = index.search_user(user_ids[query], k=args.k, nprobe=nprobe)
+            hits += len(np.intersect1d(found, user_ids[expected]))
+        seconds = time.perf_counter() - started
+        print(f"nprobe={nprobe:>3}: recall@{args.k} {hits / (args.k * len(queries)):.3f}, "
+              f"{len(queries) / seconds:8.0f} queries/s")
@@ -0,0 +1,240 @@
+"""
+Overhead and correctness check of instrumentation.py against an in-memory fake driver.
+
+Measures the cost per query (session + read transaction + tx.run + data()) of the raw driver,
+the wrapped driver with tracing disabled and with tracing enabled (MemorySink), then checks the
+emitted spans: names, rows, counters, phases, PROFILE capture for slow reads, EXPLAIN for slow
+writes and the async path. Exits with status 1 if the disabled overhead exceeds --max-overhead
+or a check fails.
+
+Usage: python -m benchmarks.bench_instrumentation --queries 20000 --max-overhead 2.0
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import instrumentation
+from instrumentation import MemorySink, instrument, instrument_async, phase
+from recommender.recommender_knn import RECOMMEND_BOOKS_QUERY
+
+PLAN = {"operatorType": "ProduceResults", "args": {"Details": "title"}, "rows": 3, "dbHits": 0,
+        "children": [{"operatorType": "NodeIndexSeek", "args": {"Details": "u:User(id)"}, "rows": 1,
+                      "dbHits": 2, "children": []}]}
+
+
+class FakeCounters:
+    def __init__(self, updates):
+        if updates:
+            self.properties_set = updates
+
+
+class FakeSummary:
+    def __init__(self, query, updates=0):
+        self.database = "neo4j"
+        self.result_available_after = 1
+        self.result_consumed_after = 0
+        self.counters = FakeCounters(updates)
+        self.profile = PLAN if query.startswith("PROFILE") else None
+        self.plan = PLAN if query.startswith(("PROFILE", "EXPLAIN")) else None
+
+
+class FakeResult:
+    def __init__(self, query, rows):
+        self.query = query
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def data(self):
+        return list(self.rows)
+
+    def consume(self):
+        return FakeSummary(self.query, 0 if self.rows else 5)
+
+
+class FakeTx:
+    def __init__(self, log, delay=0.0):
+        self.log = log
+        self.delay = delay
+
+    def run(self, query, parameters=None, **kwargs):
+        self.log.append(query)
+        if self.delay:
+            time.sleep(self.delay)
+        rows = [] if "SET" in query else [{"title": f"Book {i}"} for i in range(3)]
+        return FakeResult(query, rows)
+
+
+class FakeSession:
+    def __init__(self, log, delay):
+        self.tx = FakeTx(log, delay)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return self.tx.run(query, parameters, **kwargs)
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(self.tx, *args, **kwargs)
+
+    execute_write = execute_read
+
+    def close(self):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, delay=0.0):
+        self.log = []
+        self.delay = delay
+
+    def session(self, **kwargs):
+        return FakeSession(self.log, self.delay)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncResult(FakeResult):
+    async def data(self):
+        return list(self.rows)
+
+    async def consume(self):
+        return FakeResult.consume(self)
+
+
+class FakeAsyncTx(FakeTx):
+    async def run(self, query, parameters=None, **kwargs):
+        result = FakeTx.run(self, query, parameters, **kwargs)
+        return FakeAsyncResult(query, result.rows)
+
+
+class FakeAsyncSession(FakeSession):
+    def __init__(self, log, delay):
+        self.tx = FakeAsyncTx(log, delay)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, parameters=None, **kwargs):
+        return await self.tx.run(query, parameters, **kwargs)
+
+    async def execute_read(self, work, *args, **kwargs):
+        return await work(self.tx, *args, **kwargs)
+
+    execute_write = execute_read
+
+
+class FakeAsyncDriver(FakeDriver):
+    def session(self, **kwargs):
+        return FakeAsyncSession(self.log, self.delay)
+
+
+def fetch(tx, query, params):
+    return tx.run(query, params).data()
+
+
+def write_rating(tx, user_id):
+    tx.run("MATCH (u:User {id: $userId}) SET u.dirty = true", userId=user_id)
+
+
+def per_query_us(driver, queries, repeats=5):
+    """
+    :return: float: Best average time per query over `repeats` runs (microseconds)
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(queries):
+            with driver.session() as session:
+                session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": i})
+        best = min(best, (time.perf_counter() - start) / queries * 1e6)
+    return best
+
+
+def check(condition, message, failures):
+    print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def check_spans(failures):
+    sink = MemorySink()
+    instrumentation.enable(sink)
+    driver = instrument(FakeDriver())
+    with phase("job"), driver.session() as session:
+        records = session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 1})
+        session.execute_write(write_rating, 7)
+        list(session.run("MATCH (b:Book) RETURN b.title AS title"))
+    query, write, auto, job = sink.spans
+    check(len(records) == 3 and query["name"] == "knn.recommend_books" and query["rows"] == 3,
+          "read span named after its constant, rows counted", failures)
+    check(write["name"] == "bench_instrumentation.write_rating" and write["counters"] == {"properties_set": 5},
+          "unconsumed write result finished, named after caller, counters kept", failures)
+    check(auto["rows"] == 3 and auto["phase"] == "job" and job["kind"] == "phase" and job["name"] == "job",
+          "auto-commit span and phase span", failures)
+    check(query["params_hash"] == instrumentation.params_hash({"userId": 1}), "parameters hashed", failures)
+    instrumentation.disable()
+
+    sink = MemorySink()
+    instrumentation.enable(sink, profile_threshold=0.005)
+    instrumentation._last_profiled.clear()
+    slow = FakeDriver(delay=0.01)
+    driver = instrument(slow)
+    with driver.session() as session:
+        session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 2})
+        session.execute_write(write_rating, 8)
+    instrumentation.disable()  # waits for the background plan captures
+    plans = {span["name"]: span for span in sink.spans}
+    check(plans["knn.recommend_books"].get("db_hits") == 2 and any(q.startswith("PROFILE") for q in slow.log),
+          "slow read profiled (PROFILE re-run, db hits summed)", failures)
+    check("plan" in plans["bench_instrumentation.write_rating"] and any(q.startswith("EXPLAIN") for q in slow.log)
+          and sum(q.startswith("MATCH (u:User") for q in slow.log) == 1,
+          "slow write explained, never executed twice", failures)
+
+    async def run_async():
+        sink = MemorySink()
+        instrumentation.enable(sink)
+        driver = instrument_async(FakeAsyncDriver())
+
+        async def work(tx, user_id):
+            return await (await tx.run(RECOMMEND_BOOKS_QUERY, {"userId": user_id})).data()
+        async with driver.session() as session:
+            records = await session.execute_read(work, 3)
+        instrumentation.disable()
+        return records, sink.spans
+    records, spans = asyncio.run(run_async())
+    check(len(records) == 3 and len(spans) == 1 and spans[0]["rows"] == 3, "async read span", failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--max-overhead", type=float, default=2.0,
+                        help="Allowed overhead per query with tracing disabled (microseconds)")
+    args = parser.parse_args()
+
+    instrumentation.disable()
+    raw = per_query_us(FakeDriver(), args.queries)
+    disabled = per_query_us(instrument(FakeDriver()), args.queries)
+    instrumentation.enable(MemorySink())
+    enabled = per_query_us(instrument(FakeDriver()), args.queries)
+    instrumentation.disable()
+    print(f"raw driver            {raw:7.2f} us/query")
+    print(f"wrapped, disabled     {disabled:7.2f} us/query  (+{disabled - raw:.2f} us)")
+    print(f"wrapped, enabled      {enabled:7.2f} us/query  (+{enabled - raw:.2f} us)")
+
+    failures = []
+    check(disabled - raw <= args.max_overhead, f"disabled overhead <= {args.max_overhead} us per query", failures)
+    check_spans(failures)
+    if failures:
+        sys.exit(1)
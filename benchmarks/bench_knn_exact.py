@@ -0,0 +1,28 @@
+"""
+Throughput of the blocked exact KNN kernel for growing user counts, single process vs. process pool.
+
+Usage: python -m benchmarks.bench_knn_exact --users 10000 25000 50000 --workers 4
+"""
+import argparse
+import os
+import time
+
+from algorithms.knn_exact import exact_knn
+from benchmarks.bench_ann_recall import synthetic_embeddings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 25_000, 50_000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--cutoff", type=float, default=0.8)
+    args = parser.parse_args()
+
+    for users in args.users:
+        ids, vectors = synthetic_embeddings(users)
+        for workers in sorted({1, args.workers}):
+            started = time.perf_counter()
+            edges = exact_knn(ids, vectors, args.top_k, args.cutoff, workers=workers)
+            seconds = time.perf_counter() - started
+            print(f"{users:>8} users, {workers:>2} workers: {seconds:7.2f}s, "
+                  f"{users / seconds:9.0f} users/s, {len(edges)} edges")
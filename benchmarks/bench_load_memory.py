@@ -0,0 +1,96 @@
+"""
+Peak memory of the eager loader (whole CSV in pandas) versus the streaming loader.
+
+Each mode runs in its own subprocess against a driver that discards the batches,
+so the reported peak RSS only covers reading and converting the ratings file.
+
+Usage: python -m benchmarks.bench_load_memory --rows 2000000
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+class NullDriver:
+    """Driver stand-in that runs the transaction functions against a no-op transaction."""
+
+    def session(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, fn, *args):
+        return fn(self, *args)
+
+    def run(self, query, **params):
+        return None
+
+
+def write_ratings(path, rows):
+    """
+    Writes a synthetic ratings file with the same layout as filtered_ratings.csv.
+    :param path (str): Target file
+    :param rows (int): Number of ratings
+    """
+    rng = random.Random(42)
+    with open(path, "w", encoding="latin-1") as f:
+        f.write("User-ID,ISBN,Book-Rating\n")
+        for _ in range(rows):
+            f.write(f"{rng.randint(1, 280000)},{rng.randint(10 ** 9, 10 ** 10 - 1)},{rng.randint(1, 10)}\n")
+
+
+def peak_rss_mb():
+    """
+    :return: float: Peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(mode, path):
+    """
+    Uploads the ratings file to the null driver and prints peak RSS and duration.
+    :param mode (str): 'eager' or 'streaming'
+    :param path (str): Ratings file
+    """
+    import pandas as pd
+    from data import load_data
+
+    started = time.perf_counter()
+    if mode == "eager":
+        source = pd.read_csv(path, sep=",", encoding="latin-1").fillna("")
+    else:
+        source = path
+    with NullDriver().session() as session:
+        for batch in load_data.chunk_source(source, 1000):
+            session.execute_write(load_data.load_ratings, batch)
+    print(f"{mode:>9}: peak RSS {peak_rss_mb():8.1f} MB, {time.perf_counter() - started:6.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--mode", choices=["eager", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            # the file name selects the explicit dtypes of filtered_ratings.csv
+            path = os.path.join(tmp, "filtered_ratings.csv")
+            write_ratings(path, args.rows)
+            print(f"{args.rows} ratings, {os.path.getsize(path) / 1024 / 1024:.1f} MB on disk")
+            for mode in ("eager", "streaming"):
+                subprocess.run([sys.executable, "-m", "benchmarks.bench_load_memory", "--mode", mode, "--path", path],
+                               check=True)
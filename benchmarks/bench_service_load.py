@@ -0,0 +1,75 @@
+"""
+Load generator for the HTTP recommendation service: concurrent clients request random users
+(skewed, so the same users come back and get coalesced) and QPS and latency percentiles are
+measured on the client side. Without --url the service is started in-process on the stub backend.
+
+Usage: python -m benchmarks.bench_service_load --clients 32 --seconds 10 --window 0.005
+       python -m benchmarks.bench_service_load --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from recommender.service import RecommendationService, StubBackend, create_server
+
+
+def client(url, paths, user_ids, stop_at, latencies, errors):
+    """
+    Sends requests one after another until `stop_at` and records their latencies.
+    """
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{url}{path}?user={user_ids[i % len(user_ids)]}", timeout=30) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            errors.append(1)
+        i += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Running service (default: start one on the stub backend)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=10000, help="Size of the user ID range")
+    parser.add_argument("--window", type=float, default=0.005, help="Batch window of the in-process service")
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated query latency of the stub")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = create_server(RecommendationService(StubBackend(args.latency), window=args.window), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+
+    rng = np.random.default_rng(42)
+    paths = ["/recommendations", "/similar-users"]
+    latencies, errors, threads = [], [], []
+    stop_at = time.perf_counter() + args.seconds
+    for _ in range(args.clients):
+        user_ids = (rng.zipf(1.3, 10000) % args.users).tolist()
+        threads.append(threading.Thread(target=client, args=(url, paths, user_ids, stop_at, latencies, errors)))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    print(f"{len(latencies)} requests in {seconds:.1f}s with {args.clients} clients: "
+          f"{len(latencies) / seconds:.0f} QPS, p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, "
+          f"{len(errors)} errors")
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        print(json.dumps(json.loads(response.read()), indent=2))
+    if server is not None:
+        server.shutdown()
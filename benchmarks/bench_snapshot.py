@@ -0,0 +1,126 @@
+"""
+Start-up time and memory of the graph snapshot (data/graph_snapshot.py) versus parsing the CSV files.
+
+Generates a synthetic graph, writes its snapshot, then measures in fresh subprocesses:
+  csv       build_rating_graph() plus the book metadata from the filtered CSV files
+  snapshot  GraphSnapshot.open() plus the zero-copy rating matrix
+  workers   a process pool whose workers open the snapshot, versus workers that receive
+            a pickled copy of the rating matrices (the batch job without --snapshot)
+Finally checks that the snapshot holds the same ratings as build_rating_graph().
+
+Usage: python -m benchmarks.bench_snapshot --users 100000 --books 40000 --workers 4
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from algorithms.fastrp_local import build_rating_graph
+from benchmarks.synthetic_graph import synthetic_graph, write_csv
+from data.graph_snapshot import GraphSnapshot
+from recommender.batch_recommendations import _init_worker, _worker, rating_matrices
+
+
+def peak_rss_mb():
+    """
+    :return: float: Peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _worker_nnz(_):
+    return _worker["ratings"].nnz, peak_rss_mb()
+
+
+def prepare(data_dir, prefix, users, books, mean_degree):
+    """
+    Writes a synthetic graph as CSV files and its snapshot, and prints both sizes.
+    """
+    write_csv(*synthetic_graph(users, books, mean_degree=mean_degree), data_dir)
+    started = time.perf_counter()
+    GraphSnapshot.from_csv(data_dir, os.path.join(data_dir, "communities.csv")).save(prefix)
+    folder = os.path.dirname(prefix)
+    size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+    csv_size = sum(os.path.getsize(os.path.join(data_dir, name)) for name in os.listdir(data_dir)
+                   if name.endswith(".csv"))
+    print(f"snapshot written in {time.perf_counter() - started:.2f}s: {size / 1024 / 1024:.1f} MB "
+          f"(CSV files: {csv_size / 1024 / 1024:.1f} MB)")
+
+
+def run_mode(mode, data_dir, prefix, workers):
+    """
+    Prints duration and peak RSS of one way to get the rating graph into memory.
+    :param mode (str): 'csv', 'snapshot', 'workers-pickle' or 'workers-snapshot'
+    :param data_dir (str): Folder with the filtered CSV files
+    :param prefix (str): Snapshot path
+    :param workers (int): Pool size of the worker modes
+    """
+    started = time.perf_counter()
+    if mode == "csv":
+        user_ids, isbns, ratings = build_rating_graph(data_dir)
+        pd.read_csv(os.path.join(data_dir, "filtered_books.csv"), encoding="latin-1", dtype=object)
+        detail = f"{ratings.nnz} ratings"
+    elif mode == "snapshot":
+        ratings = GraphSnapshot.open(prefix).ratings_matrix()
+        detail = f"{ratings.nnz} ratings"
+    else:
+        if mode == "workers-pickle":
+            ratings, rated = rating_matrices(build_rating_graph(data_dir)[2])
+            initargs = (None, ratings, rated)
+        else:
+            initargs = (None, None, None, prefix)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_worker_nnz, range(workers)))
+        detail = f"worker peak RSS {max(rss for _, rss in results):.1f} MB"
+    milliseconds = (time.perf_counter() - started) * 1000
+    print(f"{mode:>17}: {milliseconds:8.1f} ms, peak RSS {peak_rss_mb():7.1f} MB, {detail}")
+
+
+def check_equal(data_dir, prefix):
+    """
+    :return: bool: The snapshot holds the ratings of build_rating_graph (up to the row/column order)
+    """
+    user_ids, isbns, ratings = build_rating_graph(data_dir)
+    snapshot = GraphSnapshot.open(prefix)
+    rows, cols = snapshot.user_index(user_ids), snapshot.book_index(isbns)
+    if (rows < 0).any() or (cols < 0).any():
+        return False
+    reordered = ratings[np.argsort(rows)][:, np.argsort(cols)]
+    return (reordered != snapshot.ratings_matrix().astype(np.float32)).nnz == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--books", type=int, default=40_000)
+    parser.add_argument("--mean-degree", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--prefix", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == "prepare":
+        prepare(args.data_dir, args.prefix, args.users, args.books, args.mean_degree)
+    elif args.mode:
+        run_mode(args.mode, args.data_dir, args.prefix, args.workers)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, "snapshot", "graph")
+            # every step runs in its own process: Linux keeps the peak RSS of a parent across fork and exec
+            for mode in ("prepare", "csv", "snapshot", "workers-pickle", "workers-snapshot"):
+                subprocess.run([sys.executable, "-m", "benchmarks.bench_snapshot", "--mode", mode, "--data-dir", tmp,
+                                "--prefix", prefix, "--workers", str(args.workers), "--users", str(args.users),
+                                "--books", str(args.books), "--mean-degree", str(args.mean_degree)], check=True)
+            equal = check_equal(tmp, prefix)
+            print(f"snapshot matches build_rating_graph: {equal}")
+            if not equal:
+                sys.exit(1)
@@ -0,0 +1,156 @@
+"""
+Cold-start and rerun latency of streamlit_app.py, run headless with Streamlit's AppTest against
+an in-memory fake of Neo4j (every query costs a fixed round-trip plus a small cost per returned row).
+
+Measured: the first run (empty caches), a rerun without changes, a rerun after selecting another
+user, and the button click that shows the recommendations.
+
+Usage: python -m benchmarks.bench_streamlit_app --users 50000 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+import graph_db
+from recommender import recommender_async
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app.py")
+
+
+class FakeGraph:
+    """
+    Answers the queries of the app from generated users; sleeps `latency + per_row * rows`.
+    """
+
+    def __init__(self, users, latency, per_row=2e-6, community_size=20):
+        self.users = [{"userId": i, "location": "somewhere", "age": 30, "communityId": i // community_size}
+                      for i in range(users)]
+        self.latency = latency
+        self.per_row = per_row
+        self.queries = 0
+
+    def matching(self, id_ranges):
+        return [u for u in self.users if any(low <= u["userId"] < high for low, high in id_ranges)]
+
+    def answer(self, query, params):
+        self.queries += 1
+        if "RETURN communityId" in query:
+            rows = [{"communityId": c} for c in sorted({u["communityId"] for u in self.users})]
+        elif "COUNT(u) AS total" in query:
+            rows = [{"total": len(self.matching(params["idRanges"]))}]
+        elif "SKIP $skip" in query:
+            matches = self.matching(params["idRanges"])
+            rows = matches[params["skip"]:params["skip"] + params["limit"]]
+        elif "UNWIND users AS user" in query:  # user list of the earlier app version
+            rows = self.users
+        elif "r.rating AS rating" in query and "b.title AS title" in query:
+            rows = [{"title": f"Book {i}", "author": "Author", "rating": 10 - i} for i in range(8)]
+        elif "maxBooks" in query:
+            rows = [{"users": [{"id": params["userId"], "location": "x", "age": 30, "similarity": None}],
+                     "books": [{"isbn": str(i), "title": f"Book {i}", "author": "Author",
+                                "ratings": [{"userId": params["userId"], "rating": 8}]} for i in range(10)]}]
+        elif "u2" in query or "userId" in query and "location" in query:
+            rows = [{"userId": i, "location": "x", "age": 30} for i in range(3)]
+        else:
+            rows = [{"title": f"Book {i}", "author": "Author", "avgRating": 9.0, "votes": 3} for i in range(3)]
+        return rows
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return self.rows
+
+
+class _Tx:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, query, params=None, **kwargs):
+        rows = self.graph.answer(query, {**(params or {}), **kwargs})
+        time.sleep(self.graph.latency + self.graph.per_row * len(rows))
+        return _Result(rows)
+
+
+class FakeDriver:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def session(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(_Tx(self.graph), *args, **kwargs)
+
+    execute_write = execute_read
+
+    def close(self):
+        pass
+
+
+class _AsyncResult(_Result):
+    async def data(self):
+        return self.rows
+
+
+class _AsyncTx(_Tx):
+    async def run(self, query, params=None, **kwargs):
+        rows = self.graph.answer(query, {**(params or {}), **kwargs})
+        await asyncio.sleep(self.graph.latency + self.graph.per_row * len(rows))
+        return _AsyncResult(rows)
+
+
+class FakeAsyncDriver(FakeDriver):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute_read(self, work, *args, **kwargs):
+        return await work(_AsyncTx(self.graph), *args, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def timed(step):
+    start = time.perf_counter()
+    step()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated round-trip per query (seconds)")
+    parser.add_argument("--app", default=APP)
+    args = parser.parse_args()
+
+    graph = FakeGraph(args.users, args.latency)
+    graph_db.set_driver(FakeDriver(graph))
+    recommender_async.set_async_driver(FakeAsyncDriver(graph))
+
+    app = AppTest.from_file(os.path.abspath(args.app), default_timeout=120)
+    results = [("cold start", timed(app.run))]
+    results.append(("rerun, nothing changed", timed(app.run)))
+    app.selectbox[0].select_index(1)
+    results.append(("rerun, other user selected", timed(app.run)))
+    results.append(("click 'Recommend Books'", timed(app.button[0].click().run)))
+    if app.exception:
+        raise SystemExit(app.exception[0].value)
+
+    for name, seconds in results:
+        print(f"{name:<28} {seconds * 1000:8.1f} ms")
+    print(f"{graph.queries} queries answered by the fake graph")
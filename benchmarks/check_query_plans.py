@@ -0,0 +1,90 @@
+"""
+EXPLAIN-based check that the hot-path queries use the constraints and indexes of graph_schema.py.
+
+Plans every query of the recommenders (single and batched), the graph views, the app's user
+picker, the loaders and the incremental refresh without running them, and exits with status 1
+if any plan still contains a NodeByLabelScan or AllNodesScan.
+
+Usage: python -m benchmarks.check_query_plans [--ensure] [--show-plans]
+"""
+import argparse
+import sys
+
+import graph_db
+import recommender.recommender_community as community
+import recommender.recommender_knn as knn
+from data.incremental_load import DIRTY_USERS_QUERY
+from data.load_data import LOAD_BOOKS_QUERY, LOAD_RATINGS_QUERY, LOAD_USERS_QUERY
+from graph_schema import ensure_schema, explain, plan_operators, scans
+from recommender.graph_view import COMMUNITY_VIEW_QUERY, KNN_VIEW_QUERY
+from recommender.user_queries import (COUNT_USERS_QUERY, LARGE_COMMUNITIES_QUERY, USER_RATED_BOOKS_QUERY,
+                                      USERS_PAGE_QUERY, id_prefix_ranges)
+
+# Parameter values only need the right types: EXPLAIN never runs the query
+USER = {"userId": 0}
+USERS = {"userIds": [0]}
+VIEW = {"userId": 0, "maxUsers": 1, "maxBooks": 1}
+PICKER = {"communities": [0], "idRanges": id_prefix_ranges("27"), "skip": 0, "limit": 1}
+ROWS = {"rows": [{"User-ID": "0", "Location": "", "Age": "", "ISBN": "0", "Book-Title": "", "Book-Author": "",
+                  "Year-Of-Publication": "", "Publisher": "", "Book-Rating": "0"}]}
+
+HOT_PATHS = {
+    "knn.recommend_books": (knn.RECOMMEND_BOOKS_QUERY, USER),
+    "knn.similar_users": (knn.SIMILAR_USERS_QUERY, USER),
+    "knn.graph_data": (knn.GRAPH_DATA_QUERY, USER),
+    "knn.recommend_books_batch": (knn.RECOMMEND_BOOKS_BATCH_QUERY, USERS),
+    "knn.similar_users_batch": (knn.SIMILAR_USERS_BATCH_QUERY, USERS),
+    "community.recommend_books": (community.RECOMMEND_BOOKS_QUERY, USER),
+    "community.similar_users": (community.SIMILAR_USERS_QUERY, USER),
+    "community.graph_data": (community.GRAPH_DATA_QUERY, USER),
+    "community.recommend_books_batch": (community.RECOMMEND_BOOKS_BATCH_QUERY, USERS),
+    "community.similar_users_batch": (community.SIMILAR_USERS_BATCH_QUERY, USERS),
+    "view.knn_view": (KNN_VIEW_QUERY, VIEW),
+    "view.community_view": (COMMUNITY_VIEW_QUERY, VIEW),
+    "app.large_communities": (LARGE_COMMUNITIES_QUERY, {}),
+    "app.count_users": (COUNT_USERS_QUERY, PICKER),
+    "app.users_page": (USERS_PAGE_QUERY, PICKER),
+    "app.user_rated_books": (USER_RATED_BOOKS_QUERY, USER),
+    "loader.load_users": (LOAD_USERS_QUERY, ROWS),
+    "loader.load_books": (LOAD_BOOKS_QUERY, ROWS),
+    "loader.load_ratings": (LOAD_RATINGS_QUERY, ROWS),
+    "incremental.dirty_users": (DIRTY_USERS_QUERY, {"job": "knn"}),
+}
+
+
+def check_plans(queries=None):
+    """
+    :param queries (dict): Name -> (query, params), defaults to HOT_PATHS
+    :return: dict: Name -> {'operators': [...], 'scans': [...]}
+    """
+    results = {}
+    for name, (query, params) in (queries or HOT_PATHS).items():
+        plan = explain(query, **params)
+        results[name] = {"operators": plan_operators(plan), "scans": scans(plan)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ensure", action="store_true", help="Create missing constraints and indexes first")
+    parser.add_argument("--show-plans", action="store_true", help="Print the operators of every plan")
+    args = parser.parse_args()
+
+    try:
+        if args.ensure:
+            ensure_schema()
+        results = check_plans()
+    finally:
+        graph_db.close_driver()
+
+    failed = [name for name, result in results.items() if result["scans"]]
+    for name, result in results.items():
+        lookups = sorted({operator for operator in result["operators"] if "Index" in operator})
+        status = f"SCAN {', '.join(result['scans'])}" if result["scans"] else "ok"
+        print(f"{name:<34} {status:<24} {', '.join(lookups)}")
+        if args.show_plans:
+            print(f"    {' <- '.join(result['operators'])}")
+    if failed:
+        print(f"{len(failed)} of {len(results)} queries scan all nodes of a label.")
+        sys.exit(1)
+    print(f"All {len(results)} hot-path queries are index-backed.")
@@ -0,0 +1,367 @@
+"""
+Offline quality evaluation of the KNN and Community strategies on held-out ratings.
+
+split_ratings() picks test users among the users with at least --min-ratings ratings and holds
+out their most recent --holdout share of ratings. "Recent" follows a timestamp column if the
+ratings file has one; Book-Crossing has none, so the file order (the load order) is used. Both
+strategies are rebuilt on the training ratings with the in-memory engines:
+  knn        MatrixRecommender (top_k, similarity_cutoff) on local FastRP embeddings of the
+             training graph (dim; dim=0 compares the rating vectors instead)
+  community  local Louvain on the co-rating graph (min_rating, max_book_raters, resolution)
+             and CommunityTables
+and asked for the top-k books of every test user, in parallel batches of users. A held-out book
+is relevant if it was rated >= --relevant-rating. Reported are precision@k, recall@k, NDCG@k
+(users with at least one relevant book), the share of users that got any recommendation,
+catalog coverage (share of all books recommended to someone) and the per-user latency.
+
+--sweep runs a parameter grid (e.g. top_k=10,20,40 dim=0,64); with --baseline the run exits
+with status 1 if a metric of a run with the same strategy and parameters dropped by more than
+--tolerance.
+
+Usage: python -m benchmarks.evaluation --data-dir /tmp/synthetic --k 10 --output eval.json
+       python -m benchmarks.evaluation --strategies knn --sweep top_k=10,20,40 similarity_cutoff=0.5,0.8
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from algorithms.fastrp_local import DATA_DIR, build_rating_graph, fastrp
+from algorithms.louvain_local import co_rating_graph, louvain
+from recommender.community_tables import CommunityTables
+from recommender.recommender_matrix import MatrixRecommender
+
+# --- Split and metric defaults ---
+K = 10
+TEST_USERS = 2000
+HOLDOUT = 0.2
+MIN_RATINGS = 5
+RELEVANT_RATING = 6
+BLOCK_SIZE = 100
+SEED = 42
+# Allowed relative drop of a quality metric against the baseline
+QUALITY_TOLERANCE = 0.05
+QUALITY_METRICS = ("precision", "recall", "ndcg", "coverage")
+
+# Parameters of every strategy and their defaults (the values of the production jobs)
+STRATEGIES = {
+    "knn": {"top_k": 20, "similarity_cutoff": 0.8, "dim": 64},
+    "community": {"min_rating": 6, "max_book_raters": 500, "resolution": 1.0},
+}
+
+# Engine of the current worker process
+_worker = {}
+
+
+# --- Split ---
+def read_ratings(data_dir=DATA_DIR):
+    """
+    Reads the rating graph with the position of every rating in time.
+    :param data_dir (str): Folder with the filtered CSV files
+    :return: tuple: user IDs, ISBNs and a DataFrame with row, col, rating and time per rating
+    """
+    user_ids, isbns, _ = build_rating_graph(data_dir)
+    ratings = pd.read_csv(os.path.join(data_dir, "filtered_ratings.csv"), encoding="latin-1", dtype={"ISBN": object})
+    time_column = next((column for column in ratings.columns if column.lower() in ("timestamp", "time", "date")),
+                       None)
+    order = pd.to_datetime(ratings[time_column]).to_numpy(np.int64) if time_column else np.arange(len(ratings))
+    edges = pd.DataFrame({"row": pd.Index(user_ids).get_indexer(ratings["User-ID"]),
+                          "col": pd.Index(isbns).get_indexer(ratings["ISBN"].astype(str)),
+                          "rating": ratings["Book-Rating"].to_numpy(np.float32), "time": order})
+    edges = edges[(edges["row"] >= 0) & (edges["col"] >= 0)].drop_duplicates(["row", "col"], keep="last")
+    return user_ids, isbns, edges.reset_index(drop=True)
+
+
+def split_ratings(edges, test_users=TEST_USERS, holdout=HOLDOUT, min_ratings=MIN_RATINGS, seed=SEED):
+    """
+    Holds out the most recent ratings of a random sample of users.
+    :param edges (pd.DataFrame): row, col, rating and time per rating
+    :param test_users (int): Number of test users
+    :param holdout (float): Share of a test user's ratings that is held out (at least one, never all)
+    :param min_ratings (int): Minimum number of ratings of a test user
+    :param seed (int): Seed of the user sample
+    :return: tuple[pd.DataFrame, pd.DataFrame]: Training and held-out ratings
+    """
+    degree = edges["row"].value_counts()
+    eligible = np.sort(degree.index[degree >= min_ratings].to_numpy())
+    rng = np.random.default_rng(seed)
+    sampled = rng.choice(eligible, min(test_users, len(eligible)), replace=False)
+
+    candidates = edges[edges["row"].isin(sampled)].sort_values(["row", "time"], kind="stable")
+    newest_first = candidates.groupby("row").cumcount(ascending=False)
+    count = candidates["row"].map(degree)
+    held = np.clip(np.rint(count * holdout), 1, count - 1)
+    test = candidates[newest_first < held]
+    return edges.drop(test.index), test
+
+
+def rating_matrix(edges, shape):
+    """
+    :param edges (pd.DataFrame): row, col and rating per rating
+    :param shape (tuple[int]): Users x books
+    :return: sparse.csr_matrix: Rating matrix
+    """
+    return sparse.csr_matrix((edges["rating"].to_numpy(np.float32), (edges["row"].to_numpy(), edges["col"].to_numpy())),
+                             shape=shape)
+
+
+# --- Strategies ---
+class Evaluation:
+    """
+    Training graph of one split plus the parts of the engines that several parameter sets share.
+    """
+
+    def __init__(self, user_ids, isbns, train):
+        """
+        :param user_ids (np.ndarray): User IDs in row order
+        :param isbns (np.ndarray): ISBNs in column order
+        :param train (pd.DataFrame): Training ratings (row, col, rating)
+        """
+        self.user_ids = user_ids
+        self.isbns = isbns
+        self.train = train
+        self.ratings = rating_matrix(train, (len(user_ids), len(isbns)))
+        self._embeddings = {}
+        self._labels = {}
+
+    def embeddings(self, dim):
+        if dim not in self._embeddings:
+            self._embeddings[dim] = fastrp(self.ratings, embedding_dimension=dim)[:len(self.user_ids)]
+        return self._embeddings[dim]
+
+    def labels(self, min_rating, max_book_raters, resolution):
+        key = (min_rating, max_book_raters, resolution)
+        if key not in self._labels:
+            self._labels[key] = louvain(co_rating_graph(self.ratings, min_rating, max_book_raters), resolution)[0]
+        return self._labels[key]
+
+    def engine(self, strategy, params):
+        """
+        :param strategy (str): 'knn' or 'community'
+        :param params (dict): Parameters of the strategy (see STRATEGIES)
+        :return: MatrixRecommender or CommunityTables (both answer recommend_indices)
+        """
+        if strategy == "knn":
+            users = pd.DataFrame({"id": self.user_ids, "location": "", "age": np.nan})
+            books = pd.DataFrame({"isbn": self.isbns, "title": "", "author": "", "publisher": "", "year": np.nan})
+            ratings = pd.DataFrame({"userId": self.user_ids[self.train["row"].to_numpy()],
+                                    "isbn": self.isbns[self.train["col"].to_numpy()],
+                                    "rating": self.train["rating"].to_numpy()})
+            embeddings = self.embeddings(params["dim"]) if params["dim"] else None
+            return MatrixRecommender(users, books, ratings, embeddings, top_k=params["top_k"],
+                                     similarity_cutoff=params["similarity_cutoff"])
+        labels = self.labels(params["min_rating"], params["max_book_raters"], params["resolution"])
+        empty = np.full(len(self.isbns), "", dtype=object)
+        return CommunityTables.build(self.user_ids, self.isbns, empty, empty, self.ratings, labels,
+                                     params["min_rating"])
+
+
+def _init_worker(engine):
+    _worker["engine"] = engine
+
+
+def _recommend_block(user_ids, k):
+    """
+    :return: list[tuple]: (user ID, recommended book columns, seconds) per user
+    """
+    results = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        books = _worker["engine"].recommend_indices(user_id, k)[0]
+        results.append((user_id, books, time.perf_counter() - started))
+    return results
+
+
+def recommend_all(engine, user_ids, k=K, workers=None, block_size=BLOCK_SIZE):
+    """
+    Asks an engine for the top-k books of every user, in parallel blocks of users.
+    :param engine: MatrixRecommender or CommunityTables
+    :param user_ids (np.ndarray): Test users
+    :param k (int): Recommendations per user
+    :param workers (int): Number of processes (1 runs in this process)
+    :param block_size (int): Users per task
+    :return: list[tuple]: (user ID, recommended book columns, seconds) per user
+    """
+    blocks = [user_ids[start:start + block_size] for start in range(0, len(user_ids), block_size)]
+    if workers == 1:
+        _init_worker(engine)
+        return [result for block in blocks for result in _recommend_block(block, k)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine,)) as pool:
+        return [result for results in pool.map(_recommend_block, blocks, itertools.repeat(k)) for result in results]
+
+
+# --- Metrics ---
+def score(results, relevant, n_books, k=K):
+    """
+    :param results (list[tuple]): Output of recommend_all
+    :param relevant (dict[int, set]): Relevant held-out book columns per user ID
+    :param n_books (int): Size of the catalog
+    :param k (int): Cut-off of the metrics
+    :return: dict: precision, recall, ndcg, served, coverage, users and latency_ms percentiles
+    """
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    precision, recall, ndcg = [], [], []
+    recommended = set()
+    for user_id, books, _ in results:
+        books = books[:k].tolist()
+        recommended.update(books)
+        wanted = relevant.get(user_id)
+        if not wanted:
+            continue
+        hits = np.array([book in wanted for book in books], dtype=bool)
+        precision.append(hits.sum() / k)
+        recall.append(hits.sum() / len(wanted))
+        ideal = discounts[:min(len(wanted), k)].sum()
+        ndcg.append(discounts[:len(hits)][hits].sum() / ideal)
+    latency = np.array([seconds for _, _, seconds in results]) * 1000
+    return {"precision": float(np.mean(precision)) if precision else 0.0,
+            "recall": float(np.mean(recall)) if recall else 0.0,
+            "ndcg": float(np.mean(ndcg)) if ndcg else 0.0,
+            "served": float(np.mean([len(books) > 0 for _, books, _ in results])) if results else 0.0,
+            "coverage": len(recommended) / n_books if n_books else 0.0,
+            "users": len(precision),
+            "latency_ms": {"p50": float(np.percentile(latency, 50)), "p95": float(np.percentile(latency, 95)),
+                           "mean": float(latency.mean())} if len(latency) else None}
+
+
+def parameter_grid(strategy, sweep):
+    """
+    :param strategy (str): Strategy name
+    :param sweep (dict[str, list]): Values per parameter; parameters of other strategies are ignored
+    :return: list[dict]: Every combination, with the defaults for parameters that are not swept
+    """
+    defaults = STRATEGIES[strategy]
+    names = [name for name in sweep if name in defaults]
+    return [{**defaults, **dict(zip(names, values))} for values in itertools.product(*(sweep[name] for name in names))]
+
+
+def run_evaluation(data_dir, strategies=tuple(STRATEGIES), sweep=None, k=K, test_users=TEST_USERS, holdout=HOLDOUT,
+                   min_ratings=MIN_RATINGS, relevant_rating=RELEVANT_RATING, workers=None, seed=SEED):
+    """
+    Splits the ratings once and evaluates every strategy and parameter set on that split.
+    :return: dict: Settings of the split and one entry per run with strategy, params, metrics and build time
+    """
+    user_ids, isbns, edges = read_ratings(data_dir)
+    train, test = split_ratings(edges, test_users, holdout, min_ratings, seed)
+    relevant = test[test["rating"] >= relevant_rating].groupby("row")["col"].agg(set)
+    relevant = {user_ids[row]: books for row, books in relevant.items()}
+    evaluation = Evaluation(user_ids, isbns, train)
+    test_ids = user_ids[np.unique(test["row"].to_numpy())]
+
+    runs = []
+    for strategy in strategies:
+        for params in parameter_grid(strategy, sweep or {}):
+            started = time.perf_counter()
+            engine = evaluation.engine(strategy, params)
+            build_seconds = time.perf_counter() - started
+            metrics = score(recommend_all(engine, test_ids, k, workers), relevant, len(isbns), k)
+            runs.append({"strategy": strategy, "params": params, "metrics": metrics, "build_seconds": build_seconds})
+    return {"created": datetime.now(timezone.utc).isoformat(), "data_dir": data_dir,
+            "split": {"k": k, "test_users": len(test_ids), "held_out": len(test), "train": len(train),
+                      "holdout": holdout, "min_ratings": min_ratings, "relevant_rating": relevant_rating,
+                      "seed": seed},
+            "runs": runs}
+
+
+def compare(results, baseline, tolerance=QUALITY_TOLERANCE):
+    """
+    Compares the quality metrics of runs with the same strategy and parameters.
+    :param results (dict): Output of run_evaluation
+    :param baseline (dict): Earlier output of run_evaluation
+    :param tolerance (float): Allowed relative drop of a metric
+    :return: list[str]: One message per regression
+    """
+    def key(run):
+        return run["strategy"], json.dumps(run["params"], sort_keys=True)
+
+    before = {key(run): run["metrics"] for run in baseline.get("runs", [])}
+    regressions = []
+    for run in results["runs"]:
+        then = before.get(key(run))
+        if then is None:
+            continue
+        for metric in QUALITY_METRICS:
+            if run["metrics"][metric] < then[metric] * (1 - tolerance):
+                regressions.append(f"{run['strategy']} {run['params']}: {metric} {then[metric]:.4f} -> "
+                                   f"{run['metrics'][metric]:.4f}")
+    return regressions
+
+
+def print_results(results):
+    split = results["split"]
+    print(f"{split['test_users']} test users, {split['held_out']} held-out and {split['train']} training ratings, "
+          f"k = {split['k']}")
+    print(f"{'strategy':<10} {'precision':>9} {'recall':>8} {'ndcg':>8} {'served':>7} {'coverage':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'build s':>8}  params")
+    for run in results["runs"]:
+        metrics = run["metrics"]
+        latency = metrics["latency_ms"] or {"p50": 0.0, "p95": 0.0}
+        params = ", ".join(f"{name}={value}" for name, value in run["params"].items())
+        print(f"{run['strategy']:<10} {metrics['precision']:>9.4f} {metrics['recall']:>8.4f} {metrics['ndcg']:>8.4f} "
+              f"{metrics['served']:>7.2f} {metrics['coverage']:>9.4f} {latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+              f"{run['build_seconds']:>8.2f}  {params}")
+
+
+def parse_sweep(entries):
+    """
+    :param entries (list[str]): name=value1,value2,... entries of --sweep
+    :return: dict[str, list]: Values per parameter (ints, floats or None)
+    """
+    def value(text):
+        if text.lower() == "none":
+            return None
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    sweep = {}
+    for entry in entries or []:
+        name, _, values = entry.partition("=")
+        if not any(name in defaults for defaults in STRATEGIES.values()):
+            raise ValueError(f"Unknown parameter {name!r} in --sweep")
+        sweep[name] = [value(text) for text in values.split(",")]
+    return sweep
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--strategies", nargs="+", choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument("--sweep", nargs="+", help="Parameter grid, e.g. top_k=10,20,40 dim=0,64 min_rating=5,6")
+    parser.add_argument("--k", type=int, default=K)
+    parser.add_argument("--test-users", type=int, default=TEST_USERS)
+    parser.add_argument("--holdout", type=float, default=HOLDOUT)
+    parser.add_argument("--min-ratings", type=int, default=MIN_RATINGS)
+    parser.add_argument("--relevant-rating", type=int, default=RELEVANT_RATING)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against an earlier results file")
+    parser.add_argument("--tolerance", type=float, default=QUALITY_TOLERANCE, help="Allowed relative metric drop")
+    args = parser.parse_args()
+
+    evaluation_results = run_evaluation(args.data_dir, args.strategies, parse_sweep(args.sweep), args.k,
+                                        args.test_users, args.holdout, args.min_ratings, args.relevant_rating,
+                                        args.workers, args.seed)
+    print_results(evaluation_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(evaluation_results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = compare(evaluation_results, json.load(f), args.tolerance)
+        for message in found:
+            print(f"REGRESSION {message}")
+        if found:
+            sys.exit(1)
+        print("No quality regressions against the baseline.")
@@ -0,0 +1,462 @@
+"""
+Benchmark and regression suite for the Cypher queries of the project.
+
+Every query the project issues (recommend_books, get_similar_users, get_graph_data and
+get_graph_view of both recommenders, the user lookups of the Streamlit app and the loader
+batches) runs for users at fixed percentiles of user degree (KNN and per-user queries) or
+community size (community queries). For each it records the latency distribution, the rows
+returned and, from PROFILE, the db hits. Results are stored as JSON and can be compared against
+a baseline file; the run exits with status 1 if a query got slower or needs more db hits.
+
+Every query runs in its own transaction that is rolled back, so the loader batches leave the
+graph unchanged. For offline runs, --backend local answers the same operations with the
+in-memory engines on a graph written by benchmarks/synthetic_graph.py (no db hits there).
+
+Usage: python -m benchmarks.query_suite --output results.json [--baseline baseline.json]
+       python -m benchmarks.synthetic_graph --output /tmp/synthetic
+       python -m benchmarks.query_suite --backend local --data-dir /tmp/synthetic --output local.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import graph_db
+import recommender.recommender_community as community
+import recommender.recommender_knn as knn
+from data.graph_snapshot import GraphSnapshot
+from data.load_data import load_books, load_ratings, load_users
+from recommender.community_tables import CommunityTables, read_inputs
+from recommender.graph_view import COMMUNITY_VIEW_QUERY, KNN_VIEW_QUERY, MAX_BOOKS, MAX_USERS
+from recommender.recommender_matrix import MatrixRecommender
+from recommender.user_queries import (COUNT_USERS_QUERY, LARGE_COMMUNITIES_QUERY, USER_RATED_BOOKS_QUERY,
+                                      USERS_PAGE_QUERY, id_prefix_ranges)
+
+PERCENTILES = (50, 90, 99)
+REPEATS = 20
+WARMUP = 2
+LOADER_BATCH_SIZE = 1000
+# A query regresses if its median latency grows by more than this share (and by at least MIN_LATENCY_MS)
+LATENCY_TOLERANCE = 0.25
+MIN_LATENCY_MS = 1.0
+# ... or if it needs more db hits than this share above the baseline
+DB_HITS_TOLERANCE = 0.0
+
+USER_STATS_QUERY = """
+            MATCH (u:User)
+            RETURN u.id AS userId, size([(u)-[:RATED]->() | 1]) AS degree, u.community AS community
+            """
+
+BATCH_SAMPLE_QUERY = """
+            MATCH (u:User)-[r:RATED]->(b:Book)
+            RETURN u.id AS userId, u.location AS location, u.age AS age, b.isbn AS isbn, b.title AS title,
+                   b.author AS author, b.year AS year, b.publisher AS publisher, r.rating AS rating
+            LIMIT $size
+            """
+
+
+class QueryCase:
+    """
+    One query of the project: how to run it against Neo4j, which parameters it gets for a
+    sampled user, and (optionally) the equivalent operation of the local backend.
+    """
+
+    def __init__(self, name, work, params, sample=None, local=None):
+        """
+        :param name (str): Name in the results, e.g. 'knn.recommend_books'
+        :param work (callable): Transaction function taking (tx, **params)
+        :param params (callable): (user_id, context) -> query parameters
+        :param sample (str): 'degree', 'community' or None (runs once, without a user)
+        :param local (str): Name of the LocalBackend operation (None if there is none)
+        """
+        self.name = name
+        self.work = work
+        self.params = params
+        self.sample = sample
+        self.local = local
+
+
+def read_work(query):
+    """
+    :param query (str): Cypher query
+    :return: callable: Transaction function that runs the query and returns its records
+    """
+    def work(tx, **params):
+        return tx.run(query, params).data()
+    return work
+
+
+def query_cases():
+    """
+    :return: list[QueryCase]: All queries of the suite
+    """
+    def user(user_id, context):
+        return {"userId": user_id}
+
+    def view(user_id, context):
+        return {"userId": user_id, "maxUsers": MAX_USERS, "maxBooks": MAX_BOOKS}
+
+    def users_page(user_id, context):
+        return {"communities": context["communities"], "idRanges": id_prefix_ranges(""), "skip": 0, "limit": 50}
+
+    cases = []
+    for prefix, module, sample, view_query in (("knn", knn, "degree", KNN_VIEW_QUERY),
+                                               ("community", community, "community", COMMUNITY_VIEW_QUERY)):
+        cases += [
+            QueryCase(f"{prefix}.recommend_books", read_work(module.RECOMMEND_BOOKS_QUERY), user, sample,
+                      f"{prefix}.recommend_books"),
+            QueryCase(f"{prefix}.get_similar_users", read_work(module.SIMILAR_USERS_QUERY), user, sample,
+                      f"{prefix}.get_similar_users"),
+            QueryCase(f"{prefix}.get_graph_data", read_work(module.GRAPH_DATA_QUERY), user, sample,
+                      f"{prefix}.get_graph_data"),
+            QueryCase(f"{prefix}.get_graph_view", read_work(view_query), view, sample, f"{prefix}.get_graph_view"),
+        ]
+    cases += [
+        QueryCase("app.get_user_rated_books", read_work(USER_RATED_BOOKS_QUERY), user, "degree",
+                  "app.get_user_rated_books"),
+        QueryCase("app.get_large_communities", read_work(LARGE_COMMUNITIES_QUERY), lambda u, c: {}, None,
+                  "app.get_large_communities"),
+        QueryCase("app.count_users", read_work(COUNT_USERS_QUERY),
+                  lambda u, c: {"communities": c["communities"], "idRanges": id_prefix_ranges("")}, None,
+                  "app.count_users"),
+        QueryCase("app.get_users_page", read_work(USERS_PAGE_QUERY), users_page, None, "app.get_users_page"),
+        QueryCase("loader.load_users", load_users, lambda u, c: {"batch": c["batches"]["users"]}),
+        QueryCase("loader.load_books", load_books, lambda u, c: {"batch": c["batches"]["books"]}),
+        QueryCase("loader.load_ratings", load_ratings, lambda u, c: {"batch": c["batches"]["ratings"]}),
+    ]
+    return cases
+
+
+def pick_samples(stats, percentiles=PERCENTILES):
+    """
+    Picks one user per percentile of user degree and one per percentile of community size.
+    :param stats (pd.DataFrame): userId, degree and community of every user
+    :param percentiles (tuple[int]): Percentiles to sample
+    :return: dict: {'degree' | 'community': {percentile: {'userId': ..., 'degree' | 'communitySize': ...}}}
+    """
+    def at(n, percentile):
+        return min(n - 1, int(round(percentile / 100 * (n - 1))))
+
+    samples = {"degree": {}, "community": {}}
+    by_degree = stats.sort_values(["degree", "userId"], kind="stable").reset_index(drop=True)
+    for percentile in percentiles:
+        row = by_degree.iloc[at(len(by_degree), percentile)]
+        samples["degree"][percentile] = {"userId": int(row["userId"]), "degree": int(row["degree"])}
+
+    members = stats.dropna(subset=["community"])
+    sizes = members.groupby("community").size().sort_values(kind="stable")
+    for percentile in percentiles:
+        if sizes.empty:
+            break
+        label = sizes.index[at(len(sizes), percentile)]
+        user_id = members.loc[members["community"] == label, "userId"].min()
+        samples["community"][percentile] = {"userId": int(user_id), "communitySize": int(sizes[label])}
+    return samples
+
+
+def total_db_hits(plan):
+    """
+    :param plan (dict): Profiled plan of a result summary
+    :return: int: db hits of the plan and all its children
+    """
+    return plan.get("dbHits", 0) + sum(total_db_hits(child) for child in plan.get("children", []))
+
+
+def count_rows(result):
+    """
+    :param result: Result of a local operation
+    :return: int: Number of returned rows (nodes + edges for graph views)
+    """
+    if isinstance(result, dict):
+        return len(result.get("nodes", [])) + len(result.get("edges", []))
+    return len(result) if result is not None else 0
+
+
+# --- NEO4J BACKEND ---
+class _Records:
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def data(self):
+        return [record.data() for record in self.records]
+
+
+class RecordingTx:
+    """
+    Wraps a transaction: runs every query (prefixed with PROFILE if requested), consumes it
+    and counts the returned rows and db hits.
+    """
+
+    def __init__(self, tx, profile=False):
+        self.tx = tx
+        self.profile = profile
+        self.rows = 0
+        self.db_hits = 0
+
+    def run(self, query, parameters=None, **kwargs):
+        result = self.tx.run(f"PROFILE {query}" if self.profile else query, parameters, **kwargs)
+        records = list(result)
+        summary = result.consume()
+        self.rows += len(records)
+        if self.profile and summary.profile:
+            self.db_hits += total_db_hits(summary.profile)
+        return _Records(records)
+
+
+class Neo4jBackend:
+    """
+    Runs the cases against the configured Neo4j database, each in a rolled-back transaction.
+    """
+    name = "neo4j"
+
+    def supports(self, case):
+        return True
+
+    def sample_users(self, percentiles=PERCENTILES):
+        stats = pd.DataFrame(graph_db.run_read(USER_STATS_QUERY), columns=["userId", "degree", "community"])
+        return pick_samples(stats, percentiles)
+
+    def context(self, batch_size=LOADER_BATCH_SIZE):
+        """
+        :param batch_size (int): Rows per loader batch
+        :return: dict: Large communities and loader batches built from existing data (in CSV row format)
+        """
+        rows = pd.DataFrame(graph_db.run_read(BATCH_SAMPLE_QUERY, size=batch_size))
+
+        def as_text(value):
+            return "" if value is None or pd.isna(value) else str(value)
+        users = rows.drop_duplicates("userId")
+        books = rows.drop_duplicates("isbn")
+        batches = {
+            "users": [{"User-ID": as_text(r.userId), "Location": as_text(r.location), "Age": as_text(r.age)}
+                      for r in users.itertuples()],
+            "books": [{"ISBN": r.isbn, "Book-Title": as_text(r.title), "Book-Author": as_text(r.author),
+                       "Year-Of-Publication": as_text(r.year), "Publisher": as_text(r.publisher)}
+                      for r in books.itertuples()],
+            "ratings": [{"User-ID": as_text(r.userId), "ISBN": r.isbn, "Book-Rating": as_text(r.rating)}
+                        for r in rows.itertuples()],
+        } if len(rows) else {"users": [], "books": [], "ratings": []}
+        communities = [record["communityId"] for record in graph_db.run_read(LARGE_COMMUNITIES_QUERY)]
+        return {"communities": communities, "batches": batches}
+
+    def execute(self, case, params, profile=False):
+        """
+        :return: tuple: seconds, rows returned, db hits (None unless profiled)
+        """
+        with graph_db.session() as session:
+            tx = session.begin_transaction()
+            try:
+                recorder = RecordingTx(tx, profile)
+                start = time.perf_counter()
+                case.work(recorder, **params)
+                seconds = time.perf_counter() - start
+            finally:
+                tx.rollback()
+        return seconds, recorder.rows, recorder.db_hits if profile else None
+
+
+# --- LOCAL BACKEND ---
+class LocalBackend:
+    """
+    Offline stand-in for Neo4j: answers the read operations with the in-memory engines
+    (MatrixRecommender, CommunityTables, pandas) on a graph folder in the layout of data/
+    plus communities.csv. There is no query plan, so db hits are None; loader batches are skipped.
+    """
+    name = "local"
+
+    def __init__(self, data_dir, communities_file=None):
+        communities_file = communities_file or os.path.join(data_dir, "communities.csv")
+        self.matrix = MatrixRecommender.from_csv(data_dir, similarity_cutoff=0.0)
+        self.user_ids, isbns, self.titles, self.authors, self.ratings, self.labels = read_inputs(
+            GraphSnapshot.from_csv(data_dir, communities_file))
+        self.isbns = isbns
+        self.tables = CommunityTables.build(self.user_ids, isbns, self.titles, self.authors, self.ratings,
+                                            self.labels)
+        self.rows = pd.Index(self.user_ids)
+        self.users = self.matrix.users.set_index("id")
+        self.operations = {
+            "knn.recommend_books": lambda p: self.matrix.recommend_books(p["userId"]),
+            "knn.get_similar_users": lambda p: self.matrix.get_similar_users(p["userId"]),
+            "knn.get_graph_data": lambda p: self.matrix.get_graph_data(p["userId"]),
+            "knn.get_graph_view": lambda p: self.matrix.get_graph_view(p["userId"], p["maxUsers"], p["maxBooks"]),
+            "community.recommend_books": lambda p: self.tables.recommend(p["userId"]),
+            "community.get_similar_users": self.community_similar_users,
+            "community.get_graph_data": self.community_graph_data,
+            "app.get_user_rated_books": self.rated_books,
+            "app.get_large_communities": lambda p: self.large_communities(),
+            "app.count_users": lambda p: [{"total": len(self.matching_users(p["communities"], p["idRanges"]))}],
+            "app.get_users_page": self.users_page,
+        }
+
+    def supports(self, case):
+        return case.local in self.operations
+
+    def _members(self, user_id):
+        label = self.labels[self.rows.get_loc(user_id)]
+        return np.flatnonzero(self.labels == label) if label != -1 else np.empty(0, np.int64)
+
+    def community_similar_users(self, params):
+        others = [row for row in self._members(params["userId"]) if self.user_ids[row] != params["userId"]][:3]
+        return [{"userId": int(self.user_ids[row]), "location": self.users.at[self.user_ids[row], "location"],
+                 "age": self.users.at[self.user_ids[row], "age"]} for row in others]
+
+    def community_graph_data(self, params):
+        members = self._members(params["userId"])
+        ratings = self.ratings[members].tocoo()
+        return [{"u": int(self.user_ids[members[row]]), "b": self.isbns[col], "rating": int(rating)}
+                for row, col, rating in zip(ratings.row, ratings.col, ratings.data)]
+
+    def rated_books(self, params):
+        row = self.ratings[self.rows.get_loc(params["userId"])]
+        order = np.argsort(-row.data, kind="stable")
+        return [{"title": self.titles[row.indices[i]], "author": self.authors[row.indices[i]],
+                 "rating": int(row.data[i])} for i in order]
+
+    def large_communities(self):
+        labels, counts = np.unique(self.labels[self.labels != -1], return_counts=True)
+        return [{"communityId": int(label)} for label in labels[counts > 1]]
+
+    def matching_users(self, communities, id_ranges):
+        rows = np.flatnonzero(np.isin(self.labels, communities))
+        return [row for row in rows if any(low <= self.user_ids[row] < high for low, high in id_ranges)]
+
+    def users_page(self, params):
+        rows = sorted(self.matching_users(params["communities"], params["idRanges"]),
+                      key=lambda row: (self.labels[row], self.user_ids[row]))
+        return [{"userId": int(self.user_ids[row]), "communityId": int(self.labels[row])}
+                for row in rows[params["skip"]:params["skip"] + params["limit"]]]
+
+    def sample_users(self, percentiles=PERCENTILES):
+        stats = pd.DataFrame({"userId": self.user_ids, "degree": np.diff(self.ratings.indptr),
+                              "community": np.where(self.labels == -1, np.nan, self.labels)})
+        return pick_samples(stats, percentiles)
+
+    def context(self, batch_size=LOADER_BATCH_SIZE):
+        return {"communities": [c["communityId"] for c in self.large_communities()], "batches": {}}
+
+    def execute(self, case, params, profile=False):
+        start = time.perf_counter()
+        result = self.operations[case.local](params)
+        return time.perf_counter() - start, count_rows(result), None
+
+
+# --- SUITE ---
+def run_suite(backend, cases=None, percentiles=PERCENTILES, repeats=REPEATS, warmup=WARMUP,
+              batch_size=LOADER_BATCH_SIZE):
+    """
+    Runs every supported case for every sampled user.
+    :param backend (Neo4jBackend | LocalBackend): Where the queries run
+    :param cases (list[QueryCase]): Cases to run (default: query_cases())
+    :param percentiles (tuple[int]): Percentiles of user degree / community size to sample
+    :param repeats (int): Timed runs per case and sample
+    :param warmup (int): Untimed runs before (page cache, query plan cache)
+    :param batch_size (int): Rows per loader batch
+    :return: dict: JSON-serializable results
+    """
+    samples = backend.sample_users(percentiles)
+    context = backend.context(batch_size)
+    results = {"backend": backend.name, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "percentiles": list(percentiles), "repeats": repeats, "samples": samples, "queries": {}}
+    for case in cases or query_cases():
+        if not backend.supports(case):
+            continue
+        runs = {f"p{p}": sample for p, sample in samples[case.sample].items()} if case.sample else {"all": {}}
+        for key, sample in runs.items():
+            params = case.params(sample.get("userId"), context)
+            for _ in range(warmup):
+                backend.execute(case, params)
+            latencies = []
+            for _ in range(repeats):
+                seconds, rows, _ = backend.execute(case, params)
+                latencies.append(seconds * 1000)
+            _, _, db_hits = backend.execute(case, params, profile=True)
+            results["queries"].setdefault(case.name, {})[key] = {
+                **sample, "rows": rows, "db_hits": db_hits,
+                "latency_ms": {"min": round(min(latencies), 3), "p50": round(float(np.percentile(latencies, 50)), 3),
+                               "p95": round(float(np.percentile(latencies, 95)), 3),
+                               "max": round(max(latencies), 3), "mean": round(float(np.mean(latencies)), 3)},
+            }
+    return results
+
+
+def compare(results, baseline, latency_tolerance=LATENCY_TOLERANCE, db_hits_tolerance=DB_HITS_TOLERANCE,
+            min_latency_ms=MIN_LATENCY_MS):
+    """
+    Compares a run against a baseline run.
+    :param results (dict): Output of run_suite
+    :param baseline (dict): Earlier output of run_suite
+    :param latency_tolerance (float): Allowed relative growth of the median latency
+    :param db_hits_tolerance (float): Allowed relative growth of the db hits
+    :param min_latency_ms (float): Latency growth below this is ignored as noise
+    :return: list[str]: One message per regression
+    """
+    regressions = []
+    for name, runs in results["queries"].items():
+        for key, run in runs.items():
+            before = baseline.get("queries", {}).get(name, {}).get(key)
+            if before is None:
+                continue
+            now_ms, then_ms = run["latency_ms"]["p50"], before["latency_ms"]["p50"]
+            if now_ms > then_ms * (1 + latency_tolerance) and now_ms - then_ms >= min_latency_ms:
+                regressions.append(f"{name} [{key}]: p50 {then_ms:.2f} ms -> {now_ms:.2f} ms")
+            if run["db_hits"] is not None and before.get("db_hits") is not None \
+                    and run["db_hits"] > before["db_hits"] * (1 + db_hits_tolerance):
+                regressions.append(f"{name} [{key}]: db hits {before['db_hits']} -> {run['db_hits']}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'query':<30} {'sample':<6} {'p50 ms':>9} {'p95 ms':>9} {'rows':>8} {'db hits':>10}")
+    for name, runs in results["queries"].items():
+        for key, run in runs.items():
+            db_hits = "-" if run["db_hits"] is None else run["db_hits"]
+            print(f"{name:<30} {key:<6} {run['latency_ms']['p50']:>9.2f} {run['latency_ms']['p95']:>9.2f} "
+                  f"{run['rows']:>8} {db_hits:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["neo4j", "local"], default="neo4j")
+    parser.add_argument("--data-dir", help="Graph folder of the local backend (see benchmarks/synthetic_graph.py)")
+    parser.add_argument("--percentiles", type=int, nargs="+", default=list(PERCENTILES))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--batch-size", type=int, default=LOADER_BATCH_SIZE, help="Rows per loader batch")
+    parser.add_argument("--only", nargs="+", help="Run only queries whose name starts with one of these")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against an earlier results file")
+    parser.add_argument("--tolerance", type=float, default=LATENCY_TOLERANCE, help="Allowed latency growth")
+    args = parser.parse_args()
+
+    if args.backend == "local":
+        if not args.data_dir:
+            parser.error("--backend local needs --data-dir")
+        suite_backend = LocalBackend(args.data_dir)
+    else:
+        suite_backend = Neo4jBackend()
+    selected = [case for case in query_cases() if not args.only or case.name.startswith(tuple(args.only))]
+    try:
+        suite_results = run_suite(suite_backend, selected, tuple(args.percentiles), args.repeats,
+                                  batch_size=args.batch_size)
+    finally:
+        graph_db.close_driver()
+    print_results(suite_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(suite_results, f, indent=2, default=str)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = compare(suite_results, json.load(f), args.tolerance)
+        for message in found:
+            print(f"REGRESSION {message}")
+        if found:
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -0,0 +1,121 @@
+"""
+Synthetic Book-Crossing-like graph for offline benchmarks: users with a heavy-tailed number of
+ratings, planted communities that mostly rate "their" books, and ratings 1-10.
+
+Writes filtered_users.csv, filtered_books.csv, filtered_ratings.csv (the format of data/) and
+communities.csv (the format of algorithms/louvain_local.py), so every local engine can read it.
+With --load the graph is also loaded into Neo4j, including the community property and
+SIMILAR_TO relationships from the local FastRP + exact KNN pipeline.
+
+Usage: python -m benchmarks.synthetic_graph --users 20000 --books 8000 --output /tmp/synthetic [--load]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import graph_db
+from algorithms.fastrp_local import build_rating_graph, fastrp
+from algorithms.knn_exact import exact_knn, source_batches, write_similar_to
+from algorithms.louvain_local import write_communities
+from data.load_data import BOOKS_CSV, RATINGS_CSV, USERS_CSV, load_parallel
+from graph_schema import ensure_schema
+
+
+def synthetic_graph(users=5000, books=2000, communities=50, mean_degree=20, locality=0.8, seed=42):
+    """
+    :param users (int): Number of users
+    :param books (int): Number of books
+    :param communities (int): Number of planted communities
+    :param mean_degree (float): Average number of ratings per user (lognormal, heavy-tailed)
+    :param locality (float): Share of a user's ratings that go to books of their community
+    :param seed (int): Random seed
+    :return: tuple: users, books, ratings (pd.DataFrame in the CSV layout) and the community per user
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = np.arange(1, users + 1)
+    # community sizes are skewed too: a few large communities, many small ones
+    sizes = 1.0 / np.arange(1, communities + 1) ** 0.8
+    labels = rng.choice(communities, users, p=sizes / sizes.sum())
+    book_community = rng.integers(0, communities, books)
+    books_of = [np.flatnonzero(book_community == c) for c in range(communities)]
+    popularity = rng.zipf(1.5, books).astype(np.float64)
+    popularity /= popularity.sum()
+
+    degrees = np.clip(rng.lognormal(np.log(mean_degree) - 0.5, 1.0, users).astype(int), 1, books)
+    rows, cols = [], []
+    for row, degree in enumerate(degrees):
+        local = books_of[labels[row]]
+        n_local = min(len(local), int(degree * locality))
+        picked = rng.choice(local, n_local, replace=False) if n_local else np.empty(0, np.int64)
+        picked = np.concatenate([picked, rng.choice(books, degree - n_local, p=popularity)])
+        picked = np.unique(picked)
+        rows.append(np.full(len(picked), row))
+        cols.append(picked)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+    isbns = np.array([f"{978000000000 + i:013d}" for i in range(books)])
+    users_df = pd.DataFrame({"User-ID": user_ids,
+                             "Location": [f"city {i % 500}, country {i % 20}" for i in range(users)],
+                             "Age": rng.integers(16, 80, users)})
+    books_df = pd.DataFrame({"ISBN": isbns, "Book-Title": [f"Book {i}" for i in range(books)],
+                             "Book-Author": [f"Author {i % 700}" for i in range(books)],
+                             "Year-Of-Publication": rng.integers(1950, 2005, books),
+                             "Publisher": [f"Publisher {i % 90}" for i in range(books)]})
+    ratings_df = pd.DataFrame({"User-ID": user_ids[rows], "ISBN": isbns[cols],
+                               "Book-Rating": rng.integers(1, 11, len(rows))})
+    return users_df, books_df, ratings_df, labels
+
+
+def write_csv(users_df, books_df, ratings_df, labels, output_dir):
+    """
+    Writes the graph in the layout of data/ plus communities.csv.
+    :param output_dir (str): Target folder
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    users_df.to_csv(os.path.join(output_dir, USERS_CSV), index=False, encoding="latin-1")
+    books_df.to_csv(os.path.join(output_dir, BOOKS_CSV), index=False, encoding="latin-1")
+    ratings_df.to_csv(os.path.join(output_dir, RATINGS_CSV), index=False, encoding="latin-1")
+    pd.DataFrame({"userId": users_df["User-ID"], "community": labels}).to_csv(
+        os.path.join(output_dir, "communities.csv"), index=False)
+
+
+def load_into_neo4j(output_dir, workers=4):
+    """
+    Loads the written graph into Neo4j: nodes and ratings, the planted communities and
+    SIMILAR_TO relationships (local FastRP embeddings + exact KNN).
+    :param output_dir (str): Folder written by write_csv
+    :param workers (int): Concurrent sessions of the loader
+    """
+    ensure_schema()
+    load_parallel(graph_db.get_driver(), os.path.join(output_dir, USERS_CSV), os.path.join(output_dir, BOOKS_CSV),
+                  os.path.join(output_dir, RATINGS_CSV), workers)
+    communities = pd.read_csv(os.path.join(output_dir, "communities.csv")).astype(int).to_dict("records")
+    for start in range(0, len(communities), 10000):
+        graph_db.write(write_communities, communities[start:start + 10000])
+
+    user_ids, _, ratings = build_rating_graph(output_dir)
+    embeddings = fastrp(ratings)[:len(user_ids)]
+    edges = exact_knn(user_ids, embeddings, workers=1)
+    for sources, batch in source_batches(user_ids, edges):
+        graph_db.write(write_similar_to, batch, sources)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--communities", type=int, default=50)
+    parser.add_argument("--mean-degree", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--load", action="store_true", help="Also load the graph into Neo4j")
+    args = parser.parse_args()
+
+    frames = synthetic_graph(args.users, args.books, args.communities, args.mean_degree, seed=args.seed)
+    write_csv(*frames, args.output)
+    print(f"{len(frames[0])} users, {len(frames[1])} books, {len(frames[2])} ratings written to {args.output}")
+    if args.load:
+        load_into_neo4j(args.output)
+        print("Graph loaded into Neo4j.")
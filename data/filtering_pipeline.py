@@ -0,0 +1,104 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Raw input files
+RATINGS_FILE = "Ratings.csv"
+USERS_FILE = "Users.csv"
+BOOKS_FILE = "Books.csv"
+
+# Filtered output files (same names as the single-step scripts)
+FILTERED_RATINGS_FILE = "filtered_ratings.csv"
+FILTERED_USERS_FILE = "filtered_users.csv"
+FILTERED_BOOKS_FILE = "filtered_books.csv"
+
+
+def read_raw(path):
+    """
+    Reads a raw CSV file once, keeping every value as the original text.
+    :param path (str): CSV file
+    :return: pd.DataFrame: File content with object columns
+    """
+    return pd.read_csv(path, sep=",", encoding="utf-8", dtype=object, keep_default_na=False)
+
+
+def filter_ratings(ratings, min_rating=1, min_user_ratings=1, min_book_ratings=1):
+    """
+    Keeps ratings with a score of at least `min_rating`, then repeatedly drops users and books
+    with fewer remaining ratings than the thresholds until both conditions hold.
+    :param ratings (pd.DataFrame): Raw ratings
+    :param min_rating (int): Smallest rating that is kept (1 drops the implicit 0 ratings)
+    :param min_user_ratings (int): Minimum number of ratings per user
+    :param min_book_ratings (int): Minimum number of ratings per book
+    :return: pd.DataFrame: Filtered ratings
+    """
+    scores = pd.to_numeric(ratings["Book-Rating"], errors="coerce")
+    ratings = ratings[scores >= min_rating]
+
+    while True:
+        user_counts = ratings["User-ID"].map(ratings["User-ID"].value_counts())
+        book_counts = ratings["ISBN"].map(ratings["ISBN"].value_counts())
+        keep = (user_counts >= min_user_ratings) & (book_counts >= min_book_ratings)
+        if keep.all():
+            return ratings
+        ratings = ratings[keep]
+
+
+def write_outputs(frames, parquet=False, workers=6):
+    """
+    Writes all filtered tables at the same time, as CSV and optionally as Parquet.
+    :param frames (dict[str, pd.DataFrame]): Tables keyed by CSV file name
+    :param parquet (bool): Also write a .parquet file next to every CSV file
+    :param workers (int): Number of writer threads
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for path, df in frames.items():
+            futures.append(pool.submit(df.to_csv, path, index=False, encoding="utf-8"))
+            if parquet:
+                futures.append(pool.submit(df.to_parquet, path.replace(".csv", ".parquet"), index=False))
+        for future in futures:
+            future.result()
+
+
+def run_pipeline(min_rating=1, min_user_ratings=1, min_book_ratings=1, parquet=False):
+    """
+    Reads Ratings.csv, Users.csv and Books.csv once (in parallel), filters the ratings,
+    derives the valid user IDs and ISBNs from them and writes all three filtered files.
+    :param min_rating (int): Smallest rating that is kept
+    :param min_user_ratings (int): Minimum number of ratings per user
+    :param min_book_ratings (int): Minimum number of ratings per book
+    :param parquet (bool): Also write Parquet copies of the outputs
+    :return: dict[str, int]: Number of rows written per output file
+    """
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        ratings, users, books = pool.map(read_raw, [RATINGS_FILE, USERS_FILE, BOOKS_FILE])
+
+    ratings = filter_ratings(ratings, min_rating, min_user_ratings, min_book_ratings)
+    users = users[users["User-ID"].isin(ratings["User-ID"].unique())]
+    books = books[books["ISBN"].isin(ratings["ISBN"].unique())]
+
+    frames = {
+        FILTERED_RATINGS_FILE: ratings,
+        FILTERED_USERS_FILE: users,
+        FILTERED_BOOKS_FILE: books,
+    }
+    write_outputs(frames, parquet)
+    return {path: len(df) for path, df in frames.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter the raw ratings, users and books in one pass.")
+    parser.add_argument("--min-rating", type=int, default=1, help="Smallest rating that is kept")
+    parser.add_argument("--min-user-ratings", type=int, default=1, help="Minimum ratings per user")
+    parser.add_argument("--min-book-ratings", type=int, default=1, help="Minimum ratings per book")
+    parser.add_argument("--parquet", action="store_true", help="Also write Parquet files")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    counts = run_pipeline(args.min_rating, args.min_user_ratings, args.min_book_ratings, args.parquet)
+    for path, rows in counts.items():
+        print(f"{path}: {rows} rows")
+    print(f"Filtering finished in {time.time() - start_time:.2f} seconds")
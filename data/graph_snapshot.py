@@ -0,0 +1,366 @@
+"""
+Compact, memory-mappable snapshot of the rating graph for local computations.
+
+Users are stored sorted by User.id and books sorted by ISBN, so the position in these arrays is
+the dense int32 index of a node, and an ID is remapped with one binary search on the mapped
+array (no dictionary has to be built at start-up). RATED is stored twice, by user (CSR:
+user_offsets, user_books, user_ratings) and by book (CSC: book_offsets, book_users,
+book_ratings), with uint8 ratings. Node metadata is columnar: numeric columns as arrays,
+text columns as one UTF-8 buffer plus offsets.
+
+Every array is a `<prefix>_<name>.npy` file opened with mmap_mode='r': opening takes
+milliseconds, pages are read on first use, and processes that open the same snapshot share
+the page cache instead of holding private copies. `<prefix>_meta.json` is written last and
+marks a complete snapshot.
+
+Usage: python -m data.graph_snapshot [--from-graph] [--output data/snapshot/graph]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import graph_db
+from data.load_data import BOOKS_CSV, DATA_DIR, RATINGS_CSV, USERS_CSV
+
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot", "graph")
+FORMAT_VERSION = 1
+
+# Array files of a snapshot (numeric columns and the two adjacency layouts)
+ARRAYS = ("user_ids", "user_ages", "user_communities", "isbns", "book_years",
+          "user_offsets", "user_books", "user_ratings", "book_offsets", "book_users", "book_ratings")
+# Text columns, each stored as <name>_offsets.npy + <name>_data.npy
+STRINGS = ("user_locations", "book_titles", "book_authors", "book_publishers")
+
+
+class StringColumn:
+    """
+    Variable-length strings in one UTF-8 byte buffer; string i is data[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def build(cls, values):
+        """
+        :param values (Iterable[str]): Strings (None/NaN become '')
+        :return: StringColumn
+        """
+        encoded = [("" if value is None or value != value else str(value)).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def take(self, indices):
+        """
+        :param indices (Iterable[int]): Positions
+        :return: list[str]: Strings at the positions
+        """
+        return [self[i] for i in indices]
+
+
+def sorted_positions(keys, values):
+    """
+    Positions of `values` in the sorted array `keys` (-1 where missing).
+    """
+    values = np.asarray(values, dtype=keys.dtype)
+    if len(keys) == 0:
+        return np.full(len(values), -1, dtype=np.int32)
+    positions = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+    return np.where(keys[positions] == values, positions, -1).astype(np.int32)
+
+
+def _adjacency(major, minor, ratings, size, minor_size):
+    """
+    Groups unique edges by `major`: offsets (int32 while they fit, else int64), sorted minor indices, ratings.
+    """
+    order = np.argsort(major.astype(np.int64) * minor_size + minor)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=size), out=offsets[1:])
+    if offsets[-1] < np.iinfo(np.int32).max:
+        offsets = offsets.astype(np.int32)
+    return offsets, minor[order].astype(np.int32), ratings[order]
+
+
+class GraphSnapshot:
+    """
+    Users, books and RATED edges in dense arrays (see the module docstring for the layout).
+    """
+
+    def __init__(self, arrays, strings, meta=None):
+        """
+        :param arrays (dict[str, np.ndarray]): All entries of ARRAYS
+        :param strings (dict[str, StringColumn]): All entries of STRINGS
+        :param meta (dict): Contents of the meta file
+        """
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        for name in STRINGS:
+            setattr(self, name, strings[name])
+        self.meta = meta or {}
+
+    # --- Construction ---
+    @classmethod
+    def build(cls, users, books, ratings):
+        """
+        :param users (pd.DataFrame): id, location, age and optionally community
+        :param books (pd.DataFrame): isbn, title, author, publisher, year
+        :param ratings (pd.DataFrame): userId, isbn, rating (edges to unknown nodes are dropped,
+                                       of duplicate edges the last one wins)
+        :return: GraphSnapshot
+        """
+        users = users.assign(id=pd.to_numeric(users["id"], errors="coerce")).dropna(subset=["id"])
+        users = users.drop_duplicates("id", keep="last").sort_values("id", kind="stable")
+        books = books.assign(isbn=books["isbn"].astype(str)).drop_duplicates("isbn", keep="last")
+        # code point order of the str ISBNs is the byte order of their UTF-8 encoding that book_index searches
+        books = books.sort_values("isbn", kind="stable")
+        isbns = np.array([isbn.encode("utf-8") for isbn in books["isbn"]], dtype=np.bytes_)
+        user_ids = users["id"].to_numpy(np.int64)
+
+        rows = pd.Index(user_ids).get_indexer(pd.to_numeric(ratings["userId"], errors="coerce"))
+        cols = pd.Index(books["isbn"]).get_indexer(ratings["isbn"].astype(str))
+        values = pd.to_numeric(ratings["rating"], errors="coerce").fillna(0).clip(0, 255).to_numpy(np.uint8)
+        edges = pd.DataFrame({"row": rows, "col": cols, "rating": values})
+        edges = edges[(edges["row"] >= 0) & (edges["col"] >= 0)].drop_duplicates(["row", "col"], keep="last")
+        rows, cols, values = (edges[name].to_numpy() for name in ("row", "col", "rating"))
+
+        user_offsets, user_books, user_ratings = _adjacency(rows, cols, values, len(user_ids), len(isbns))
+        book_offsets, book_users, book_ratings = _adjacency(cols, rows, values, len(isbns), len(user_ids))
+        community = users["community"] if "community" in users else pd.Series(-1, index=users.index)
+        arrays = {
+            "user_ids": user_ids,
+            "user_ages": pd.to_numeric(users["age"], errors="coerce").fillna(0).clip(0, 255).to_numpy(np.uint8),
+            "user_communities": pd.to_numeric(community, errors="coerce").fillna(-1).to_numpy(np.int32),
+            "isbns": isbns,
+            "book_years": pd.to_numeric(books["year"], errors="coerce").fillna(0).clip(0, 32767)
+                            .to_numpy(np.int16),
+            "user_offsets": user_offsets, "user_books": user_books, "user_ratings": user_ratings,
+            "book_offsets": book_offsets, "book_users": book_users, "book_ratings": book_ratings,
+        }
+        strings = {"user_locations": StringColumn.build(users["location"]),
+                   "book_titles": StringColumn.build(books["title"]),
+                   "book_authors": StringColumn.build(books["author"]),
+                   "book_publishers": StringColumn.build(books["publisher"])}
+        return cls(arrays, strings)
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR, communities_file=None):
+        """
+        Builds the snapshot from the filtered CSV files (and optionally communities.csv).
+        :param data_dir (str): Folder with the filtered CSV files
+        :param communities_file (str): userId,community file (e.g. from louvain_local.py)
+        :return: GraphSnapshot
+        """
+        def read(name, columns):
+            # ISBNs stay text, IDs and ratings are parsed as numbers; only empty fields count as missing
+            return pd.read_csv(os.path.join(data_dir, name), encoding="latin-1", dtype={"ISBN": object},
+                               usecols=list(columns), keep_default_na=False, na_values=[""]).rename(columns=columns)
+
+        users = read(USERS_CSV, {"User-ID": "id", "Location": "location", "Age": "age"})
+        if communities_file:
+            communities = pd.read_csv(communities_file).drop_duplicates("userId", keep="last")
+            users = users.assign(community=pd.to_numeric(users["id"], errors="coerce").map(
+                communities.set_index("userId")["community"]))
+        books = read(BOOKS_CSV, {"ISBN": "isbn", "Book-Title": "title", "Book-Author": "author",
+                                 "Publisher": "publisher", "Year-Of-Publication": "year"})
+        ratings = read(RATINGS_CSV, {"User-ID": "userId", "ISBN": "isbn", "Book-Rating": "rating"})
+        return cls.build(users, books, ratings)
+
+    @classmethod
+    def from_graph(cls, driver=None):
+        """
+        Builds the snapshot from a one-off export of the graph (records are streamed into columns).
+        :param driver: Neo4j driver (defaults to the shared driver of graph_db)
+        :return: GraphSnapshot
+        """
+        def export(session, query, names):
+            columns = {name: [] for name in names}
+            for record in session.run(query):
+                for name in names:
+                    columns[name].append(record[name])
+            return pd.DataFrame(columns, dtype=object)
+
+        with graph_db.session(driver) as session:
+            users = export(session, """
+                MATCH (u:User)
+                RETURN u.id AS id, u.location AS location, u.age AS age, u.community AS community
+                """, ("id", "location", "age", "community"))
+            books = export(session, """
+                MATCH (b:Book)
+                RETURN b.isbn AS isbn, b.title AS title, b.author AS author, b.publisher AS publisher, b.year AS year
+                """, ("isbn", "title", "author", "publisher", "year"))
+            ratings = export(session, """
+                MATCH (u:User)-[r:RATED]->(b:Book)
+                RETURN u.id AS userId, b.isbn AS isbn, r.rating AS rating
+                """, ("userId", "isbn", "rating"))
+        return cls.build(users, books, ratings)
+
+    # --- Persistence ---
+    def save(self, prefix=SNAPSHOT_PATH):
+        """
+        Writes all arrays as .npy files; the meta file is written last and marks the snapshot complete.
+        :param prefix (str): Output path without extension
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        if os.path.exists(f"{prefix}_meta.json"):
+            os.remove(f"{prefix}_meta.json")
+        for name in ARRAYS:
+            np.save(f"{prefix}_{name}.npy", getattr(self, name))
+        for name in STRINGS:
+            np.save(f"{prefix}_{name}_offsets.npy", getattr(self, name).offsets)
+            np.save(f"{prefix}_{name}_data.npy", getattr(self, name).data)
+        self.meta = {"version": FORMAT_VERSION, "users": self.n_users, "books": self.n_books,
+                     "ratings": self.n_ratings, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(f"{prefix}_meta.json", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def open(cls, prefix=SNAPSHOT_PATH, mmap=True):
+        """
+        Opens a saved snapshot; with mmap nothing is read until it is used.
+        :param prefix (str): Path without extension
+        :param mmap (bool): Memory-map the arrays instead of reading them
+        :return: GraphSnapshot
+        """
+        if not os.path.exists(f"{prefix}_meta.json"):
+            raise FileNotFoundError(f"No complete snapshot at {prefix} (missing {prefix}_meta.json)")
+        with open(f"{prefix}_meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Snapshot {prefix} has format {meta.get('version')}, expected {FORMAT_VERSION}")
+        mode = "r" if mmap else None
+        arrays = {name: np.load(f"{prefix}_{name}.npy", mmap_mode=mode) for name in ARRAYS}
+        strings = {name: StringColumn(np.load(f"{prefix}_{name}_offsets.npy", mmap_mode=mode),
+                                      np.load(f"{prefix}_{name}_data.npy", mmap_mode=mode)) for name in STRINGS}
+        return cls(arrays, strings, meta)
+
+    # --- Lookups ---
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_books(self):
+        return len(self.isbns)
+
+    @property
+    def n_ratings(self):
+        return len(self.user_books)
+
+    def user_index(self, user_ids):
+        """
+        :param user_ids (array-like): User IDs
+        :return: np.ndarray: Dense int32 index per ID (-1 for unknown users)
+        """
+        return sorted_positions(self.user_ids, np.atleast_1d(np.asarray(user_ids, dtype=np.int64)))
+
+    def book_index(self, isbns):
+        """
+        :param isbns (array-like): ISBNs
+        :return: np.ndarray: Dense int32 index per ISBN (-1 for unknown books)
+        """
+        isbns = [isbns] if isinstance(isbns, str) else isbns
+        return sorted_positions(self.isbns, np.array([str(isbn).encode("utf-8") for isbn in isbns], dtype=np.bytes_))
+
+    def isbn_strings(self):
+        """
+        :return: np.ndarray: ISBNs as str, in index order
+        """
+        return np.char.decode(np.asarray(self.isbns), "utf-8")
+
+    def books_of(self, user):
+        """
+        :param user (int): Dense user index
+        :return: tuple[np.ndarray]: Book indices (sorted) and ratings of the user
+        """
+        start, end = self.user_offsets[user], self.user_offsets[user + 1]
+        return self.user_books[start:end], self.user_ratings[start:end]
+
+    def users_of(self, book):
+        """
+        :param book (int): Dense book index
+        :return: tuple[np.ndarray]: User indices (sorted) and ratings of the book
+        """
+        start, end = self.book_offsets[book], self.book_offsets[book + 1]
+        return self.book_users[start:end], self.book_ratings[start:end]
+
+    def user_degrees(self):
+        return np.diff(self.user_offsets)
+
+    def book_degrees(self):
+        return np.diff(self.book_offsets)
+
+    def user(self, index):
+        """
+        :param index (int): Dense user index
+        :return: dict: id, location, age (None if unknown) and community (None if unknown)
+        """
+        age, community = int(self.user_ages[index]), int(self.user_communities[index])
+        return {"id": int(self.user_ids[index]), "location": self.user_locations[index],
+                "age": age or None, "community": community if community >= 0 else None}
+
+    def book(self, index):
+        """
+        :param index (int): Dense book index
+        :return: dict: isbn, title, author, publisher and year (None if unknown)
+        """
+        return {"isbn": self.isbns[index].decode("utf-8"), "title": self.book_titles[index],
+                "author": self.book_authors[index], "publisher": self.book_publishers[index],
+                "year": int(self.book_years[index]) or None}
+
+    def ratings_matrix(self):
+        """
+        Users x books CSR matrix on top of the snapshot arrays (no copy; uint8 ratings).
+        :return: sparse.csr_matrix
+        """
+        matrix = sparse.csr_matrix((self.user_ratings, self.user_books, self.user_offsets),
+                                   shape=(self.n_users, self.n_books), copy=False)
+        matrix.has_sorted_indices = True
+        return matrix
+
+    def rated_by_matrix(self):
+        """
+        Books x users CSR matrix (the CSC layout) on top of the snapshot arrays.
+        :return: sparse.csr_matrix
+        """
+        matrix = sparse.csr_matrix((self.book_ratings, self.book_users, self.book_offsets),
+                                   shape=(self.n_books, self.n_users), copy=False)
+        matrix.has_sorted_indices = True
+        return matrix
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--communities", help="userId,community CSV (e.g. data/communities.csv)")
+    parser.add_argument("--from-graph", action="store_true", help="Export from Neo4j instead of the CSV files")
+    parser.add_argument("--output", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.from_graph:
+        try:
+            snapshot = GraphSnapshot.from_graph()
+        finally:
+            graph_db.close_driver()
+    else:
+        snapshot = GraphSnapshot.from_csv(args.data_dir, args.communities)
+    snapshot.save(args.output)
+    print(f"{snapshot.n_users} users, {snapshot.n_books} books, {snapshot.n_ratings} ratings written to "
+          f"{args.output} in {time.time() - start_time:.2f} seconds")
+    start_time = time.perf_counter()
+    GraphSnapshot.open(args.output)
+    print(f"Opened in {(time.perf_counter() - start_time) * 1000:.1f} ms")
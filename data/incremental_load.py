@@ -0,0 +1,151 @@
+import argparse
+
+import graph_db
+from data.load_data import chunk_source, load_books, load_users
+from graph_db import close_driver, get_driver, read
+from graph_schema import ensure_schema
+from instrumentation import register_queries
+from recommender.cache import invalidate
+
+
+# Refresh jobs that consume the dirty users; the flag is removed once all of them handled a user
+REFRESH_JOBS = ("knn", "community_tables")
+CLEAR_BATCH = 10000
+
+# Served by the User.dirty index of graph_schema: only pending users carry the property
+DIRTY_USERS_QUERY = """
+    MATCH (u:User) WHERE u.dirty = true AND ($job IS NULL OR NOT $job IN coalesce(u.refreshed, []))
+    RETURN u.id AS userId, timestamp() AS readAt
+    ORDER BY userId
+    """
+# Users changed again since the refresh read them (changedAt >= readAt) stay pending for every job
+CLEAR_DIRTY_USERS_QUERY = """
+    UNWIND $userIds AS userId
+    MATCH (u:User {id: userId})
+    WHERE u.dirty = true AND coalesce(u.changedAt, 0) < $readAt
+    WITH u, CASE WHEN $job IS NULL THEN $jobs ELSE coalesce(u.refreshed, []) + [$job] END AS refreshed
+    WITH u, refreshed, all(job IN $jobs WHERE job IN refreshed) AS done
+    SET u.dirty = CASE WHEN done THEN null ELSE true END,
+        u.refreshed = CASE WHEN done THEN null ELSE refreshed END,
+        u.changedAt = CASE WHEN done THEN null ELSE u.changedAt END
+    """
+USER_RATINGS_QUERY = """
+    UNWIND $userIds AS userId
+    MATCH (u:User {id: userId})-[r:RATED]->(b:Book)
+    RETURN u.id AS userId, b.isbn AS isbn, r.rating AS rating
+    """
+
+register_queries("incremental", globals())
+
+
+# --- DELTA LOADER FUNCTIONS ---
+def upsert_ratings(tx, batch):
+    """
+    Creates or updates RATED relationships for a batch of new or changed ratings.
+    Unknown users and books are created on the fly. Only users whose rating actually
+    changed are flagged with `dirty = true` for the refresh jobs of REFRESH_JOBS (a user changed
+    again is pending for all of them again).
+    :param tx: Neo4j transaction
+    :param batch (list[dict]): Batch of rating data (User-ID, ISBN, Book-Rating)
+    :return: list[int]: IDs of the users that were marked dirty
+    """
+    query = """
+            UNWIND $rows AS row
+            MERGE (u:User {id: toInteger(row.`User-ID`)})
+            MERGE (b:Book {isbn: row.ISBN})
+            MERGE (u)-[r:RATED]->(b)
+            WITH u, r, r.rating AS previous, toInteger(row.`Book-Rating`) AS rating
+            WHERE previous IS NULL OR previous <> rating
+            SET r.rating = rating, u.dirty = true, u.refreshed = [], u.changedAt = timestamp()
+            RETURN DISTINCT u.id AS userId
+            """
+    return [record["userId"] for record in tx.run(query, rows=batch)]
+
+
+def get_dirty_users(tx, job=None):
+    """
+    Returns the users whose ratings changed since the last refresh of a job.
+    :param tx: Neo4j transaction
+    :param job (str): Refresh job of REFRESH_JOBS (None: all dirty users)
+    :return: tuple[list[int], int]: IDs of dirty users and the server time they were read at
+             (pass it to clear_dirty_users; None if no user is dirty)
+    """
+    records = tx.run(DIRTY_USERS_QUERY, job=job).data()
+    return [record["userId"] for record in records], records[0]["readAt"] if records else None
+
+
+def clear_dirty_users(tx, user_ids, job=None, read_at=None):
+    """
+    Marks users as handled by a refresh job once it has finished; the dirty flag is removed
+    when every job of REFRESH_JOBS handled the user. Users changed after `read_at` stay dirty.
+    :param tx: Neo4j transaction
+    :param user_ids (list[int]): IDs of the refreshed users
+    :param job (str): Refresh job of REFRESH_JOBS (None: clear the flag for all jobs)
+    :param read_at (int): Server time returned by get_dirty_users
+    """
+    tx.run(CLEAR_DIRTY_USERS_QUERY, userIds=user_ids, job=job, jobs=list(REFRESH_JOBS),
+           readAt=read_at if read_at is not None else 2 ** 62)
+
+
+def finish_refresh(job, user_ids, read_at, batch_size=CLEAR_BATCH):
+    """
+    Clears the dirty users of a refresh job after it succeeded, in batches.
+    :param job (str): Refresh job of REFRESH_JOBS
+    :param user_ids (list[int]): Users the job refreshed (from get_dirty_users)
+    :param read_at (int): Server time returned by get_dirty_users
+    :param batch_size (int): Users per write transaction
+    """
+    for start in range(0, len(user_ids), batch_size):
+        graph_db.write(clear_dirty_users, user_ids[start:start + batch_size], job, read_at)
+
+
+def get_user_ratings(tx, user_ids):
+    """
+    :param tx: Neo4j transaction
+    :param user_ids (list[int]): IDs of the users
+    :return: list[dict]: All current ratings of these users (userId, isbn, rating)
+    """
+    return tx.run(USER_RATINGS_QUERY, userIds=user_ids).data()
+
+
+# --- DELTA INGESTION ---
+def ingest_delta(driver, ratings, users=None, books=None, size=1000):
+    """
+    Applies a batch of new or changed ratings without reloading the whole dataset.
+    Optional user and book rows are upserted first so new nodes get their metadata.
+    :param driver: Neo4j driver
+    :param ratings (pd.DataFrame | str): New or changed ratings, or the path of a CSV file
+    :param users (pd.DataFrame | str): Optional new or changed users
+    :param books (pd.DataFrame | str): Optional new or changed books
+    :param size (int): Batch size
+    :return: set[int]: IDs of the users that were marked dirty
+    """
+    dirty = set()
+    with graph_db.session(driver) as session:
+        if users is not None:
+            for user_batch in chunk_source(users, size):
+                session.execute_write(load_users, user_batch)
+        if books is not None:
+            for book_batch in chunk_source(books, size):
+                session.execute_write(load_books, book_batch)
+        for rating_batch in chunk_source(ratings, size):
+            dirty.update(session.execute_write(upsert_ratings, rating_batch))
+    return dirty
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply new or changed ratings to the graph.")
+    parser.add_argument("ratings", help="CSV file with User-ID, ISBN and Book-Rating columns")
+    parser.add_argument("--users", help="Optional CSV file with new or changed users")
+    parser.add_argument("--books", help="Optional CSV file with new or changed books")
+    args = parser.parse_args()
+
+    try:
+        ensure_schema()
+        dirty_users = ingest_delta(get_driver(), args.ratings, args.users, args.books)
+        print(f"Delta applied, {len(dirty_users)} users marked dirty.")
+        invalidate()
+        for job in REFRESH_JOBS:
+            print(f"Users waiting for the {job} refresh: {len(read(get_dirty_users, job)[0])}")
+    finally:
+        close_driver()
@@ -1,31 +1,114 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
 import pandas as pd
-from neo4j import GraphDatabase
+
+import graph_db
+from graph_db import close_driver, get_driver
+from graph_schema import ensure_schema
+from recommender.cache import invalidate
+
 
 # --- Load filtered datasets ---
-users_df = pd.read_csv("filtered_users.csv", sep=",", encoding="latin-1").fillna("")
-books_df = pd.read_csv("filtered_books.csv", sep=",", encoding="latin-1", low_memory=False).fillna("")
-ratings_df = pd.read_csv("filtered_ratings.csv", sep=",", encoding="latin-1").fillna("")
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+USERS_CSV = "filtered_users.csv"
+BOOKS_CSV = "filtered_books.csv"
+RATINGS_CSV = "filtered_ratings.csv"
+
+# Every column is kept as text: the Cypher loaders convert the types themselves,
+# and explicit dtypes spare pandas the type inference over the whole file.
+CSV_DTYPES = {
+    USERS_CSV: {"User-ID": object, "Location": object, "Age": object},
+    BOOKS_CSV: {"ISBN": object, "Book-Title": object, "Book-Author": object, "Year-Of-Publication": object,
+                "Publisher": object, "Image-URL-S": object, "Image-URL-M": object, "Image-URL-L": object},
+    RATINGS_CSV: {"User-ID": object, "ISBN": object, "Book-Rating": object},
+}
+STREAM_CHUNK_ROWS = 5000
 
 
-# --- Neo4j connection settings ---
-URI = "bolt://localhost:7687"
-USERNAME = "neo4j"
-PASSWORD = "SuperPasswort"
+def read_filtered_data():
+    """
+    Reads the filtered CSV files produced by the preprocessing scripts.
+    :return: tuple[pd.DataFrame]: users, books and ratings
+    """
+    users_df = pd.read_csv(os.path.join(DATA_DIR, USERS_CSV), sep=",", encoding="latin-1").fillna("")
+    books_df = pd.read_csv(os.path.join(DATA_DIR, BOOKS_CSV), sep=",", encoding="latin-1",
+                           low_memory=False).fillna("")
+    ratings_df = pd.read_csv(os.path.join(DATA_DIR, RATINGS_CSV), sep=",", encoding="latin-1").fillna("")
+    return users_df, books_df, ratings_df
+
+
+def to_records(df):
+    """
+    Converts a slice of text columns to a list of dicts without pandas' per-cell type boxing.
+    :param df (pd.DataFrame): Slice to convert
+    :return: list[dict]: Records keyed by column name
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in df.itertuples(index=False, name=None)]
+
+
+def stream_csv_batches(path, size=100, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Reads a filtered CSV file in chunks and yields record batches without loading the whole file.
+    Empty cells stay empty strings (no fillna pass), and records are only built for the batch
+    that is handed out, so memory depends on the chunk and batch size, not on the file size.
+    :param path (str): One of the filtered CSV files
+    :param size (int | BatchSizeTuner): Batch size, or a tuner that is asked before every batch
+    :param chunk_rows (int): Number of rows parsed per read
+    :Yields: list[dict]: Batch of records as list of dicts
+    """
+    reader = pd.read_csv(path, sep=",", encoding="latin-1", dtype=CSV_DTYPES.get(os.path.basename(path)),
+                         keep_default_na=False, chunksize=chunk_rows)
+    rest = None
+    for chunk in reader:
+        if rest is not None and len(rest):
+            chunk = pd.concat([rest, chunk], ignore_index=True)
+        start = 0
+        while len(chunk) - start >= getattr(size, "size", size):
+            step = getattr(size, "size", size)
+            yield to_records(chunk.iloc[start:start + step])
+            start += step
+        rest = chunk.iloc[start:]
+    if rest is not None and len(rest):
+        yield to_records(rest)
 
 
 # --- BATCH LOADER FUNCTIONS ---
+# The lookups use the User.id / Book.isbn constraints of graph_schema (ensure_schema() runs before loading)
+LOAD_USERS_QUERY = """
+            UNWIND $rows AS row
+            MERGE (u:User {id: toInteger(row.`User-ID`)})
+            SET u.location = row.Location, u.age = CASE row.Age WHEN '' THEN NULL ELSE toInteger(row.Age) END
+            """
+
+LOAD_BOOKS_QUERY = """
+            UNWIND $rows AS row
+            MERGE (b:Book {isbn: row.ISBN})
+            SET b.title = row.`Book-Title`,
+                b.author = row.`Book-Author`,
+                b.year = toInteger(row.`Year-Of-Publication`),
+                b.publisher = row.Publisher
+            """
+
+LOAD_RATINGS_QUERY = """
+            UNWIND $rows AS row
+            MATCH (u:User {id: toInteger(row.`User-ID`)})
+            MATCH (b:Book {isbn: row.ISBN})
+            MERGE (u)-[r:RATED]->(b)
+            SET r.rating = toInteger(row.`Book-Rating`)
+            """
+
 def load_users(tx, batch):
     """
     Inserts or updates users in the Neo4j graph in batch mode.
     :param tx: Neo4j transaction
     :param batch (list[dict]): Batch of user data
     """
-    query = """
-            UNWIND $rows AS row
-            MERGE (u:User {id: toInteger(row.`User-ID`)})
-            SET u.location = row.Location, u.age = CASE row.Age WHEN '' THEN NULL ELSE toInteger(row.Age) END
-            """
-    tx.run(query, rows=batch)
+    tx.run(LOAD_USERS_QUERY, rows=batch)
 
 
 def load_books(tx, batch):
@@ -34,15 +117,7 @@ def load_books(tx, batch):
     :param tx: Neo4j transaction
     :param batch (list[dict]): Batch of book data
     """
-    query = """
-            UNWIND $rows AS row
-            MERGE (b:Book {isbn: row.ISBN})
-            SET b.title = row.`Book-Title`,
-                b.author = row.`Book-Author`,
-                b.year = toInteger(row.`Year-Of-Publication`),
-                b.publisher = row.Publisher
-            """
-    tx.run(query, rows=batch)
+    tx.run(LOAD_BOOKS_QUERY, rows=batch)
 
 
 def load_ratings(tx, batch):
@@ -51,14 +126,7 @@ def load_ratings(tx, batch):
     :param tx: Neo4j transaction
     :param batch (list[dict]): Batch of rating data
     """
-    query = """
-            UNWIND $rows AS row
-            MATCH (u:User {id: toInteger(row.`User-ID`)})
-            MATCH (b:Book {isbn: row.ISBN})
-            MERGE (u)-[r:RATED]->(b)
-            SET r.rating = toInteger(row.`Book-Rating`)
-            """
-    tx.run(query, rows=batch)
+    tx.run(LOAD_RATINGS_QUERY, rows=batch)
 
 
 # --- CHUNKING FUNCTION ---
@@ -73,29 +141,269 @@ def chunk_dataframe(df, size=100):
         yield df.iloc[i:i + size].to_dict("records")
 
 
-# --- DATA UPLOAD ---
-with GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD)) as driver:
-    with driver.session() as session:
+def chunk_source(source, size=100):
+    """
+    Splits a DataFrame, or streams a CSV file, into batches of the given size.
+    :param source (pd.DataFrame | str): Loaded DataFrame or path of a filtered CSV file
+    :param size (int): Chunk size
+    :return: Iterator[list[dict]]: Batches of records
+    """
+    if isinstance(source, pd.DataFrame):
+        return chunk_dataframe(source, size)
+    return stream_csv_batches(source, size)
+
+
+# --- SEQUENTIAL UPLOAD ---
+def load_sequential(driver, users_df, books_df, ratings_df):
+    """
+    Uploads users, books and ratings one batch at a time on a single session.
+    Each source may be a DataFrame or the path of a CSV file that is streamed in chunks.
+    :param driver: Neo4j driver
+    :param users_df (pd.DataFrame | str): Filtered users
+    :param books_df (pd.DataFrame | str): Filtered books
+    :param ratings_df (pd.DataFrame | str): Filtered ratings
+    """
+    with graph_db.session(driver) as session:
         print("Connected to Neo4j.")
 
-        for user_batch in chunk_dataframe(users_df):
+        for user_batch in chunk_source(users_df):
             session.execute_write(load_users, user_batch)
         print("Users uploaded.")
 
-        for book_batch in chunk_dataframe(books_df):
+        for book_batch in chunk_source(books_df):
             session.execute_write(load_books, book_batch)
         print("Books uploaded.")
 
-        for rating_batch in chunk_dataframe(ratings_df):
+        for rating_batch in chunk_source(ratings_df):
             session.execute_write(load_ratings, rating_batch)
         print("Ratings uploaded.")
 
 
+# --- PARALLEL PIPELINED UPLOAD ---
+class BatchSizeTuner:
+    """
+    Adapts the UNWIND batch size to the measured throughput (rows per second).
+    Every `window` batches the average throughput is compared to the previous window:
+    if it improved, the size keeps moving in the same direction, otherwise the direction flips.
+    Safe to share between worker threads.
+    """
+
+    def __init__(self, initial=1000, minimum=100, maximum=20000, step=1.5, window=4):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.window = window
+        self._direction = 1
+        self._last_rate = None
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def record(self, rows, seconds):
+        """
+        Records the throughput of one written batch and adjusts the batch size.
+        :param rows (int): Number of rows in the batch
+        :param seconds (float): Time needed to write the batch
+        """
+        with self._lock:
+            self._samples.append(rows / max(seconds, 1e-9))
+            if len(self._samples) < self.window:
+                return
+            rate = sum(self._samples) / len(self._samples)
+            self._samples = []
+            if self._last_rate is not None and rate < self._last_rate:
+                self._direction = -self._direction
+            self._last_rate = rate
+            resized = int(self.size * self.step ** self._direction)
+            self.size = max(self.minimum, min(self.maximum, resized))
+
+
+def iter_batches(df, tuner):
+    """
+    Splits a DataFrame into batches whose size is taken from the tuner at each step.
+    A CSV path is streamed chunk by chunk instead.
+    :param df (pd.DataFrame | str): DataFrame to split or path of a filtered CSV file
+    :param tuner (BatchSizeTuner): Source of the current batch size
+    :Yields: list[dict]: Batch of records as list of dicts
+    """
+    if not isinstance(df, pd.DataFrame):
+        yield from stream_csv_batches(df, tuner)
+        return
+    start = 0
+    while start < len(df):
+        size = tuner.size
+        yield df.iloc[start:start + size].to_dict("records")
+        start += size
+
+
+def run_phase(driver, name, loader, df, workers=4, tuner=None):
+    """
+    Streams the batches of one DataFrame (or streamed CSV file) into a bounded pool of worker threads.
+    Each batch is written in its own session, so up to `workers` transactions run at once
+    while the next batches are already being prepared.
+    :param driver: Neo4j driver (or any object with a compatible session() API)
+    :param name (str): Phase name used in the report
+    :param loader (callable): Transaction function such as load_users
+    :param df (pd.DataFrame | str): Rows to upload or path of a filtered CSV file
+    :param workers (int): Number of concurrent sessions
+    :param tuner (BatchSizeTuner): Batch size tuner, a fresh one is used if omitted
+    :return: dict: Phase name, rows, seconds, rows per second and final batch size
+    """
+    tuner = tuner or BatchSizeTuner()
+
+    def write(batch):
+        started = time.perf_counter()
+        with graph_db.session(driver) as session:
+            session.execute_write(loader, batch)
+        tuner.record(len(batch), time.perf_counter() - started)
+        return len(batch)
+
+    rows = 0
+    pending = set()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in iter_batches(df, tuner):
+            # keep at most two batches per worker in flight
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows += sum(future.result() for future in done)
+            pending.add(pool.submit(write, batch))
+        rows += sum(future.result() for future in pending)
+    seconds = time.perf_counter() - started
+
+    stats = {
+        "phase": name,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+        "batch_size": tuner.size,
+    }
+    print(f"{name} uploaded: {rows} rows in {seconds:.2f}s "
+          f"({stats['rows_per_second']:.0f} rows/s, final batch size {tuner.size})")
+    return stats
+
+
+def load_parallel(driver, users_df, books_df, ratings_df, workers=4, batch_size=1000):
+    """
+    Uploads users and books at the same time, then the ratings that depend on them.
+    Each source may be a DataFrame or the path of a CSV file that is streamed in chunks.
+    :param driver: Neo4j driver
+    :param users_df (pd.DataFrame | str): Filtered users
+    :param books_df (pd.DataFrame | str): Filtered books
+    :param ratings_df (pd.DataFrame | str): Filtered ratings
+    :param workers (int): Number of concurrent sessions per phase
+    :param batch_size (int): Initial batch size, tuned during the upload
+    :return: list[dict]: Statistics of every phase
+    """
+    with ThreadPoolExecutor(max_workers=2) as phases:
+        users = phases.submit(run_phase, driver, "Users", load_users, users_df,
+                              workers, BatchSizeTuner(initial=batch_size))
+        books = phases.submit(run_phase, driver, "Books", load_books, books_df,
+                              workers, BatchSizeTuner(initial=batch_size))
+        stats = [users.result(), books.result()]
+    stats.append(run_phase(driver, "Ratings", load_ratings, ratings_df,
+                           workers, BatchSizeTuner(initial=batch_size)))
+    return stats
+
+
+# --- OFFLINE BULK IMPORT FILES ---
+def prepare_import_frames(users_df, books_df, ratings_df):
+    """
+    Converts the filtered datasets into node and relationship tables for neo4j-admin import.
+    IDs are deduplicated (the last row wins, like the repeated SET of the MERGE loader),
+    Age, Year-Of-Publication and Book-Rating are converted to nullable integers once,
+    and ratings pointing to unknown users or books are dropped because the importer rejects them.
+    :param users_df (pd.DataFrame): Filtered users
+    :param books_df (pd.DataFrame): Filtered books
+    :param ratings_df (pd.DataFrame): Filtered ratings
+    :return: dict[str, pd.DataFrame]: Tables keyed by file prefix, columns already carry the import headers
+    """
+    users = pd.DataFrame({
+        ":ID(User)": pd.to_numeric(users_df["User-ID"], errors="coerce").astype("Int64"),
+        "location": users_df["Location"],
+        "age:int": pd.to_numeric(users_df["Age"], errors="coerce").astype("Int64"),
+    }).dropna(subset=[":ID(User)"]).drop_duplicates(":ID(User)", keep="last")
+    users.insert(1, "id:int", users[":ID(User)"])
+    users[":LABEL"] = "User"
+
+    books = pd.DataFrame({
+        "isbn:ID(Book)": books_df["ISBN"].astype(str),
+        "title": books_df["Book-Title"],
+        "author": books_df["Book-Author"],
+        "year:int": pd.to_numeric(books_df["Year-Of-Publication"], errors="coerce").astype("Int64"),
+        "publisher": books_df["Publisher"],
+    }).drop_duplicates("isbn:ID(Book)", keep="last")
+    books[":LABEL"] = "Book"
+
+    ratings = pd.DataFrame({
+        ":START_ID(User)": pd.to_numeric(ratings_df["User-ID"], errors="coerce").astype("Int64"),
+        ":END_ID(Book)": ratings_df["ISBN"].astype(str),
+        "rating:int": pd.to_numeric(ratings_df["Book-Rating"], errors="coerce").astype("Int64"),
+    }).drop_duplicates([":START_ID(User)", ":END_ID(Book)"], keep="last")
+    ratings = ratings[ratings[":START_ID(User)"].isin(users[":ID(User)"])
+                      & ratings[":END_ID(Book)"].isin(books["isbn:ID(Book)"])].assign(**{":TYPE": "RATED"})
+
+    return {"users": users, "books": books, "ratings": ratings}
+
+
+def write_shard(df, path):
+    """
+    Writes one gzip-compressed shard without header (the header lives in its own file).
+    :param df (pd.DataFrame): Rows of the shard
+    :param path (str): Target file
+    :return: str: Path of the written shard
+    """
+    df.to_csv(path, index=False, header=False, compression="gzip")
+    return path
+
+
+def write_import_files(users_df, books_df, ratings_df, output_dir="import", shards=4, workers=None):
+    """
+    Writes header-annotated node and relationship files for an offline `neo4j-admin database import`.
+    Every table gets a `<name>_header.csv` plus `shards` compressed part files written in parallel.
+    :param users_df (pd.DataFrame): Filtered users
+    :param books_df (pd.DataFrame): Filtered books
+    :param ratings_df (pd.DataFrame): Filtered ratings
+    :param output_dir (str): Directory for the generated files
+    :param shards (int): Number of part files per table
+    :param workers (int): Number of writer processes (defaults to the CPU count)
+    :return: str: The neo4j-admin command that imports the generated files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # part files of an earlier run would still match the import pattern
+    for stale in os.listdir(output_dir):
+        if "-part-" in stale and stale.endswith(".csv.gz"):
+            os.remove(os.path.join(output_dir, stale))
+    tables = prepare_import_frames(users_df, books_df, ratings_df)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for name, df in tables.items():
+            df.head(0).to_csv(os.path.join(output_dir, f"{name}_header.csv"), index=False)
+            step = max(1, -(-len(df) // shards))
+            for part, start in enumerate(range(0, len(df), step)):
+                path = os.path.join(output_dir, f"{name}-part-{part:03d}.csv.gz")
+                futures.append(pool.submit(write_shard, df.iloc[start:start + step], path))
+        for future in futures:
+            future.result()
+
+    for name, df in tables.items():
+        print(f"{name}: {len(df)} rows written to {output_dir}")
+
+    def files(name):
+        return f"{output_dir}/{name}_header.csv,{output_dir}/{name}-part-.*\\.csv\\.gz"
+
+    return ("neo4j-admin database import full neo4j --overwrite-destination "
+            f"--nodes=User={files('users')} --nodes=Book={files('books')} "
+            f"--relationships=RATED={files('ratings')}")
+
+
 # --- OPTIONAL: Initial Graph Setup ---
 def create_graph(tx):
     """
     Creates unique constraints on User and Book nodes.
     Ensures no duplicate users or books in the graph.
+    Superseded by graph_schema.ensure_schema(), which also creates the secondary indexes.
     """
     tx.run("CREATE CONSTRAINT IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
     tx.run("CREATE CONSTRAINT IF NOT EXISTS FOR (b:Book) REQUIRE b.isbn IS UNIQUE")
@@ -126,6 +434,40 @@ def load_data(tx, users, books, ratings):
 #     session.execute_write(load_data, users_df, books_df, ratings_df)
 
 
+# --- DATA UPLOAD ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the filtered datasets into Neo4j.")
+    parser.add_argument("--mode", choices=["sequential", "parallel", "import-files"], default="sequential")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Concurrent sessions per phase (parallel) or writer processes (import-files)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Initial batch size (parallel mode)")
+    parser.add_argument("--output-dir", default="import", help="Target directory (import-files mode)")
+    parser.add_argument("--shards", type=int, default=4, help="Part files per table (import-files mode)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Read the CSV files in chunks instead of loading them up front")
+    args = parser.parse_args()
+
+    if args.streaming and args.mode != "import-files":
+        users_df, books_df, ratings_df = (os.path.join(DATA_DIR, name)
+                                          for name in (USERS_CSV, BOOKS_CSV, RATINGS_CSV))
+    else:
+        users_df, books_df, ratings_df = read_filtered_data()
+    if args.mode == "import-files":
+        command = write_import_files(users_df, books_df, ratings_df, args.output_dir, args.shards, args.workers)
+        print("Stop the database and run:")
+        print(command)
+    else:
+        try:
+            ensure_schema()
+            if args.mode == "parallel":
+                load_parallel(get_driver(), users_df, books_df, ratings_df, args.workers, args.batch_size)
+            else:
+                load_sequential(get_driver(), users_df, books_df, ratings_df)
+            invalidate()
+        finally:
+            close_driver()
+
+
 # --- ARCHIVED / UNUSED CODE ---
 # Filter unnecessary data
 # ratings_df = ratings_df[ratings_df['Book-Rating'] > 0]
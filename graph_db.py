@@ -0,0 +1,129 @@
+"""
+Shared Neo4j access for all modules of the project.
+
+The driver is created lazily on first use (importing a module no longer opens sockets),
+configured from environment variables and shared by everyone, so its connection pool is
+reused across recommender calls. Reads are routed with execute_read, writes with
+execute_write; both carry a per-query timeout. Transient errors are retried by the driver's
+managed transactions only (for up to NEO4J_MAX_RETRY_TIME seconds), never by an extra loop
+around them, so a write function runs at most as often as the driver retries it.
+Tests can install any object with a compatible session() API through set_driver().
+The driver is wrapped by instrumentation.instrument(), so query spans can be switched on
+without touching callers (see instrumentation.py).
+"""
+import os
+import threading
+
+from neo4j import GraphDatabase, unit_of_work
+
+from instrumentation import instrument
+
+# --- Connection settings (overridable via environment variables) ---
+URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+USERNAME = os.environ.get("NEO4J_USERNAME", "neo4j")
+PASSWORD = os.environ.get("NEO4J_PASSWORD", "SuperPasswort")
+DATABASE = os.environ.get("NEO4J_DATABASE") or None
+MAX_POOL_SIZE = int(os.environ.get("NEO4J_MAX_POOL_SIZE", "50"))
+CONNECTION_TIMEOUT = float(os.environ.get("NEO4J_CONNECTION_TIMEOUT", "30"))
+QUERY_TIMEOUT = float(os.environ.get("NEO4J_QUERY_TIMEOUT", "60"))
+# Time the driver keeps retrying a managed transaction on transient errors (max_transaction_retry_time)
+MAX_RETRY_TIME = float(os.environ.get("NEO4J_MAX_RETRY_TIME", "30"))
+
+_driver = None
+_lock = threading.Lock()
+
+
+def get_driver():
+    """
+    Returns the shared driver, creating it on first use.
+    :return: neo4j.Driver
+    """
+    global _driver
+    if _driver is None:
+        with _lock:
+            if _driver is None:
+                _driver = instrument(GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD),
+                                                          max_connection_pool_size=MAX_POOL_SIZE,
+                                                          connection_timeout=CONNECTION_TIMEOUT,
+                                                          max_transaction_retry_time=MAX_RETRY_TIME))
+    return _driver
+
+
+def set_driver(driver):
+    """
+    Replaces the shared driver, e.g. with an in-memory fake in tests.
+    :param driver: Object with a neo4j-compatible session() API (None resets to lazy creation)
+    """
+    global _driver
+    _driver = instrument(driver)
+
+
+def close_driver():
+    """
+    Closes the shared driver and its connection pool.
+    """
+    global _driver
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+def session(driver=None, **kwargs):
+    """
+    Opens a session on the configured database (NEO4J_DATABASE). Every session of the project
+    goes through here, also those on a driver a caller passes in.
+    :param driver: Driver to open the session on (defaults to the shared driver)
+    :return: neo4j.Session
+    """
+    if DATABASE is not None:
+        kwargs.setdefault("database", DATABASE)
+    return (driver or get_driver()).session(**kwargs)
+
+
+def read(work, *args, timeout=None, **kwargs):
+    """
+    Runs a transaction function in a read transaction (routed to readers in a cluster).
+    :param work (callable): Transaction function taking (tx, *args, **kwargs)
+    :param timeout (float): Query timeout in seconds (defaults to NEO4J_QUERY_TIMEOUT)
+    :return: The result of `work`
+    """
+    work = unit_of_work(timeout=timeout or QUERY_TIMEOUT)(work)
+    with session() as s:
+        return s.execute_read(work, *args, **kwargs)
+
+
+def write(work, *args, timeout=None, **kwargs):
+    """
+    Runs a transaction function in a write transaction.
+    :param work (callable): Transaction function taking (tx, *args, **kwargs)
+    :param timeout (float): Query timeout in seconds (defaults to NEO4J_QUERY_TIMEOUT)
+    :return: The result of `work`
+    """
+    work = unit_of_work(timeout=timeout or QUERY_TIMEOUT)(work)
+    with session() as s:
+        return s.execute_write(work, *args, **kwargs)
+
+
+def _fetch(tx, query, params):
+    return tx.run(query, params).data()
+
+
+def run_read(query, timeout=None, **params):
+    """
+    Runs a single read query and returns its records.
+    :param query (str): Cypher query
+    :param timeout (float): Query timeout in seconds
+    :return: list[dict]: Records as dicts
+    """
+    return read(_fetch, query, params, timeout=timeout)
+
+
+def run_write(query, timeout=None, **params):
+    """
+    Runs a single write query and returns its records.
+    :param query (str): Cypher query
+    :param timeout (float): Query timeout in seconds
+    :return: list[dict]: Records as dicts
+    """
+    return write(_fetch, query, params, timeout=timeout)
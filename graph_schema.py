@@ -0,0 +1,122 @@
+"""
+Constraints and indexes of the graph, and EXPLAIN helpers to verify that queries use them.
+
+ensure_schema() creates everything idempotently (named, IF NOT EXISTS, so constraints from
+older runs are kept) and waits until the indexes are online. Loaders, algorithms, the app and
+the services call it before their first query; it runs at most once per process.
+
+  user_id          uniqueness constraint (and its index) on User.id: every per-user lookup, load_ratings
+  book_isbn        uniqueness constraint on Book.isbn: book MERGE/MATCH of the loaders
+  user_community   range index on User.community: community recommender, graph view, app user picker
+  user_dirty       range index on User.dirty: pending users of the incremental refresh (only dirty users
+                   carry the property, so the index stays tiny)
+  rated_rating     optional relationship index on RATED.rating (NEO4J_RATING_INDEX=1): rating-filtered
+                   scans over all RATED edges such as the Louvain projection
+"""
+import os
+
+import graph_db
+
+# --- Schema (all statements are idempotent) ---
+CONSTRAINTS = {
+    "user_id": "CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE",
+    "book_isbn": "CREATE CONSTRAINT book_isbn IF NOT EXISTS FOR (b:Book) REQUIRE b.isbn IS UNIQUE",
+}
+INDEXES = {
+    "user_community": "CREATE INDEX user_community IF NOT EXISTS FOR (u:User) ON (u.community)",
+    "user_dirty": "CREATE INDEX user_dirty IF NOT EXISTS FOR (u:User) ON (u.dirty)",
+}
+OPTIONAL_INDEXES = {
+    "rated_rating": "CREATE INDEX rated_rating IF NOT EXISTS FOR ()-[r:RATED]-() ON (r.rating)",
+}
+RATING_INDEX = os.environ.get("NEO4J_RATING_INDEX", "0") == "1"
+# Maximum time to wait for new indexes to come online (seconds)
+INDEX_TIMEOUT = 300
+
+# Plan operators that read every node (of a label) instead of seeking through an index
+SCAN_OPERATORS = ("AllNodesScan", "NodeByLabelScan")
+
+_ensured = False
+
+
+def schema_statements(rating_index=RATING_INDEX):
+    """
+    :param rating_index (bool): Include the optional RATED.rating index
+    :return: dict[str, str]: Name -> CREATE statement
+    """
+    return {**CONSTRAINTS, **INDEXES, **(OPTIONAL_INDEXES if rating_index else {})}
+
+
+def ensure_schema(rating_index=RATING_INDEX, wait=True, timeout=INDEX_TIMEOUT, force=False):
+    """
+    Creates missing constraints and indexes (once per process).
+    :param rating_index (bool): Also create the relationship index on RATED.rating
+    :param wait (bool): Wait until all indexes are online
+    :param timeout (float): Maximum wait in seconds
+    :param force (bool): Run again even if this process already did
+    """
+    global _ensured
+    if _ensured and not force:
+        return
+    # schema changes cannot share a transaction with other statements, so each runs on its own
+    for statement in schema_statements(rating_index).values():
+        graph_db.run_write(statement)
+    if wait:
+        graph_db.run_read("CALL db.awaitIndexes($seconds)", timeout=timeout + 10, seconds=timeout)
+    _ensured = True
+
+
+def schema_status():
+    """
+    :return: list[dict]: Name, type, entity, labels/types, properties, state and population of all indexes
+    """
+    return graph_db.run_read("""
+            SHOW INDEXES
+            YIELD name, type, entityType, labelsOrTypes, properties, state, populationPercent
+            RETURN name, type, entityType, labelsOrTypes, properties, state, populationPercent
+            ORDER BY name
+            """)
+
+
+# --- PLAN CHECKS ---
+def explain(query, **params):
+    """
+    Plans a query without running it.
+    :param query (str): Cypher query
+    :param params: Query parameters (values only matter for their type)
+    :return: dict: Plan of the result summary
+    """
+    def work(tx):
+        return tx.run(f"EXPLAIN {query}", params).consume().plan
+    return graph_db.read(work)
+
+
+def plan_operators(plan):
+    """
+    :param plan (dict): Plan of a result summary
+    :return: list[str]: Operator names of the plan tree, depth first (without the '@neo4j' suffix)
+    """
+    operators = [plan.get("operatorType", "").split("@")[0]]
+    for child in plan.get("children", []):
+        operators += plan_operators(child)
+    return operators
+
+
+def scans(plan, forbidden=SCAN_OPERATORS):
+    """
+    :param plan (dict): Plan of a result summary
+    :param forbidden (tuple[str]): Operators that count as full scans
+    :return: list[str]: Full-scan operators in the plan (empty if all lookups use indexes)
+    """
+    return [operator for operator in plan_operators(plan) if operator in forbidden]
+
+
+if __name__ == "__main__":
+    try:
+        ensure_schema()
+        for index in schema_status():
+            print(f"{index['name']:<24} {index['type']:<8} {index['entityType']:<13} "
+                  f"{','.join(index['labelsOrTypes'] or []):<8} {','.join(index['properties'] or []):<12} "
+                  f"{index['state']} {index['populationPercent']:.0f}%")
+    finally:
+        graph_db.close_driver()
@@ -0,0 +1,714 @@
+"""
+Query instrumentation for all Neo4j access of the project.
+
+graph_db and recommender_async hand out their drivers wrapped by instrument() / instrument_async().
+While tracing is disabled (the default) a wrapped driver returns the driver's own sessions, so
+the only cost is one flag check per session. Once enabled, every tx.run / session.run emits a
+span to the registered sinks as soon as its result is consumed: query name, hash of the
+parameters, latency, returned rows, the server timings and update counters of the result
+summary, and the current phase (see phase()). Queries slower than the profile threshold also
+get their plan: re-run with PROFILE if they ran in a read transaction, EXPLAIN otherwise (a
+write is never executed twice). Plans are captured in the background, at most once per query
+name and PROFILE_INTERVAL.
+
+Queries are named after their constant (register_queries) or else after the calling function.
+The sinks (LogSink, PrometheusFileSink, OpenTelemetrySink, MemorySink) are in
+instrumentation_sinks.py. Enable them with enable(...) or with
+  NEO4J_TRACE=log[:<file>],prometheus:<file>,otel
+  NEO4J_PROFILE_THRESHOLD=<seconds>
+"""
+import asyncio
+import atexit
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from instrumentation_sinks import LogSink, MemorySink, OpenTelemetrySink, PrometheusFileSink  # noqa: F401 (re-exported)
+
+logger = logging.getLogger(__name__)
+
+
+def _env_seconds(name):
+    """
+    :param name (str): Environment variable
+    :return: float: Its value, or None if it is unset or not a number (logged, never raised at import)
+    """
+    value = os.environ.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Ignoring %s=%r: not a number of seconds", name, value)
+        return None
+
+
+# --- Settings (overridable via environment variables) ---
+TRACE = os.environ.get("NEO4J_TRACE", "")
+PROFILE_THRESHOLD = _env_seconds("NEO4J_PROFILE_THRESHOLD")
+# Minimum time between two plan captures of the same query (seconds)
+PROFILE_INTERVAL = 60.0
+
+# Frames of these packages are skipped when a query is named after its caller
+_SKIPPED_MODULES = {"graph_db", "instrumentation", "neo4j", "asyncio", "concurrent", "threading"}
+
+_enabled = False
+_sinks = []
+_profile_threshold = None
+_profile_pool = None
+_profile_tasks = set()
+_last_profiled = {}
+_query_names = {}
+_lock = threading.Lock()
+_phase = contextvars.ContextVar("neo4j_phase", default=None)
+
+
+# --- CONFIGURATION ---
+def enable(*sinks, profile_threshold=None):
+    """
+    Starts emitting spans.
+    :param sinks: Sinks that receive every span (added to the registered ones)
+    :param profile_threshold (float): Capture the plan of queries slower than this (seconds, None = never)
+    """
+    global _enabled, _profile_threshold
+    with _lock:
+        _sinks.extend(sinks)
+        _profile_threshold = profile_threshold
+        _enabled = True
+
+
+def disable():
+    """
+    Stops emitting spans, waits for running plan captures and closes all sinks.
+    """
+    global _enabled, _profile_pool
+    with _lock:
+        _enabled = False
+        pool, _profile_pool = _profile_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    with _lock:
+        sinks = list(_sinks)
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+
+def enabled():
+    """
+    :return: bool: Whether spans are emitted
+    """
+    return _enabled
+
+
+def configure_from_env(trace=TRACE, profile_threshold=PROFILE_THRESHOLD):
+    """
+    Enables tracing from a sink list such as NEO4J_TRACE: comma-separated entries
+    'log' or 'log:<file>', 'prometheus:<file>' and 'otel'. This runs at import time of every
+    module that talks to Neo4j, so a malformed list or a sink that cannot be created (e.g. 'otel'
+    without opentelemetry-api) only logs a warning and leaves tracing disabled.
+    :param trace (str): Sink list ('' leaves tracing disabled)
+    :param profile_threshold (float): Plan capture threshold in seconds
+    :return: bool: Whether tracing was enabled
+    """
+    sinks = []
+    try:
+        for entry in filter(None, (entry.strip() for entry in trace.split(","))):
+            kind, _, target = entry.partition(":")
+            if kind == "log":
+                sinks.append(LogSink(target or None))
+            elif kind == "prometheus" and target:
+                sinks.append(PrometheusFileSink(target))
+            elif kind == "otel":
+                sinks.append(OpenTelemetrySink())
+            else:
+                raise ValueError(f"invalid entry {entry!r}")
+    except Exception as error:
+        logger.warning("Tracing disabled, NEO4J_TRACE=%r cannot be used: %s", trace, error)
+        for sink in sinks:
+            sink.close()
+        return False
+    if sinks:
+        enable(*sinks, profile_threshold=profile_threshold)
+    return bool(sinks)
+
+
+def register_queries(prefix, queries):
+    """
+    Names the query constants of a module in the spans: FOO_QUERY becomes '<prefix>.foo'.
+    The first registration of a query wins (constants imported from other modules keep their name).
+    :param prefix (str): Name prefix, e.g. 'knn'
+    :param queries (dict): Module namespace (globals()) or {constant name: query}
+    """
+    for name, value in queries.items():
+        if name.endswith("_QUERY") and isinstance(value, str) and value not in _query_names:
+            _query_names[value] = f"{prefix}.{name[:-len('_QUERY')].lower()}"
+
+
+def query_name(query):
+    """
+    :param query (str): Cypher query
+    :return: str: Registered name, or '<file>.<function>' of the first caller outside the Neo4j layers
+    """
+    name = _query_names.get(query)
+    if name is not None:
+        return name
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__", "").split(".")[0] in _SKIPPED_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]}.{frame.f_code.co_name}"
+
+
+def params_hash(params):
+    """
+    :param params (dict): Query parameters
+    :return: str: Short stable hash (groups calls with identical parameters without logging them)
+    """
+    try:
+        payload = json.dumps(params, sort_keys=True, default=str)
+    except TypeError:
+        payload = repr(params)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+@contextmanager
+def phase(name):
+    """
+    Marks a phase of a job: queries inside carry it in their spans, and a span of kind 'phase'
+    with the time spent in the block is emitted at the end. Nested phases are joined with '/'.
+    Does nothing while tracing is disabled.
+    :param name (str): Phase name
+    """
+    if not _enabled:
+        yield
+        return
+    outer = _phase.get()
+    full_name = f"{outer}/{name}" if outer else name
+    token = _phase.set(full_name)
+    start, started, error = time.time(), time.perf_counter(), None
+    try:
+        yield
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        _phase.reset(token)
+        emit({"kind": "phase", "name": full_name, "phase": outer, "start": start,
+              "duration": time.perf_counter() - started, "error": error})
+
+
+def emit(span):
+    """
+    Hands a span to all sinks; a failing sink is logged and never breaks the query.
+    :param span (dict): Span
+    """
+    for sink in tuple(_sinks):
+        try:
+            sink.emit(span)
+        except Exception:
+            logger.exception("Trace sink %r failed", sink)
+
+
+# --- SPANS AND PLANS ---
+def compact_plan(plan):
+    """
+    :param plan (dict): Plan or profile of a result summary
+    :return: dict: Operator tree with details, estimated/actual rows and db hits only
+    """
+    args = plan.get("args", {})
+    node = {"operator": plan.get("operatorType"), "details": args.get("Details"),
+            "estimatedRows": args.get("EstimatedRows")}
+    for key in ("rows", "dbHits"):
+        if key in plan:
+            node[key] = plan[key]
+    node["children"] = [compact_plan(child) for child in plan.get("children", [])]
+    return node
+
+
+def total_db_hits(plan):
+    """
+    :param plan (dict): Profile of a result summary
+    :return: int: db hits of the plan and all its children
+    """
+    return plan.get("dbHits", 0) + sum(total_db_hits(child) for child in plan.get("children", []))
+
+
+def _is_plain(query):
+    return query.lstrip()[:7].upper() not in ("PROFILE", "EXPLAIN")
+
+
+def _plan_query(query, params, read):
+    return (f"PROFILE {query}" if read else f"EXPLAIN {query}"), params
+
+
+def _attach_plan(span, summary, read):
+    plan = summary.profile if read else summary.plan
+    if plan:
+        span["plan"] = compact_plan(plan)
+        if read:
+            span["db_hits"] = total_db_hits(plan)
+
+
+def _plan_steps(session, drive, query, params, read):
+    """
+    Runs the PROFILE/EXPLAIN variant of a query (as a step generator, see _drive_sync).
+    :return: neo4j.ResultSummary
+    """
+    plan_query, plan_params = _plan_query(query, params, read)
+
+    def summary_steps(runner):
+        result = yield lambda: runner.run(plan_query, plan_params)
+        return (yield result.consume)
+    if read:
+        return (yield lambda: session.execute_read(lambda tx: drive(summary_steps(tx))))
+    return (yield from summary_steps(session))
+
+
+def _profile(driver, database, span, query, params, read):
+    kwargs = {"database": database} if database else {}
+    try:
+        with driver.session(**kwargs) as session:
+            summary = _drive_sync(_plan_steps(session, _drive_sync, query, params, read))
+        _attach_plan(span, summary, read)
+    except Exception as error:
+        span["plan_error"] = f"{type(error).__name__}: {error}"
+    emit(span)
+
+
+async def _profile_async(driver, database, span, query, params, read):
+    kwargs = {"database": database} if database else {}
+    try:
+        async with driver.session(**kwargs) as session:
+            summary = await _drive_async(_plan_steps(session, _drive_async, query, params, read))
+        _attach_plan(span, summary, read)
+    except Exception as error:
+        span["plan_error"] = f"{type(error).__name__}: {error}"
+    emit(span)
+
+
+def _wants_plan(span, query):
+    if _profile_threshold is None or span["duration"] < _profile_threshold or span["error"] \
+            or not _is_plain(query):
+        return False
+    now = time.monotonic()
+    with _lock:
+        if now - _last_profiled.get(span["name"], -PROFILE_INTERVAL) < PROFILE_INTERVAL:
+            return False
+        _last_profiled[span["name"]] = now
+    return True
+
+
+def _get_profile_pool():
+    global _profile_pool
+    with _lock:
+        if _profile_pool is None:
+            _profile_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neo4j-profile")
+        return _profile_pool
+
+
+class _Trace:
+    """
+    Bookkeeping of one query from tx.run until its result is consumed.
+    """
+
+    def __init__(self, query, params, read, driver, database, is_async=False):
+        self.query = query
+        self.params = params
+        self.read = read
+        self.driver = driver
+        self.database = database
+        self.is_async = is_async
+        self.name = query_name(query)
+        self.phase = _phase.get()
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.done = False
+
+    def finish(self, rows, summary=None, error=None, ended=None):
+        """
+        Emits the span (once); schedules a plan capture first if the query was slow.
+        :param rows (int): Records handed to the caller
+        :param summary: neo4j.ResultSummary (None if unavailable)
+        :param error (BaseException): Error of the query, if any
+        :param ended (float): perf_counter() when the result was consumed
+        """
+        if self.done:
+            return
+        self.done = True
+        span = {"kind": "query", "name": self.name, "phase": self.phase, "start": self.start,
+                "duration": (ended or time.perf_counter()) - self.started, "rows": rows,
+                "params_hash": params_hash(self.params), "query": self.query,
+                "error": type(error).__name__ if error is not None else None}
+        if summary is not None:
+            span["database"] = getattr(summary, "database", None)
+            span["server_available_ms"] = summary.result_available_after
+            span["server_consumed_ms"] = summary.result_consumed_after
+            span["counters"] = {key: value for key, value in vars(summary.counters).items()
+                                if not key.startswith("_")}
+        if not _wants_plan(span, self.query):
+            emit(span)
+        elif self.is_async:
+            task = asyncio.get_running_loop().create_task(
+                _profile_async(self.driver, self.database, span, self.query, self.params, self.read))
+            _profile_tasks.add(task)
+            task.add_done_callback(_profile_tasks.discard)
+        else:
+            _get_profile_pool().submit(_profile, self.driver, self.database, span, self.query, self.params,
+                                       self.read)
+
+
+# --- WRAPPERS ---
+# Each proxy operation is written once, as a generator that yields the driver calls it needs
+# (functions without arguments) and is sent their results or thrown their errors. _drive_sync
+# makes the calls for the sync driver and _drive_async awaits them for the async one, so the
+# sync and async classes only differ in their driver function and iteration protocol.
+def _drive_sync(steps):
+    """
+    :param steps (generator): Operation that yields driver calls
+    :return: The operation's return value
+    """
+    value, error = None, None
+    while True:
+        try:
+            call = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = call(), None
+        except Exception as exc:
+            value, error = None, exc
+
+
+async def _drive_async(steps):
+    """
+    Like _drive_sync, but every driver call is awaited.
+    :param steps (generator): Operation that yields driver calls
+    :return: The operation's return value
+    """
+    value, error = None, None
+    while True:
+        try:
+            call = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await call(), None
+        except Exception as exc:
+            value, error = None, exc
+
+
+def _reader(name, count):
+    """
+    :param name (str): Result method that reads records (data, values, ...)
+    :param count: Number of records in the method's return value
+    :return: function: Proxy method that finishes the trace once the method returned
+    """
+    def read(self, *args, **kwargs):
+        return self._drive(self._read_steps(lambda: getattr(self._result, name)(*args, **kwargs), count))
+    read.__name__ = name
+    return read
+
+
+class _TracedResult:
+    """
+    Result proxy that finishes its trace once the records are consumed.
+    """
+
+    def __init__(self, result, trace):
+        self._result = result
+        self._trace = trace
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def _finish_steps(self, error=None):
+        if not self._trace.done:
+            ended = time.perf_counter()
+            try:
+                summary = yield self._result.consume
+            except Exception:
+                summary = None
+            self._trace.finish(self._rows, summary, error, ended)
+
+    def _read_steps(self, call, count):
+        try:
+            out = yield call
+        except Exception as error:
+            yield from self._finish_steps(error)
+            raise
+        self._rows += count(out)
+        yield from self._finish_steps()
+        return out
+
+    def _consume_steps(self):
+        ended = time.perf_counter()
+        try:
+            summary = yield self._result.consume
+        except Exception as error:
+            self._trace.finish(self._rows, None, error, ended)
+            raise
+        self._trace.finish(self._rows, summary, None, ended)
+        return summary
+
+    data = _reader("data", len)
+    values = _reader("values", len)
+    value = _reader("value", len)
+    single = _reader("single", lambda record: int(record is not None))
+    to_df = _reader("to_df", len)
+
+    def consume(self):
+        return self._drive(self._consume_steps())
+
+
+class TracedResult(_TracedResult):
+    _drive = staticmethod(_drive_sync)
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception as error:
+            _drive_sync(self._finish_steps(error))
+            raise
+        _drive_sync(self._finish_steps())
+
+
+class TracedAsyncResult(_TracedResult):
+    _drive = staticmethod(_drive_async)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception as error:
+            await _drive_async(self._finish_steps(error))
+            raise
+        await _drive_async(self._finish_steps())
+
+
+def _ending(name):
+    """
+    :param name (str): Method that ends the wrapped transaction or session (commit, close, __exit__)
+    :return: function: Proxy method that finishes the pending results first
+    """
+    def end(self, *args):
+        return self._drive(self._ending_steps(name, args))
+    end.__name__ = name
+    return end
+
+
+class _Runner:
+    """
+    tx.run / session.run that starts a trace per query and remembers unconsumed results.
+    """
+    # Set by the sync and async variants
+    _drive = None
+    _result_class = None
+    _is_async = False
+
+    def __init__(self, target, read, driver, database):
+        self._target = target
+        self._read = read
+        self._driver = driver
+        self._database = database
+        self._results = []
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def _run_steps(self, query, parameters, kwargs):
+        trace = _Trace(query, {**(parameters or {}), **kwargs}, self._read, self._driver, self._database,
+                       self._is_async)
+        try:
+            result = yield lambda: self._target.run(query, parameters, **kwargs)
+        except Exception as error:
+            trace.finish(0, None, error)
+            raise
+        traced = self._result_class(result, trace)
+        self._results.append(traced)
+        return traced
+
+    def _pending_steps(self):
+        for result in self._results:
+            if not result._trace.done:
+                try:
+                    yield from result._consume_steps()
+                except Exception:
+                    pass
+        self._results = []
+
+    def _ending_steps(self, name, args):
+        yield from self._pending_steps()
+        return (yield lambda: getattr(self._target, name)(*args))
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._drive(self._run_steps(query, parameters, kwargs))
+
+    def finish_pending(self):
+        """
+        Consumes results the caller never read (e.g. of write queries), so their spans are emitted.
+        """
+        return self._drive(self._pending_steps())
+
+    close = _ending("close")
+
+
+class _SyncRunner(_Runner):
+    _drive = staticmethod(_drive_sync)
+    _result_class = TracedResult
+
+    def __enter__(self):
+        self._target.__enter__()
+        return self
+
+    __exit__ = _ending("__exit__")
+
+
+class _AsyncRunner(_Runner):
+    _drive = staticmethod(_drive_async)
+    _result_class = TracedAsyncResult
+    _is_async = True
+
+    async def __aenter__(self):
+        await self._target.__aenter__()
+        return self
+
+    __aexit__ = _ending("__aexit__")
+
+
+class _Transaction(_Runner):
+    commit = _ending("commit")
+
+
+class _Session(_Runner):
+    # Set by the sync and async variants
+    _transaction_class = None
+
+    def __init__(self, session, driver, database):
+        # auto-commit queries may write, so slow ones only get an EXPLAIN plan
+        super().__init__(session, False, driver, database)
+
+    def _traced_work(self, work, read):
+        """
+        :param work: Transaction function
+        :param read (bool): Whether it runs in a read transaction
+        :return: function: `work` on an instrumented transaction that finishes its pending results
+        """
+        def steps(tx, args, kwargs):
+            tx = self._transaction_class(tx, read, self._driver, self._database)
+            try:
+                return (yield lambda: work(tx, *args, **kwargs))
+            finally:
+                yield from tx._pending_steps()
+
+        # functools.wraps keeps the timeout/metadata attributes set by unit_of_work
+        @functools.wraps(work)
+        def traced(tx, *args, **kwargs):
+            return self._drive(steps(tx, args, kwargs))
+        return traced
+
+    def _begin_steps(self, args, kwargs):
+        tx = yield lambda: self._target.begin_transaction(*args, **kwargs)
+        return self._transaction_class(tx, False, self._driver, self._database)
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._target.execute_read(self._traced_work(work, True), *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._target.execute_write(self._traced_work(work, False), *args, **kwargs)
+
+    def begin_transaction(self, *args, **kwargs):
+        return self._drive(self._begin_steps(args, kwargs))
+
+
+class InstrumentedTransaction(_Transaction, _SyncRunner):
+    pass
+
+
+class InstrumentedAsyncTransaction(_Transaction, _AsyncRunner):
+    pass
+
+
+class InstrumentedSession(_Session, _SyncRunner):
+    _transaction_class = InstrumentedTransaction
+
+
+class InstrumentedAsyncSession(_Session, _AsyncRunner):
+    _transaction_class = InstrumentedAsyncTransaction
+
+
+class InstrumentedDriver:
+    """
+    Driver proxy: hands out traced sessions while tracing is enabled, the driver's own otherwise.
+    """
+    _session_class = InstrumentedSession
+
+    def __init__(self, driver):
+        self.wrapped = driver
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wrapped.close()
+        return False
+
+    def session(self, **kwargs):
+        session = self.wrapped.session(**kwargs)
+        if not _enabled:
+            return session
+        return self._session_class(session, self.wrapped, kwargs.get("database"))
+
+
+class InstrumentedAsyncDriver(InstrumentedDriver):
+    _session_class = InstrumentedAsyncSession
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.wrapped.close()
+        return False
+
+
+def instrument(driver):
+    """
+    :param driver: neo4j.Driver or compatible object (None is passed through)
+    :return: InstrumentedDriver
+    """
+    if driver is None or isinstance(driver, InstrumentedDriver):
+        return driver
+    return InstrumentedDriver(driver)
+
+
+def instrument_async(driver):
+    """
+    :param driver: neo4j.AsyncDriver or compatible object (None is passed through)
+    :return: InstrumentedAsyncDriver
+    """
+    if driver is None or isinstance(driver, InstrumentedAsyncDriver):
+        return driver
+    return InstrumentedAsyncDriver(driver)
+
+
+atexit.register(disable)
+configure_from_env()
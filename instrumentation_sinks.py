@@ -0,0 +1,187 @@
+"""
+Sinks for the spans of instrumentation.py: MemorySink (a list), LogSink (JSON lines),
+PrometheusFileSink (textfile collector format) and OpenTelemetrySink (needs the opentelemetry-api
+package). A sink has emit(span) and close(); emit is called from the querying thread.
+"""
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# Histogram buckets of the Prometheus sink (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MemorySink:
+    """
+    Keeps all spans in a list (benchmarks, debugging).
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def emit(self, span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+class LogSink:
+    """
+    Writes every span as one JSON line (without the query text) to a file or the
+    'neo4j.queries' logger at INFO level.
+    """
+
+    def __init__(self, path=None, include_query=False):
+        """
+        :param path (str): File to append to (None = logging)
+        :param include_query (bool): Also write the Cypher text
+        """
+        self.path = path
+        self.include_query = include_query
+        self.logger = logging.getLogger("neo4j.queries")
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        line = json.dumps({key: value for key, value in span.items() if key != "query" or self.include_query},
+                          default=str)
+        if self.path is None:
+            self.logger.info(line)
+            return
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def close(self):
+        pass
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusFileSink:
+    """
+    Aggregates spans per query name (latency histogram, rows, errors, updates) and phase
+    (count and total time) and writes them in the Prometheus text format, e.g. for the
+    node_exporter textfile collector. The file is replaced atomically at most every `interval`
+    seconds and when the sink is closed.
+    """
+
+    def __init__(self, path, interval=10.0, buckets=LATENCY_BUCKETS):
+        """
+        :param path (str): Target file (*.prom)
+        :param interval (float): Minimum time between two writes in seconds
+        :param buckets (tuple[float]): Upper bounds of the latency histogram in seconds
+        """
+        self.path = path
+        self.interval = interval
+        self.buckets = tuple(buckets)
+        self.queries = {}
+        self.phases = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        with self._lock:
+            if span["kind"] == "phase":
+                stats = self.phases.setdefault(span["name"], {"count": 0, "sum": 0.0})
+            else:
+                stats = self.queries.setdefault(span["name"], {"buckets": [0] * (len(self.buckets) + 1),
+                                                               "count": 0, "sum": 0.0, "rows": 0,
+                                                               "errors": 0, "updates": 0})
+                stats["buckets"][bisect.bisect_left(self.buckets, span["duration"])] += 1
+                stats["rows"] += span["rows"] or 0
+                stats["errors"] += span["error"] is not None
+                stats["updates"] += sum(span.get("counters", {}).values())
+            stats["count"] += 1
+            stats["sum"] += span["duration"]
+            due = time.monotonic() - self._last_write >= self.interval
+        if due:
+            self.write()
+
+    def render(self):
+        """
+        :return: str: All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = ["# HELP neo4j_query_duration_seconds Latency of Neo4j queries until their result was consumed.",
+                     "# TYPE neo4j_query_duration_seconds histogram"]
+            for name, stats in sorted(self.queries.items()):
+                label = f'query="{_label(name)}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), stats["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'neo4j_query_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"neo4j_query_duration_seconds_sum{{{label}}} {stats['sum']!r}")
+                lines.append(f"neo4j_query_duration_seconds_count{{{label}}} {stats['count']}")
+            for metric, key, text in (("neo4j_query_rows_total", "rows", "Records returned"),
+                                      ("neo4j_query_errors_total", "errors", "Failed queries"),
+                                      ("neo4j_query_updates_total", "updates", "Sum of the update counters")):
+                lines += [f"# HELP {metric} {text}.", f"# TYPE {metric} counter"]
+                lines += [f'{metric}{{query="{_label(name)}"}} {stats[key]}'
+                          for name, stats in sorted(self.queries.items())]
+            lines += ["# HELP neo4j_phase_duration_seconds Time spent in job phases.",
+                      "# TYPE neo4j_phase_duration_seconds summary"]
+            for name, stats in sorted(self.phases.items()):
+                lines.append(f'neo4j_phase_duration_seconds_sum{{phase="{_label(name)}"}} {stats["sum"]!r}')
+                lines.append(f'neo4j_phase_duration_seconds_count{{phase="{_label(name)}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+        Replaces the file with the current metrics (readers never see a partial file).
+        """
+        text = self.render()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".neo4j-metrics-", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+        self._last_write = time.monotonic()
+
+    def close(self):
+        self.write()
+
+
+class OpenTelemetrySink:
+    """
+    Re-emits spans through the OpenTelemetry API (with their original start and end times),
+    so any configured exporter (OTLP, Jaeger, console) receives them. Requires opentelemetry-api.
+    """
+
+    def __init__(self, tracer=None):
+        """
+        :param tracer: opentelemetry Tracer (defaults to the global tracer provider's)
+        """
+        from opentelemetry import trace
+        self.trace = trace
+        self.tracer = tracer or trace.get_tracer("graph_db")
+
+    def emit(self, span):
+        attributes = {"neo4j.kind": span["kind"], "neo4j.phase": span.get("phase") or ""}
+        if span["kind"] == "query":
+            attributes.update({"db.system": "neo4j", "db.query.text": span["query"],
+                               "db.namespace": span.get("database") or "",
+                               "db.response.returned_rows": span["rows"] or 0,
+                               "neo4j.params_hash": span["params_hash"]})
+            for key in ("server_available_ms", "server_consumed_ms", "db_hits"):
+                if span.get(key) is not None:
+                    attributes[f"neo4j.{key}"] = span[key]
+            for key, value in span.get("counters", {}).items():
+                attributes[f"neo4j.counters.{key}"] = value
+            if "plan" in span:
+                attributes["neo4j.plan"] = json.dumps(span["plan"])
+        start = int(span["start"] * 1e9)
+        otel_span = self.tracer.start_span(span["name"], start_time=start, attributes=attributes)
+        if span["error"]:
+            otel_span.set_status(self.trace.Status(self.trace.StatusCode.ERROR, span["error"]))
+        otel_span.end(end_time=start + int(span["duration"] * 1e9))
+
+    def close(self):
+        pass
+
@@ -0,0 +1,334 @@
+"""
+Offline batch job: top-N KNN recommendations for all (or selected) users in one pass.
+
+recommend_books of recommender_knn averages the ratings of a user's SIMILAR_TO neighbours per
+book and skips books the user already rated. For a block of users this is two sparse products,
+    totals = S[block] @ R        votes = S[block] @ (R != 0)
+with S the users x users SIMILAR_TO matrix and R the users x books rating matrix, read at the
+candidates of pattern(S[block]) @ (R != 0), followed by one vectorized sort of all candidates
+of the block. Blocks run in a process pool and every
+finished block is written as its own Parquet part, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import graph_db
+from algorithms.fastrp_local import DATA_DIR, build_rating_graph
+from data.graph_snapshot import SNAPSHOT_PATH, GraphSnapshot
+from graph_schema import ensure_schema
+
+# Default input (edge list of algorithms/knn_exact.py) and output folder
+SIMILAR_TO_FILE = os.path.join(DATA_DIR, "embeddings", "similar_to.parquet")
+OUTPUT_DIR = os.path.join(DATA_DIR, "batch_recommendations")
+
+# Matrices of the current worker process
+_worker = {}
+
+
+def similarity_matrix(edges, user_ids, weighted=False):
+    """
+    Builds the users x users SIMILAR_TO matrix in the row order of the rating matrix.
+    :param edges (pd.DataFrame): Edge list with source, target and similarity
+    :param user_ids (np.ndarray): User IDs in row order
+    :param weighted (bool): Use the similarity as weight instead of 1 per neighbour
+    :return: sparse.csr_matrix: Users x users matrix
+    """
+    index = pd.Index(user_ids)
+    rows = index.get_indexer(edges["source"])
+    cols = index.get_indexer(edges["target"])
+    known = (rows >= 0) & (cols >= 0) & (rows != cols)
+    values = edges["similarity"].to_numpy(np.float32)[known] if weighted else np.ones(known.sum(), np.float32)
+    matrix = sparse.csr_matrix((values, (rows[known], cols[known])), shape=(len(index), len(index)))
+    matrix.sum_duplicates()
+    if not weighted:
+        matrix.data[:] = 1.0  # a neighbour counts once, even if the edge list repeats it
+    return matrix
+
+
+def rating_matrices(ratings):
+    """
+    :param ratings (sparse.csr_matrix): Users x books rating matrix (the uint8 matrix of a snapshot is used as it is)
+    :return: tuple[sparse.csr_matrix]: Ratings and the users x books matrix with 1 for every rating
+    """
+    if ratings.dtype != np.uint8:
+        ratings = sparse.csr_matrix(ratings, dtype=np.float32)
+    rated = sparse.csr_matrix((np.ones(ratings.nnz, np.float32), ratings.indices, ratings.indptr),
+                              shape=ratings.shape)
+    return ratings, rated
+
+
+def _pattern(matrix):
+    """
+    :param matrix (sparse.csr_matrix): Any matrix
+    :return: sparse.csr_matrix: float32 matrix with 1 at every stored entry of `matrix`
+    """
+    return sparse.csr_matrix((np.ones(matrix.nnz, np.float32), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _values_at(product, keys):
+    """
+    Reads a product at given positions; entries the product does not store are 0.
+    :param product (sparse.csr_matrix): Block x books matrix
+    :param keys (np.ndarray): Sorted positions as row * columns + column
+    :return: np.ndarray: Values at `keys`
+    """
+    product = product.tocsr()
+    product.sort_indices()
+    stored = np.repeat(np.arange(product.shape[0]), np.diff(product.indptr)).astype(np.int64) * product.shape[1]
+    stored += product.indices
+    position = np.searchsorted(stored, keys)
+    found = position < len(stored)
+    found[found] = stored[position[found]] == keys[found]
+    values = np.zeros(len(keys), dtype=np.float64)
+    values[found] = product.data[position[found]]
+    return values
+
+
+def recommend_block(similar, ratings, rated, rows, limit=3):
+    """
+    Top-N books for a block of users, ordered like recommend_books (avgRating, then votes).
+    :param similar (sparse.csr_matrix): Users x users SIMILAR_TO matrix
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :param rated (sparse.csr_matrix): Users x books matrix with 1 for every rating
+    :param rows (np.ndarray): Rows of the users of this block
+    :param limit (int): Recommendations per user
+    :return: tuple[np.ndarray]: Row, rank, book column, average rating and votes of every recommendation
+             (votes are similarity sums if `similar` is weighted)
+    """
+    neighbours = similar[rows]
+    # candidates come from the patterns alone: sparse products drop sums that are exactly 0 (a
+    # neighbour's rating of 0, similarities that cancel), so totals and votes need not share a pattern
+    candidates = (_pattern(neighbours) @ rated).tocsr()
+    candidates.sort_indices()
+    block_row = np.repeat(np.arange(len(rows)), np.diff(candidates.indptr))
+    books = candidates.indices
+    keys = block_row.astype(np.int64) * ratings.shape[1] + books
+
+    totals = _values_at(neighbours @ ratings, keys)
+    if np.all(neighbours.data == 1):
+        count = candidates.data.astype(np.float64)  # unweighted: the votes are the candidate counts
+    else:
+        count = _values_at(neighbours @ rated, keys)
+    # drop books the user rated already and books whose neighbour weights sum to 0
+    own = rated[rows].tocsr()
+    own.sort_indices()
+    own_keys = np.repeat(np.arange(len(rows)), np.diff(own.indptr)).astype(np.int64) * ratings.shape[1] + own.indices
+    keep = ~np.isin(keys, own_keys, assume_unique=True) & (count != 0)
+    block_row, books, count = block_row[keep], books[keep], count[keep]
+    average = totals[keep] / count
+
+    order = np.lexsort((books, -count, -average, block_row))
+    block_row, books, count, average = block_row[order], books[order], count[order], average[order]
+    starts = np.searchsorted(block_row, np.arange(len(rows)))
+    rank = np.arange(len(block_row)) - starts[block_row]
+    top = rank < limit
+    return rows[block_row[top]], rank[top] + 1, books[top], average[top], count[top]
+
+
+def _init_worker(similar, ratings=None, rated=None, snapshot=None):
+    if snapshot is not None:
+        # map the snapshot files (shared page cache) instead of unpickling a private copy of R
+        ratings, rated = rating_matrices(GraphSnapshot.open(snapshot).ratings_matrix())
+    _worker.update(similar=similar, ratings=ratings, rated=rated)
+
+
+def _run_block(rows, limit):
+    return recommend_block(_worker["similar"], _worker["ratings"], _worker["rated"], rows, limit)
+
+
+def read_similar_to_graph():
+    """
+    Exports the SIMILAR_TO relationships written by gds.knn.write.
+    :return: pd.DataFrame: Edge list with source, target and similarity
+    """
+    return pd.DataFrame(graph_db.run_read("""
+        MATCH (a:User)-[s:SIMILAR_TO]->(b:User)
+        RETURN a.id AS source, b.id AS target, s.similarity AS similarity
+        """), columns=["source", "target", "similarity"])
+
+
+def input_fingerprint(user_ids, isbns, ratings, edges):
+    """
+    Identifies the inputs of a run, so a resumed run never mixes parts computed from other
+    ratings or SIMILAR_TO edges.
+    :param user_ids (np.ndarray): User IDs in row order of `ratings`
+    :param isbns (np.ndarray): ISBNs in column order of `ratings`
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :param edges (pd.DataFrame): SIMILAR_TO edge list with source, target and similarity
+    :return: dict: Rating and edge counts and a checksum over all of them
+    """
+    ratings = sparse.csr_matrix(ratings)
+    ratings.sort_indices()
+    checksum = 0
+    for array in (np.asarray(user_ids, np.int64), np.asarray(ratings.indptr, np.int64),
+                  np.asarray(ratings.indices, np.int64), np.asarray(ratings.data, np.float32),
+                  edges["source"].to_numpy(np.int64), edges["target"].to_numpy(np.int64),
+                  edges["similarity"].to_numpy(np.float32)):
+        checksum = zlib.crc32(np.ascontiguousarray(array).tobytes(), checksum)
+    checksum = zlib.crc32("\n".join(map(str, isbns)).encode("utf-8"), checksum)
+    return {"ratings": int(ratings.nnz), "edges": len(edges), "checksum": checksum}
+
+
+def run_batch(user_ids, isbns, ratings, edges, output_dir=OUTPUT_DIR, users=None, limit=3, block_size=5000,
+              workers=None, weighted=False, titles=None, snapshot=None):
+    """
+    Computes the recommendations block by block and writes one Parquet part per block.
+    Parts that already exist are skipped, so a rerun with the same settings and inputs continues
+    an interrupted job (other inputs are refused, see input_fingerprint).
+    :param user_ids (np.ndarray): User IDs in row order of `ratings`
+    :param isbns (np.ndarray): ISBNs in column order of `ratings`
+    :param ratings (sparse.csr_matrix): Users x books rating matrix
+    :param edges (pd.DataFrame): SIMILAR_TO edge list with source, target and similarity
+    :param output_dir (str): Folder of the Parquet parts
+    :param users (list[int]): Optional subset of user IDs (default: all users)
+    :param limit (int): Recommendations per user
+    :param block_size (int): Users per block (and per checkpoint)
+    :param workers (int): Number of processes (1 runs in this process)
+    :param weighted (bool): Weight the neighbours' ratings with their similarity
+    :param titles (pd.DataFrame): Optional title and author per ISBN (index: ISBN)
+    :param snapshot (str): Prefix of the graph snapshot `ratings` was taken from; worker processes open it
+                           themselves instead of receiving a copy of the rating matrices
+    :return: dict: Number of users, computed and skipped blocks, seconds and users per second
+    """
+    rows = np.arange(len(user_ids)) if users is None else pd.Index(user_ids).get_indexer(users)
+    rows = np.unique(rows[rows >= 0])
+    blocks = [rows[start:start + block_size] for start in range(0, len(rows), block_size)]
+
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {"users": len(rows), "checksum": zlib.crc32(np.asarray(user_ids)[rows].tobytes()),
+                "limit": limit, "block_size": block_size, "weighted": weighted,
+                "inputs": input_fingerprint(user_ids, isbns, ratings, edges)}
+    # underscore and dot prefixes keep the bookkeeping files out of pd.read_parquet(output_dir)
+    manifest = os.path.join(output_dir, "_manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("inputs") != settings["inputs"]:
+            raise ValueError(f"{output_dir} holds a run over other ratings or SIMILAR_TO edges; "
+                             f"use a new output folder")
+        if previous != settings:
+            raise ValueError(f"{output_dir} holds a run with other settings; use a new output folder")
+    else:
+        with open(manifest, "w", encoding="utf-8") as f:
+            json.dump(settings, f)
+
+    def part_path(number):
+        return os.path.join(output_dir, f"part-{number:05d}.parquet")
+
+    todo = [number for number in range(len(blocks)) if not os.path.exists(part_path(number))]
+
+    def write_part(number, result):
+        block_rows, rank, books, average, votes = result
+        frame = pd.DataFrame({"userId": user_ids[block_rows], "rank": rank.astype(np.int16),
+                              "isbn": isbns[books], "avgRating": average.astype(np.float32),
+                              "votes": votes.astype(np.float32 if weighted else np.int32)})
+        if titles is not None:
+            frame = frame.join(titles, on="isbn")
+        temporary = os.path.join(output_dir, f".part-{number:05d}.tmp")
+        frame.to_parquet(temporary, index=False)
+        os.replace(temporary, part_path(number))  # a part exists only once it is complete
+
+    similar = similarity_matrix(edges, user_ids, weighted)
+    ratings, rated = rating_matrices(ratings)
+
+    start_time = time.time()
+    if workers == 1:
+        for number in todo:
+            write_part(number, recommend_block(similar, ratings, rated, blocks[number], limit))
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(similar, None, None, snapshot) if snapshot else
+                                 (similar, ratings, rated)) as pool:
+            futures = {number: pool.submit(_run_block, blocks[number], limit) for number in todo}
+            for number, future in futures.items():
+                write_part(number, future.result())
+    seconds = time.time() - start_time
+
+    computed = sum(len(blocks[number]) for number in todo)
+    return {"users": len(rows), "blocks": len(todo), "skipped_blocks": len(blocks) - len(todo),
+            "seconds": seconds, "users_per_second": computed / seconds if seconds > 0 else float("inf")}
+
+
+def write_recommendations(tx, batch):
+    """
+    Writes a batch of recommendations as RECOMMENDED relationships with rank and score.
+    :param tx: Neo4j transaction
+    :param batch (list[dict]): Rows with userId, isbn, rank, avgRating and votes
+    """
+    tx.run("""
+           UNWIND $rows AS row
+           MATCH (u:User {id: row.userId})
+           MATCH (b:Book {isbn: row.isbn})
+           MERGE (u)-[r:RECOMMENDED]->(b)
+           SET r.rank = row.rank, r.avgRating = row.avgRating, r.votes = row.votes
+           """, rows=batch)
+
+
+def clear_recommendations(tx, user_ids):
+    """
+    Removes the previous RECOMMENDED relationships of a batch of users.
+    :param tx: Neo4j transaction
+    :param user_ids (list[int]): IDs of the users
+    """
+    tx.run("""
+           UNWIND $userIds AS userId
+           MATCH (:User {id: userId})-[r:RECOMMENDED]->()
+           DELETE r
+           """, userIds=user_ids)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top-N KNN recommendations for all users in one batch.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--snapshot", nargs="?", const=SNAPSHOT_PATH,
+                        help="Read users, books and ratings from a graph snapshot (data/graph_snapshot.py)")
+    parser.add_argument("--similar-to", default=SIMILAR_TO_FILE, help="Edge list of algorithms/knn_exact.py")
+    parser.add_argument("--from-graph", action="store_true", help="Read SIMILAR_TO from Neo4j instead")
+    parser.add_argument("--users", type=int, nargs="+", help="Only these user IDs (default: all)")
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--block-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--weighted", action="store_true", help="Weight ratings by similarity")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--write", action="store_true", help="Also write RECOMMENDED relationships to Neo4j")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = GraphSnapshot.open(args.snapshot)
+        user_ids, isbns, ratings = snapshot.user_ids, snapshot.isbn_strings(), snapshot.ratings_matrix()
+        books = range(snapshot.n_books)
+        titles = pd.DataFrame({"title": snapshot.book_titles.take(books),
+                               "author": snapshot.book_authors.take(books)}, index=pd.Index(isbns, name="ISBN"))
+    else:
+        user_ids, isbns, ratings = build_rating_graph(args.data_dir)
+        titles = pd.read_csv(os.path.join(args.data_dir, "filtered_books.csv"), encoding="latin-1", dtype=object,
+                             usecols=["ISBN", "Book-Title", "Book-Author"]).drop_duplicates("ISBN", keep="last")
+        titles = titles.set_index("ISBN").rename(columns={"Book-Title": "title", "Book-Author": "author"})
+    edges = read_similar_to_graph() if args.from_graph else pd.read_parquet(args.similar_to)
+
+    stats = run_batch(user_ids, isbns, ratings, edges, args.output, args.users, args.limit, args.block_size,
+                      args.workers, args.weighted, titles, args.snapshot)
+    print(f"{stats['users']} users: {stats['blocks']} blocks computed, {stats['skipped_blocks']} resumed "
+          f"from checkpoints, {stats['seconds']:.2f} seconds ({stats['users_per_second']:.0f} users/s)")
+
+    if args.write:
+        ensure_schema()
+        recommendations = pd.read_parquet(args.output)
+        user_list = [int(user_id) for user_id in recommendations["userId"].unique()]
+        for start in range(0, len(user_list), 10000):
+            graph_db.write(clear_recommendations, user_list[start:start + 10000])
+        rows = recommendations[["userId", "isbn", "rank", "avgRating", "votes"]].astype(
+            {"userId": int, "rank": int, "avgRating": float, "votes": float if args.weighted else int})
+        for start in range(0, len(rows), 10000):
+            graph_db.write(write_recommendations, rows.iloc[start:start + 10000].to_dict("records"))
+        graph_db.close_driver()
+        print("RECOMMENDED relationships written.")
@@ -0,0 +1,216 @@
+import copy
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# --- Cache settings (overridable via environment variables) ---
+CACHE_DIR = os.environ.get("RECOMMENDER_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache"))
+MAX_ENTRIES = int(os.environ.get("RECOMMENDER_CACHE_MAX_ENTRIES", "1024"))
+TTL = float(os.environ.get("RECOMMENDER_CACHE_TTL", "300"))
+# Path of the optional shared SQLite tier (disabled if unset)
+SHARED_DB = os.environ.get("RECOMMENDER_CACHE_DB") or None
+
+# Replaced with a new token whenever KNN, Louvain or an ingestion run finishes; part of every cache key
+GENERATION_FILE = os.path.join(CACHE_DIR, "generation")
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache with a size limit (least recently used entries are evicted)
+    and a time-to-live per entry. Values are copied on the way in and out, so callers that
+    modify a result (e.g. sort or annotate its rows) cannot change the cached entry.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key (str): Cache key
+        :return: tuple[bool, object]: Whether the key was found, and its value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return True, copy.deepcopy(entry[1])
+
+    def set(self, key, value):
+        """
+        :param key (str): Cache key
+        :param value (object): Value to cache
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return: dict: Hits, misses and the number of entries, read together under the lock
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class SQLiteCache:
+    """
+    Cache tier in a local SQLite file, shared by all processes on the machine
+    (e.g. several Streamlit workers). Values are stored as JSON.
+    """
+
+    def __init__(self, path, ttl=TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        """
+        :param key (str): Cache key
+        :return: tuple[bool, object]: Whether the key was found, and its value
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM cache WHERE key = ? AND expires >= ?",
+                                     (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        :param key (str): Cache key
+        :param value (object): JSON-serializable value
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache WHERE expires < ?", (now,))
+            connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                               (key, json.dumps(value, default=str), now + self.ttl))
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache")
+
+
+_local = LRUCache()
+_shared = SQLiteCache(SHARED_DB) if SHARED_DB else None
+
+
+def current_generation():
+    """
+    Reads the generation token. The file content is compared rather than its mtime, which can
+    stay the same for two replacements within one timestamp tick.
+    :return: str: Token of the current cache generation ('' before the first invalidation)
+    """
+    try:
+        with open(GENERATION_FILE, encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def invalidate():
+    """
+    Invalidates all cached recommendations, in this and every other process, by writing a new
+    random generation token, which is part of every key. Unlike a counter (read, +1, write), two
+    concurrent invalidations (e.g. of the KNN and the Louvain job) can never write the same value.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    token = uuid.uuid4().hex
+    temporary = f"{GENERATION_FILE}.{token}"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(temporary, GENERATION_FILE)
+    _local.clear()
+    if _shared is not None:
+        _shared.clear()
+
+
+def cache_stats():
+    """
+    :return: dict: Hit and miss counters of both tiers
+    """
+    stats = {f"local_{name}": value for name, value in _local.stats().items()}
+    if _shared is not None:
+        stats.update({"shared_hits": _shared.hits, "shared_misses": _shared.misses})
+    return stats
+
+
+def cached(algorithm):
+    """
+    Caches a recommender function (plain or async) in front of Neo4j. The key covers the
+    cache generation, the algorithm, the function and all arguments (user and parameters).
+    :param algorithm (str): Name of the recommendation algorithm, e.g. 'knn' or 'community'
+    :return: callable: Decorator
+    """
+    def lookup(key):
+        found, value = _local.get(key)
+        if not found and _shared is not None:
+            found, value = _shared.get(key)
+            if found:
+                _local.set(key, value)
+        return found, value
+
+    def store(key, value):
+        _local.set(key, value)
+        if _shared is not None:
+            _shared.set(key, value)
+
+    def decorate(func):
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            key = json.dumps([current_generation(), algorithm, func.__name__, args, sorted(kwargs.items())],
+                             default=str)
+            found, value = lookup(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            store(key, value)
+            return value
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            key = json.dumps([current_generation(), algorithm, func.__name__, args, sorted(kwargs.items())],
+                             default=str)
+            found, value = lookup(key)
+            if found:
+                return value
+            value = await func(*args, **kwargs)
+            store(key, value)
+            return value
+
+        wrapper = async_wrapper if inspect.iscoroutinefunction(func) else sync_wrapper
+        wrapper.uncached = func
+        return wrapper
+    return decorate
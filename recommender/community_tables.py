@@ -0,0 +1,341 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import graph_db
+from algorithms.fastrp_local import DATA_DIR
+from data.graph_snapshot import GraphSnapshot
+from data.incremental_load import finish_refresh, get_dirty_users, get_user_ratings
+from instrumentation import register_queries
+from recommender.cache import invalidate
+
+# Default location of the materialized tables
+TABLES_PATH = os.path.join(DATA_DIR, "community_tables", "tables")
+
+# The labels recommender_community traverses: written by Alg_Community_Detection or louvain_local --write
+COMMUNITY_LABELS_QUERY = """
+    MATCH (u:User)
+    RETURN u.id AS userId, u.community AS community
+    """
+
+register_queries("community_tables", globals())
+
+# Name of this job in the dirty-user bookkeeping of data/incremental_load.py
+REFRESH_JOB = "community_tables"
+
+
+def _pattern(matrix):
+    """
+    :param matrix (sparse.spmatrix): Any sparse matrix
+    :return: sparse.csr_matrix: Boolean matrix with the same non-zero pattern
+    """
+    matrix = sparse.csr_matrix(matrix)
+    return sparse.csr_matrix((np.ones(matrix.nnz, dtype=bool), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _replace_rows(matrix, rows, values):
+    """
+    :param matrix (sparse.csr_matrix): Users x books matrix
+    :param rows (np.ndarray): Rows to replace
+    :param values (sparse.csr_matrix): New content of these rows, one row per entry of `rows`
+    :return: sparse.csr_matrix: Copy of `matrix` with the rows replaced
+    """
+    keep = np.ones(matrix.shape[0], dtype=bool)
+    keep[rows] = False
+    old, new = matrix.tocoo(), values.tocoo()
+    kept = keep[old.row]
+    return sparse.csr_matrix((np.concatenate([old.data[kept], new.data.astype(old.dtype)]),
+                              (np.concatenate([old.row[kept], rows[new.row]]), np.concatenate([old.col[kept], new.col]))),
+                             shape=matrix.shape)
+
+
+def community_entries(positive, labels, communities):
+    """
+    Counts, for the given communities, how many members rated each book positively.
+    :param positive (sparse.csr_matrix): Users x books, True where rating >= min_rating
+    :param labels (np.ndarray): Community label per user
+    :param communities (np.ndarray): Labels of the communities to count
+    :return: pd.DataFrame: One row per (community, book) with its count
+    """
+    members = np.flatnonzero(np.isin(labels, communities))
+    slots, slot_of_member = np.unique(labels[members], return_inverse=True)
+    membership = sparse.csr_matrix((np.ones(len(members), dtype=np.int32), (slot_of_member, members)),
+                                   shape=(len(slots), positive.shape[0]))
+    counts = (membership @ positive.astype(np.int32)).tocoo()
+    return pd.DataFrame({"community": slots[counts.row], "book": counts.col.astype(np.int32),
+                         "count": counts.data.astype(np.int32)})
+
+
+class CommunityTables:
+    """
+    Materialized recommend_books of recommender_community: for every community a ranked
+    candidate list (book, number of members who rated it >= 6), stored as flat arrays with
+    offsets per community. A request only subtracts the user's rated books from that list.
+    """
+
+    def __init__(self, user_ids, isbns, titles, authors, labels, positive, rated, entries):
+        """
+        :param user_ids (np.ndarray): User IDs in row order
+        :param isbns (np.ndarray): ISBNs in column order
+        :param titles (np.ndarray): Book titles in column order
+        :param authors (np.ndarray): Book authors in column order
+        :param labels (np.ndarray): Community label per user
+        :param positive (sparse.csr_matrix): Users x books, True where rating >= min_rating
+        :param rated (sparse.csr_matrix): Users x books, True for every rating
+        :param entries (pd.DataFrame): (community, book, count) rows
+        """
+        self.user_ids = np.asarray(user_ids)
+        self.isbns = np.asarray(isbns)
+        self.titles = np.asarray(titles)
+        self.authors = np.asarray(authors)
+        self.labels = np.asarray(labels)
+        self.positive = positive
+        self.rated = rated
+        self._set_entries(entries)
+
+    def _set_entries(self, entries):
+        # rank inside every community: highest count first, ties by book index
+        order = np.lexsort((entries["book"].to_numpy(), -entries["count"].to_numpy(),
+                            entries["community"].to_numpy()))
+        community = entries["community"].to_numpy()[order]
+        self.books = entries["book"].to_numpy(np.int32)[order]
+        self.counts = entries["count"].to_numpy(np.int32)[order]
+        self.communities = np.unique(community)
+        self.offsets = np.searchsorted(community, self.communities).astype(np.int64)
+        self.offsets = np.append(self.offsets, len(community))
+        self._rows = pd.Index(self.user_ids)
+
+    @classmethod
+    def build(cls, user_ids, isbns, titles, authors, ratings, labels, min_rating=6):
+        """
+        Computes the candidate lists of all communities in one sparse product.
+        :param ratings (sparse.csr_matrix): Users x books rating matrix
+        :param labels (np.ndarray): Community label per user
+        :param min_rating (int): Minimum rating of a positive rating
+        :return: CommunityTables
+        """
+        positive = _pattern(ratings >= min_rating)
+        rated = _pattern(ratings)
+        labels = np.asarray(labels)
+        entries = community_entries(positive, labels, np.unique(labels))
+        return cls(user_ids, isbns, titles, authors, labels, positive, rated, entries)
+
+    def refresh(self, ratings, labels, min_rating=6):
+        """
+        Rebuilds only the communities whose membership or positive ratings changed.
+        Users and books must keep their row and column order (otherwise build from scratch).
+        :param ratings (sparse.csr_matrix): Current users x books rating matrix
+        :param labels (np.ndarray): Current community label per user
+        :param min_rating (int): Minimum rating of a positive rating
+        :return: np.ndarray: Labels of the rebuilt communities
+        """
+        positive = _pattern(ratings >= min_rating)
+        changed_rows = np.asarray((positive != self.positive).sum(axis=1)).ravel() > 0
+        return self._update(positive, _pattern(ratings), labels, changed_rows)
+
+    def refresh_users(self, rows, ratings, labels, min_rating=6):
+        """
+        Like refresh, for a few users whose ratings changed (e.g. the dirty users of
+        data/incremental_load.py): only their rows are replaced and compared.
+        :param rows (np.ndarray): Rows of the users whose ratings are given
+        :param ratings (sparse.csr_matrix): Their complete current ratings, one row per entry of `rows`
+        :param labels (np.ndarray): Current community label per user
+        :param min_rating (int): Minimum rating of a positive rating
+        :return: np.ndarray: Labels of the rebuilt communities
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        new_positive = _pattern(ratings >= min_rating)
+        changed_rows = np.zeros(len(self.user_ids), dtype=bool)
+        changed_rows[rows] = np.asarray((new_positive != self.positive[rows]).sum(axis=1)).ravel() > 0
+        return self._update(_replace_rows(self.positive, rows, new_positive),
+                            _replace_rows(self.rated, rows, _pattern(ratings)), labels, changed_rows)
+
+    def _update(self, positive, rated, labels, changed_rows):
+        labels = np.asarray(labels)
+        changed_users = changed_rows | (labels != self.labels)
+        affected = np.union1d(self.labels[changed_users], labels[changed_users])
+
+        entries = pd.DataFrame({"community": np.repeat(self.communities, np.diff(self.offsets)),
+                                "book": self.books, "count": self.counts})
+        entries = entries[~entries["community"].isin(affected)]
+        entries = pd.concat([entries, community_entries(positive, labels, affected)], ignore_index=True)
+
+        self.labels, self.positive, self.rated = labels, positive, rated
+        self._set_entries(entries)
+        return affected
+
+    def recommend_indices(self, user_id, limit=3):
+        """
+        Top books of the user's community that the user has not rated yet, as column indices.
+        :param user_id (int): ID of the target user
+        :param limit (int): Number of recommendations
+        :return: tuple[np.ndarray]: Book columns and the number of members who rated them >= 6
+                 (empty for unknown users and users without community)
+        """
+        row = self._rows.get_indexer([user_id])[0]
+        if row == -1 or self.labels[row] == -1:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)  # no community assigned
+        # the user's own ratings count in the community totals, but exactly those books are skipped below
+        slot = np.searchsorted(self.communities, self.labels[row])
+        if slot == len(self.communities) or self.communities[slot] != self.labels[row]:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)  # nobody rated a book >= 6
+        start, stop = self.offsets[slot], self.offsets[slot + 1]
+        rated = set(self.rated.indices[self.rated.indptr[row]:self.rated.indptr[row + 1]].tolist())
+
+        books, counts = [], []
+        for book, count in zip(self.books[start:stop], self.counts[start:stop]):
+            if book in rated:
+                continue
+            books.append(book)
+            counts.append(count)
+            if len(books) == limit:
+                break
+        return np.asarray(books, dtype=np.int32), np.asarray(counts, dtype=np.int32)
+
+    def recommend(self, user_id, limit=3):
+        """
+        Top books of the user's community that the user has not rated yet.
+        :param user_id (int): ID of the target user
+        :param limit (int): Number of recommendations
+        :return: list[dict]: Books with title, author and recommendCount
+        """
+        return [{"title": str(self.titles[book]), "author": str(self.authors[book]), "recommendCount": int(count)}
+                for book, count in zip(*self.recommend_indices(user_id, limit))]
+
+    def save(self, prefix):
+        """
+        Stores the tables as .npy / .npz files.
+        :param prefix (str): Output path without extension
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        for name in ("user_ids", "isbns", "titles", "authors", "labels", "communities", "offsets", "books", "counts"):
+            np.save(f"{prefix}_{name}.npy", getattr(self, name))
+        sparse.save_npz(f"{prefix}_positive.npz", self.positive)
+        sparse.save_npz(f"{prefix}_rated.npz", self.rated)
+
+    @classmethod
+    def load(cls, prefix):
+        """
+        :param prefix (str): Path without extension
+        :return: CommunityTables
+        """
+        arrays = {name: np.load(f"{prefix}_{name}.npy")
+                  for name in ("user_ids", "isbns", "titles", "authors", "labels", "communities", "offsets",
+                               "books", "counts")}
+        entries = pd.DataFrame({"community": np.repeat(arrays["communities"], np.diff(arrays["offsets"])),
+                                "book": arrays["books"], "count": arrays["counts"]})
+        return cls(arrays["user_ids"], arrays["isbns"], arrays["titles"], arrays["authors"], arrays["labels"],
+                   sparse.load_npz(f"{prefix}_positive.npz"), sparse.load_npz(f"{prefix}_rated.npz"), entries)
+
+
+def read_graph_labels():
+    """
+    :return: pd.Series: Community property of every user in the graph (index: user ID; NaN without community)
+    """
+    records = graph_db.run_read(COMMUNITY_LABELS_QUERY, timeout=600)
+    return pd.DataFrame(records, columns=["userId", "community"]).set_index("userId")["community"]
+
+
+def read_labels(user_ids, communities_file=None):
+    """
+    :param user_ids (np.ndarray): User IDs in row order
+    :param communities_file (str): Read the labels from this file (userId, community) instead of the graph
+    :return: np.ndarray: Community label per user (-1 without community)
+    """
+    if communities_file is None:
+        communities = read_graph_labels()
+    else:
+        communities = pd.read_csv(communities_file).set_index("userId")["community"]
+    return communities.reindex(user_ids).fillna(-1).astype(np.int64).to_numpy()
+
+
+def refresh_dirty_users(tables, labels, min_rating=6):
+    """
+    Applies the current ratings of the users the delta load marked dirty (and the current labels).
+    Users or books that are not in the tables yet need a full build and stay dirty.
+    :param tables (CommunityTables): Tables to update
+    :param labels (np.ndarray): Current community label per user of the tables
+    :param min_rating (int): Minimum rating of a positive rating
+    :return: tuple: refreshed user IDs, skipped user IDs, read time of the dirty users, rebuilt communities
+    """
+    user_ids, read_at = graph_db.read(get_dirty_users, REFRESH_JOB)
+    ratings = pd.DataFrame(graph_db.read(get_user_ratings, user_ids) if user_ids else [],
+                           columns=["userId", "isbn", "rating"])
+    user_rows = pd.Index(tables.user_ids).get_indexer(user_ids)
+    cols = pd.Index(tables.isbns).get_indexer(ratings["isbn"].astype(str))
+    unknown = set(ratings["userId"][cols < 0]) | {user_id for user_id, row in zip(user_ids, user_rows) if row < 0}
+    refreshed = [user_id for user_id in user_ids if user_id not in unknown]
+
+    known = ~ratings["userId"].isin(unknown).to_numpy()
+    slot = pd.Index(refreshed).get_indexer(ratings["userId"][known])
+    matrix = sparse.csr_matrix((ratings["rating"].to_numpy(np.float32)[known], (slot, cols[known])),
+                               shape=(len(refreshed), len(tables.isbns)))
+    affected = tables.refresh_users(pd.Index(tables.user_ids).get_indexer(refreshed), matrix, labels, min_rating)
+    return refreshed, sorted(unknown), read_at, affected
+
+
+def read_inputs(snapshot=None, communities_file=None):
+    """
+    Reads users, books, ratings and community labels from a graph snapshot. By default the snapshot
+    is exported from the graph, so it includes the ratings of the delta load and the `community`
+    property recommender_community traverses.
+    :param snapshot (GraphSnapshot): Snapshot to read (default: GraphSnapshot.from_graph())
+    :param communities_file (str): Read the labels from this file (userId, community) instead
+    :return: tuple: user IDs, ISBNs, titles, authors, rating matrix, labels
+    """
+    if snapshot is None:
+        snapshot = GraphSnapshot.from_graph()
+    user_ids = np.asarray(snapshot.user_ids, dtype=np.int64)
+    books = range(snapshot.n_books)
+    if communities_file is None:
+        labels = np.asarray(snapshot.user_communities, dtype=np.int64)
+    else:
+        labels = read_labels(user_ids, communities_file)
+    return (user_ids, snapshot.isbn_strings(), np.array(snapshot.book_titles.take(books), dtype=str),
+            np.array(snapshot.book_authors.take(books), dtype=str),
+            sparse.csr_matrix(snapshot.ratings_matrix(), dtype=np.float32), labels)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize per-community recommendation tables.")
+    parser.add_argument("--snapshot",
+                        help="Build from a saved data.graph_snapshot (default: export the graph now)")
+    parser.add_argument("--communities",
+                        help="Labels from a file such as data/communities.csv (default: the graph's community property)")
+    parser.add_argument("--output", default=TABLES_PATH)
+    parser.add_argument("--refresh", action="store_true",
+                        help="Only apply the dirty users of the delta load and changed communities")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    try:
+        if args.refresh and os.path.exists(f"{args.output}_offsets.npy"):
+            tables = CommunityTables.load(args.output)
+            refreshed, skipped, read_at, affected = refresh_dirty_users(
+                tables, read_labels(tables.user_ids, args.communities))
+            tables.save(args.output)
+            invalidate()  # recommend_books_precomputed reloads the tables in every process
+            finish_refresh(REFRESH_JOB, refreshed, read_at)
+            print(f"{len(refreshed)} dirty users applied, {len(affected)} communities rebuilt.")
+            if skipped:
+                print(f"{len(skipped)} dirty users have users or books the tables do not know yet; "
+                      f"they stay dirty until a full build.")
+        else:
+            # dirty users read before the export are covered by it; later changes stay dirty (changedAt >= readAt)
+            dirty, read_at = ([], None) if args.snapshot else graph_db.read(get_dirty_users, REFRESH_JOB)
+            snapshot = GraphSnapshot.open(args.snapshot) if args.snapshot else None
+            user_ids, isbns, titles, authors, ratings, labels = read_inputs(snapshot, args.communities)
+            tables = CommunityTables.build(user_ids, isbns, titles, authors, ratings, labels)
+            tables.save(args.output)
+            invalidate()
+            finish_refresh(REFRESH_JOB, dirty, read_at)
+            if args.snapshot:
+                print("Built from a saved snapshot: dirty users stay pending until a build from the graph.")
+    finally:
+        graph_db.close_driver()
+    print(f"Tables for {len(tables.communities)} communities written in {time.time() - start_time:.2f} seconds")
@@ -0,0 +1,150 @@
+"""
+Bounded graph visualization data, shared by all recommenders.
+
+get_graph_data of the KNN and community modules return one row per combination of target book,
+similar user and similar user's book (KNN) or every RATED edge of a whole community, which pyvis
+then receives node by node. The view queries sample on the server instead: at most `max_users`
+users (by similarity for KNN; for communities the members who rated most of the target's books
+that the community rated most; the target always included) and the `max_books` books most of
+them rated (then by best rating). graph_view() turns the result into deduplicated node and edge
+lists and caps the edges; build_graph_view() renders them.
+"""
+from pyvis.network import Network
+
+from instrumentation import register_queries
+
+# --- Default limits of a view ---
+MAX_USERS = 15
+MAX_BOOKS = 40
+MAX_EDGES = 250
+# Layout iterations before the first draw; the rest of the layout runs visibly in the browser
+STABILIZATION_ITERATIONS = 100
+
+# Shared tail of both view queries: users and their similarities -> sampled books with their ratings
+_BOOKS_OF_USERS = """
+            CALL {
+                WITH users
+                UNWIND users AS u
+                MATCH (u)-[r:RATED]->(b:Book)
+                WITH b, collect({userId: u.id, rating: r.rating}) AS ratings, max(r.rating) AS best
+                ORDER BY size(ratings) DESC, best DESC, b.isbn
+                LIMIT $maxBooks
+                RETURN collect(b {.isbn, .title, .author, .publisher, .year, ratings: ratings}) AS books
+            }
+            RETURN [i IN range(0, size(users) - 1) | {id: users[i].id, location: users[i].location,
+                                                      age: users[i].age, similarity: similarities[i]}] AS users,
+                   books
+            """
+
+KNN_VIEW_QUERY = """
+            MATCH (target:User {id: $userId})
+            CALL {
+                WITH target
+                MATCH (target)-[s:SIMILAR_TO]->(sim:User)
+                WITH sim, s.similarity AS similarity
+                ORDER BY similarity DESC
+                LIMIT $maxUsers
+                RETURN collect(sim) AS sims, collect(similarity) AS simScores
+            }
+            WITH [target] + sims AS users, [null] + simScores AS similarities
+            """ + _BOOKS_OF_USERS
+
+# Members are ranked by how many of the sampled books they rated, not by all their ratings, so the
+# view shows the users that share the most of its books with the target
+COMMUNITY_VIEW_QUERY = """
+            MATCH (target:User {id: $userId})
+            CALL {
+                WITH target
+                MATCH (target)-[:RATED]->(b:Book)<-[:RATED]-(member:User)
+                WHERE member.community = target.community AND member <> target
+                WITH b, collect(member) AS raters
+                ORDER BY size(raters) DESC, b.isbn
+                LIMIT $maxBooks
+                UNWIND raters AS member
+                WITH member, count(*) AS shared
+                ORDER BY shared DESC, member.id
+                LIMIT $maxUsers
+                RETURN collect(member) AS members
+            }
+            WITH [target] + members AS users, [m IN [target] + members | null] AS similarities
+            """ + _BOOKS_OF_USERS
+
+register_queries("view", globals())
+
+
+def _color(rating):
+    return "red" if rating <= 4 else "yellow" if rating <= 7 else "green"
+
+
+def graph_view(users, books, max_edges=MAX_EDGES):
+    """
+    Builds deduplicated node and edge lists from a sampled view. All users are kept, rating
+    edges are kept best rating first until `max_edges` is reached, and books that lost all
+    their edges are dropped.
+    :param users (list[dict]): Target user first, then the sampled users (id, location, age, similarity)
+    :param books (list[dict]): Sampled books (isbn, title, author, publisher, year) with their
+                               ratings (list of userId, rating) by the sampled users
+    :param max_edges (int): Maximum number of edges
+    :return: dict: 'nodes' and 'edges' lists, plus 'truncated' (whether edges were cut)
+    """
+    if not users:
+        return {"nodes": [], "edges": [], "truncated": False}
+    target = users[0]
+    nodes = {}
+    edges = []
+    for user in users:
+        nodes[f"user_{user['id']}"] = {
+            "id": f"user_{user['id']}", "label": f"User {user['id']}", "shape": "dot",
+            "title": f"User-ID: {user['id']}\nLocation: {user.get('location', '')}\nAge: {user.get('age', '')}"}
+        if user is not target and user.get("similarity") is not None:
+            similarity = user["similarity"]
+            edges.append({"source": f"user_{target['id']}", "target": f"user_{user['id']}",
+                          "title": f"similarity: {similarity:.2f}", "value": 1 + similarity * 9})
+
+    ratings = sorted(((rating["rating"], book["isbn"], rating["userId"]) for book in books
+                      for rating in book["ratings"]), key=lambda entry: -entry[0])
+    ratings = ratings[:max(0, max_edges - len(edges))]
+    best = {}
+    for rating, isbn, user_id in ratings:
+        best[isbn] = max(best.get(isbn, rating), rating)
+        edges.append({"source": f"user_{user_id}", "target": isbn, "title": str(rating), "value": rating})
+    for book in books:
+        if book["isbn"] in best:
+            nodes[book["isbn"]] = {
+                "id": book["isbn"], "label": book["title"], "shape": "box", "color": _color(best[book["isbn"]]),
+                "title": f"Title: {book['title']}\nAuthor: {book['author']}\nISBN: {book['isbn']}\n"
+                         f"Publisher: {book.get('publisher', '')}\nYear: {book.get('year', '')}"}
+    total = sum(len(book["ratings"]) for book in books)
+    return {"nodes": list(nodes.values()), "edges": edges, "truncated": len(ratings) < total}
+
+
+def view_from_records(records, max_edges=MAX_EDGES):
+    """
+    :param records (list[dict]): Result of KNN_VIEW_QUERY or COMMUNITY_VIEW_QUERY
+    :param max_edges (int): Maximum number of edges
+    :return: dict: Result of graph_view (empty if the user does not exist)
+    """
+    if not records:
+        return graph_view([], [])
+    return graph_view(records[0]["users"], records[0]["books"], max_edges)
+
+
+def build_graph_view(view):
+    """
+    Renders a view as an interactive Pyvis network: users as dots, books as boxes colored by
+    their best rating (red = low, yellow = medium, green = high), edge thickness = rating or
+    scaled similarity. The nodes are drawn after a short layout phase, the rest of the
+    layout continues in the browser.
+    :param view (dict): Result of graph_view
+    :return: pyvis.Network: A Pyvis Network object ready to be rendered.
+    """
+    net = Network(height="600px", width="100%", notebook=False)
+    net.barnes_hut()
+    net.options.physics.stabilization.iterations = STABILIZATION_ITERATIONS
+    net.options.physics.stabilization.updateInterval = 25
+    for node in view["nodes"]:
+        net.add_node(node["id"], **{key: value for key, value in node.items() if key != "id"})
+    # the node and edge lists are already deduplicated, so the edges skip add_edge's O(E) duplicate scan
+    net.edges.extend({"from": edge["source"], "to": edge["target"], "title": edge["title"], "value": edge["value"]}
+                     for edge in view["edges"])
+    return net
@@ -0,0 +1,218 @@
+"""
+Async recommender API on top of neo4j's AsyncGraphDatabase.
+
+recommend_all() sends the three queries of the UI (recommendations, similar users, graph data)
+at the same time with asyncio.gather, so a request takes as long as the slowest query instead
+of the sum of all three. recommend_many() serves many users over the same pooled driver.
+The driver lives on one background event loop; synchronous callers (e.g. Streamlit) use run().
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from neo4j import AsyncGraphDatabase, unit_of_work
+
+import graph_db
+from instrumentation import instrument_async
+import recommender.recommender_community as community
+import recommender.recommender_knn as knn
+from recommender.cache import cached
+from recommender.graph_view import (COMMUNITY_VIEW_QUERY, KNN_VIEW_QUERY, MAX_BOOKS, MAX_EDGES, MAX_USERS,
+                                    view_from_records)
+
+# Cypher queries per algorithm (shared with the synchronous modules)
+QUERIES = {
+    "knn": {"recommend_books": knn.RECOMMEND_BOOKS_QUERY,
+            "get_similar_users": knn.SIMILAR_USERS_QUERY,
+            "get_graph_data": knn.GRAPH_DATA_QUERY,
+            "get_graph_view": KNN_VIEW_QUERY},
+    "community": {"recommend_books": community.RECOMMEND_BOOKS_QUERY,
+                  "get_similar_users": community.SIMILAR_USERS_QUERY,
+                  "get_graph_data": community.GRAPH_DATA_QUERY,
+                  "get_graph_view": COMMUNITY_VIEW_QUERY},
+}
+
+# Maximum number of users served at the same time by recommend_many
+DEFAULT_CONCURRENCY = 16
+
+_driver = None
+_loop = None
+_lock = threading.Lock()
+
+
+def get_async_driver():
+    """
+    Returns the shared async driver, creating it on first use. Must be called on the event
+    loop that uses it (the driver is bound to that loop).
+    :return: neo4j.AsyncDriver
+    """
+    global _driver
+    if _driver is None:
+        _driver = instrument_async(AsyncGraphDatabase.driver(
+            graph_db.URI, auth=(graph_db.USERNAME, graph_db.PASSWORD),
+            max_connection_pool_size=graph_db.MAX_POOL_SIZE, connection_timeout=graph_db.CONNECTION_TIMEOUT,
+            max_transaction_retry_time=graph_db.MAX_RETRY_TIME))
+    return _driver
+
+
+def set_async_driver(driver):
+    """
+    Replaces the shared async driver, e.g. with an in-memory fake in tests.
+    :param driver: Object with a neo4j-compatible async session() API (None resets to lazy creation)
+    """
+    global _driver
+    _driver = instrument_async(driver)
+
+
+async def close_async_driver():
+    """
+    Closes the shared async driver and its connection pool.
+    """
+    global _driver
+    if _driver is not None:
+        await _driver.close()
+        _driver = None
+
+
+async def _fetch(tx, query, params):
+    result = await tx.run(query, params)
+    return await result.data()
+
+
+async def run_read_async(query, timeout=None, **params):
+    """
+    Runs a single read query on its own session; the driver retries transient errors.
+    :param query (str): Cypher query
+    :param timeout (float): Query timeout in seconds (defaults to NEO4J_QUERY_TIMEOUT)
+    :return: list[dict]: Records as dicts
+    """
+    work = unit_of_work(timeout=timeout or graph_db.QUERY_TIMEOUT)(_fetch)
+    kwargs = {"database": graph_db.DATABASE} if graph_db.DATABASE is not None else {}
+    async with get_async_driver().session(**kwargs) as session:
+        return await session.execute_read(work, query, params)
+
+
+# --- ASYNC RECOMMENDER FUNCTIONS ---
+@cached("async")
+async def recommend_books(user_id, algorithm="knn"):
+    """
+    Async version of recommend_books of the KNN or community recommender.
+    :param user_id (int): ID of the target user
+    :param algorithm (str): 'knn' or 'community'
+    :return: list[dict]: Up to 3 recommended books
+    """
+    if algorithm == "community" and community.USE_TABLES:
+        return community.recommend_books_precomputed(user_id)  # in-memory lookup, no query
+    return await run_read_async(QUERIES[algorithm]["recommend_books"], userId=user_id)
+
+
+@cached("async")
+async def get_similar_users(user_id, algorithm="knn"):
+    """
+    Async version of get_similar_users of the KNN or community recommender.
+    :param user_id (int): ID of the target user
+    :param algorithm (str): 'knn' or 'community'
+    :return: list[dict]: Up to 3 similar users with ID, location and age
+    """
+    return await run_read_async(QUERIES[algorithm]["get_similar_users"], userId=user_id)
+
+
+@cached("async")
+async def get_graph_data(user_id, algorithm="knn"):
+    """
+    Async version of get_graph_data of the KNN or community recommender.
+    :param user_id (int): ID of the target user
+    :param algorithm (str): 'knn' or 'community'
+    :return: list[dict]: Records for the graph visualization
+    """
+    return await run_read_async(QUERIES[algorithm]["get_graph_data"], userId=user_id)
+
+
+@cached("async")
+async def get_graph_view(user_id, algorithm="knn", max_users=MAX_USERS, max_books=MAX_BOOKS, max_edges=MAX_EDGES):
+    """
+    Async version of get_graph_view (bounded, deduplicated nodes and edges).
+    :param user_id (int): ID of the target user
+    :param algorithm (str): 'knn' or 'community'
+    :param max_users (int): Maximum number of users besides the target user
+    :param max_books (int): Maximum number of books
+    :param max_edges (int): Maximum number of edges
+    :return: dict: 'nodes', 'edges' and 'truncated'
+    """
+    records = await run_read_async(QUERIES[algorithm]["get_graph_view"], userId=user_id,
+                                   maxUsers=max_users, maxBooks=max_books)
+    return view_from_records(records, max_edges)
+
+
+async def recommend_all(user_id, algorithm="knn", graph=True):
+    """
+    Runs the recommendation, similar-user and (optionally) graph view query concurrently.
+    :param user_id (int): ID of the target user
+    :param algorithm (str): 'knn' or 'community'
+    :param graph (bool): Whether to fetch the bounded graph view too
+    :return: dict: recommendations, similarUsers and graphView (None if graph is False)
+    """
+    queries = [recommend_books(user_id, algorithm), get_similar_users(user_id, algorithm)]
+    if graph:
+        queries.append(get_graph_view(user_id, algorithm))
+    results = await asyncio.gather(*queries)
+    return {"recommendations": results[0], "similarUsers": results[1],
+            "graphView": results[2] if graph else None}
+
+
+async def recommend_many(user_ids, algorithm="knn", graph=False, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Serves many users over the shared driver, with at most `concurrency` users in flight
+    (each of them running its queries concurrently as in recommend_all).
+    :param user_ids (list[int]): IDs of the target users
+    :param algorithm (str): 'knn' or 'community'
+    :param graph (bool): Whether to fetch the graph data too
+    :param concurrency (int): Maximum number of users served at the same time
+    :return: dict[int, dict]: Result of recommend_all per user ID
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def serve(user_id):
+        async with semaphore:
+            return user_id, await recommend_all(user_id, algorithm, graph)
+    return dict(await asyncio.gather(*(serve(user_id) for user_id in user_ids)))
+
+
+# --- SYNCHRONOUS BRIDGE ---
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="recommender-async", daemon=True).start()
+    return _loop
+
+
+def run(coroutine, timeout=None):
+    """
+    Runs a coroutine of this module on the background event loop and waits for the result.
+    All calls share the loop, and with it the async driver and its connection pool.
+    :param coroutine: Coroutine, e.g. recommend_all(user_id)
+    :param timeout (float): Maximum wait in seconds
+    :return: The result of the coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result(timeout)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recommendations for many users concurrently.")
+    parser.add_argument("user_ids", nargs="+", type=int)
+    parser.add_argument("--algorithm", choices=sorted(QUERIES), default="knn")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    try:
+        results = run(recommend_many(args.user_ids, args.algorithm, concurrency=args.concurrency))
+    finally:
+        run(close_async_driver())
+    for user_id, result in results.items():
+        print(user_id, [book["title"] for book in result["recommendations"]])
+    print(f"{len(results)} users served in {time.time() - start_time:.2f} seconds")
@@ -1,13 +1,84 @@
-from neo4j import GraphDatabase
+import os
+import threading
+
 from pyvis.network import Network
 
-# Neo4j connection setup
-URI = "bolt://localhost:7687"
-USERNAME = "neo4j"
-PASSWORD = "SuperPasswort"
-driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
+from graph_db import run_read
+from instrumentation import register_queries
+from recommender.cache import cached, current_generation
+from recommender.community_tables import TABLES_PATH, CommunityTables
+from recommender.graph_view import COMMUNITY_VIEW_QUERY, MAX_BOOKS, MAX_EDGES, MAX_USERS, view_from_records
+
+# Serve recommend_books from the materialized community tables (python -m recommender.community_tables)
+USE_TABLES = os.environ.get("RECOMMENDER_COMMUNITY_TABLES", "0") == "1"
+
+# --- Cypher queries (shared with recommender_async) ---
+# Community members are looked up through the User.community index of graph_schema
+RECOMMEND_BOOKS_QUERY = """
+            MATCH (targetUser:User {id: $userId})
+            MATCH (otherUser:User {community: targetUser.community})
+            WHERE otherUser <> targetUser
+            MATCH (otherUser)-[r:RATED]->(b:Book)
+            WHERE r.rating >= 6 AND NOT (targetUser)-[:RATED]->(b)
+            RETURN b.title AS title, b.author AS author, COUNT(*) AS recommendCount
+            ORDER BY recommendCount DESC
+            LIMIT 3
+            """
 
+SIMILAR_USERS_QUERY = """
+            MATCH (u1:User {id: $userId})
+            MATCH (u2:User {community: u1.community})
+            WHERE u2 <> u1
+            WITH u2
+            LIMIT 3
+            RETURN u2.id AS userId, u2.location AS location, u2.age AS age
+            ORDER BY userId
+            """
 
+GRAPH_DATA_QUERY = """
+            MATCH (target:User {id: $userId})
+            MATCH (u:User {community: target.community})-[r:RATED]->(b:Book)
+            RETURN u, b, r.rating AS rating
+            """
+
+
+# Batched variants for the recommendation service: one round-trip for many users
+RECOMMEND_BOOKS_BATCH_QUERY = """
+            UNWIND $userIds AS userId
+            MATCH (targetUser:User {id: userId})
+            CALL {
+                WITH targetUser
+                MATCH (otherUser:User {community: targetUser.community})
+                WHERE otherUser <> targetUser
+                MATCH (otherUser)-[r:RATED]->(b:Book)
+                WHERE r.rating >= 6 AND NOT (targetUser)-[:RATED]->(b)
+                WITH b, COUNT(*) AS recommendCount
+                ORDER BY recommendCount DESC
+                LIMIT 3
+                RETURN collect({title: b.title, author: b.author, recommendCount: recommendCount}) AS rows
+            }
+            RETURN userId, rows
+            """
+
+SIMILAR_USERS_BATCH_QUERY = """
+            UNWIND $userIds AS userId
+            MATCH (u1:User {id: userId})
+            CALL {
+                WITH u1
+                MATCH (u2:User {community: u1.community})
+                WHERE u2 <> u1
+                WITH u2
+                LIMIT 3
+                WITH u2 ORDER BY u2.id
+                RETURN collect({userId: u2.id, location: u2.location, age: u2.age}) AS rows
+            }
+            RETURN userId, rows
+            """
+
+register_queries("community", globals())
+
+
+@cached("community")
 def recommend_books(user_id):
     """
     Recommends books based on the community of the given user.
@@ -16,22 +87,48 @@ def recommend_books(user_id):
     :param user_id (str): ID of the target user.
     :return: list[dict]: Top 3 recommended books with title, author, and count of recommendations.
     """
-    query = """
-            MATCH (targetUser:User {id: $userId})
-            WITH targetUser, targetUser.community AS communityId
-            MATCH (otherUser:User {community: communityId})
-            WHERE otherUser.id <> $userId
-            MATCH (otherUser)-[r:RATED]->(b:Book)
-            WHERE r.rating >= 6 AND NOT (targetUser)-[:RATED]->(b)
-            RETURN b.title AS title, b.author AS author, COUNT(*) AS recommendCount
-            ORDER BY recommendCount DESC
-            LIMIT 3
-            """
-    with driver.session() as session:
-        result = session.run(query, userId=user_id)
-        return [record.data() for record in result]
+    if USE_TABLES:
+        return recommend_books_precomputed(user_id)
+    return run_read(RECOMMEND_BOOKS_QUERY, userId=user_id)
+
+
+# Loaded tables and the cache generation they were loaded in
+_tables = {"generation": None, "tables": None}
+_tables_lock = threading.Lock()
+
+
+def get_tables():
+    """
+    Returns the materialized tables, loading them again after every cache invalidation
+    (community_tables, Louvain and ingestion runs change the generation).
+    :return: CommunityTables
+    """
+    generation = current_generation()
+    if _tables["generation"] != generation:
+        with _tables_lock:
+            if _tables["generation"] != generation:
+                _tables["tables"] = CommunityTables.load(TABLES_PATH)
+                _tables["generation"] = generation
+    return _tables["tables"]
+
+
+def recommend_books_precomputed(user_id):
+    """
+    Same result as recommend_books, served from the materialized community tables
+    (see community_tables.py) instead of traversing the community on every call.
+    Used by recommend_books, the async API and the service if RECOMMENDER_COMMUNITY_TABLES=1.
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: Top 3 recommended books with title, author, and count of recommendations
+             (empty for unknown users, like the Cypher query).
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return []
+    return get_tables().recommend(user_id)
 
 
+@cached("community")
 def get_similar_users(user_id):
     """
     Retrieves users from the same community, excluding the target user.
@@ -39,22 +136,10 @@ def get_similar_users(user_id):
     :param user_id (str): ID of the target user.
     :return: list[dict]: Up to 3 users with their ID, location, and age.
     """
-    query = """
-            MATCH (u1:User {id: $userId})
-            WITH u1.community AS communityId
-            MATCH (u2:User {community: communityId})
-            WHERE u2.id <> $userId
-            WITH DISTINCT u2.id AS userId
-            LIMIT 3
-            MATCH (u:User {id: userId})
-            RETURN u.id AS userId, u.location AS location, u.age AS age
-            ORDER BY u.id
-            """
-    with driver.session() as session:
-        result = session.run(query, userId=user_id)
-        return [record.data() for record in result]
+    return run_read(SIMILAR_USERS_QUERY, userId=user_id)
 
 
+@cached("community")
 def get_graph_data(user_id):
     """
     Retrieves users and book-rating relationships within the same community
@@ -62,14 +147,22 @@ def get_graph_data(user_id):
     :param user_id (str): ID of the target user.
     :return: list[dict]: Each record contains a user, a book, and the rating given.
     """
-    query = """
-            MATCH (target:User {id: $userId})
-            WITH target, target.community AS communityId
-            MATCH (u:User {community: communityId})-[r:RATED]->(b:Book)
-            RETURN u, b, r.rating AS rating
-            """
-    with driver.session() as session:
-        return [record.data() for record in session.run(query, userId=user_id)]
+    return run_read(GRAPH_DATA_QUERY, userId=user_id)
+
+
+@cached("community")
+def get_graph_view(user_id, max_users=MAX_USERS, max_books=MAX_BOOKS, max_edges=MAX_EDGES):
+    """
+    Bounded alternative to get_graph_data: samples at most `max_users` users and `max_books`
+    books on the server and returns deduplicated node and edge lists (see graph_view.py).
+    :param user_id (str): ID of the target user.
+    :param max_users (int): Maximum number of users besides the target user.
+    :param max_books (int): Maximum number of books.
+    :param max_edges (int): Maximum number of edges.
+    :return: dict: 'nodes', 'edges' and 'truncated', ready for graph_view.build_graph_view.
+    """
+    records = run_read(COMMUNITY_VIEW_QUERY, userId=user_id, maxUsers=max_users, maxBooks=max_books)
+    return view_from_records(records, max_edges)
 
 
 def build_graph(graph_data):
@@ -1,20 +1,14 @@
-from neo4j import GraphDatabase
 from pyvis.network import Network
 
-# Neo4j connection setup
-URI = "bolt://localhost:7687"
-USERNAME = "neo4j"
-PASSWORD = "SuperPasswort"
-driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
+from algorithms.ann_index import INDEX_PATH, IVFIndex
+from graph_db import run_read
+from instrumentation import register_queries
+from recommender.cache import cached
+from recommender.graph_view import KNN_VIEW_QUERY, MAX_BOOKS, MAX_EDGES, MAX_USERS, view_from_records
 
 
-def recommend_books(user_id):
-    """
-    Recommends books for a given user based on books rated by similar users.
-    :param user_id (str): ID of the target user.
-    :return: list[dict]: A list of up to 3 recommended books with average rating and number of votes.
-    """
-    query = """
+# --- Cypher queries (shared with recommender_async) ---
+RECOMMEND_BOOKS_QUERY = """
             MATCH (target:User {id: $userId})
             MATCH (target)-[:SIMILAR_TO]->(sim:User)-[r:RATED]->(book:Book)
             WHERE NOT (target)-[:RATED]->(book)
@@ -23,38 +17,15 @@ def recommend_books(user_id):
             LIMIT 3
             RETURN book.title AS title, book.author AS author, avgRating, votes
             """
-    with driver.session() as session:
-        result = session.run(query, userId=user_id)
-        return [record.data() for record in result]
-
 
-def get_similar_users(user_id):
-    """
-    Retrieves up to 3 users who are most similar to the given user.
-    :param user_id (str): ID of the target user.
-    :return: list[dict]: List of similar users with their IDs, location, and age.
-    """
-    query = """
+SIMILAR_USERS_QUERY = """
             MATCH (u1:User {id: $userId})-[:SIMILAR_TO]->(u2:User)
-            WHERE u1.id <> u2.id
+            WHERE u1 <> u2
             RETURN DISTINCT u2.id AS userId, u2.location AS location, u2.age AS age
             LIMIT 3
             """
-    with driver.session() as session:
-        result = session.run(query, userId=user_id)
-        return [record.data() for record in result]
 
-
-def get_graph_data(user_id):
-    """
-    Retrieves graph data for visualization, including:
-    - target user
-    - similar users
-    - books rated by each
-    :param user_id (str): ID of the target user.
-    :return: list[dict]: Query results containing users, books, ratings, and similarity scores.
-    """
-    query = """
+GRAPH_DATA_QUERY = """
             MATCH (target:User {id: $userId})
         
             // Bücher des Zielnutzers
@@ -75,8 +46,163 @@ def get_graph_data(user_id):
                 r2.rating AS rating2,
                 simRel.similarity AS similarityScore
             """
-    with driver.session() as session:
-        return [record.data() for record in session.run(query, userId=user_id)]
+
+
+# Batched variants for the recommendation service: one round-trip for many users
+RECOMMEND_BOOKS_BATCH_QUERY = """
+            UNWIND $userIds AS userId
+            MATCH (target:User {id: userId})
+            CALL {
+                WITH target
+                MATCH (target)-[:SIMILAR_TO]->(sim:User)-[r:RATED]->(book:Book)
+                WHERE NOT (target)-[:RATED]->(book)
+                WITH book, avg(r.rating) AS avgRating, count(*) AS votes
+                ORDER BY avgRating DESC, votes DESC
+                LIMIT 3
+                RETURN collect({title: book.title, author: book.author, avgRating: avgRating, votes: votes}) AS rows
+            }
+            RETURN userId, rows
+            """
+
+SIMILAR_USERS_BATCH_QUERY = """
+            UNWIND $userIds AS userId
+            MATCH (u1:User {id: userId})
+            CALL {
+                WITH u1
+                MATCH (u1)-[:SIMILAR_TO]->(u2:User)
+                WHERE u1 <> u2
+                WITH DISTINCT u2
+                LIMIT 3
+                RETURN collect({userId: u2.id, location: u2.location, age: u2.age}) AS rows
+            }
+            RETURN userId, rows
+            """
+
+register_queries("knn", globals())
+
+
+@cached("knn")
+def recommend_books(user_id):
+    """
+    Recommends books for a given user based on books rated by similar users.
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: A list of up to 3 recommended books with average rating and number of votes.
+    """
+    return run_read(RECOMMEND_BOOKS_QUERY, userId=user_id)
+
+
+@cached("knn")
+def get_similar_users(user_id):
+    """
+    Retrieves up to 3 users who are most similar to the given user.
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: List of similar users with their IDs, location, and age.
+    """
+    return run_read(SIMILAR_USERS_QUERY, userId=user_id)
+
+
+@cached("knn")
+def get_graph_data(user_id):
+    """
+    Retrieves graph data for visualization, including:
+    - target user
+    - similar users
+    - books rated by each
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: Query results containing users, books, ratings, and similarity scores.
+    """
+    return run_read(GRAPH_DATA_QUERY, userId=user_id)
+
+
+@cached("knn")
+def get_graph_view(user_id, max_users=MAX_USERS, max_books=MAX_BOOKS, max_edges=MAX_EDGES):
+    """
+    Bounded alternative to get_graph_data: samples at most `max_users` users and `max_books`
+    books on the server and returns deduplicated node and edge lists (see graph_view.py).
+    :param user_id (str): ID of the target user.
+    :param max_users (int): Maximum number of users besides the target user.
+    :param max_books (int): Maximum number of books.
+    :param max_edges (int): Maximum number of edges.
+    :return: dict: 'nodes', 'edges' and 'truncated', ready for graph_view.build_graph_view.
+    """
+    records = run_read(KNN_VIEW_QUERY, userId=user_id, maxUsers=max_users, maxBooks=max_books)
+    return view_from_records(records, max_edges)
+
+
+# --- Request-time similarity via the ANN index (instead of materialized SIMILAR_TO edges) ---
+_ann_index = None
+
+
+def get_ann_index():
+    """
+    Returns the ANN index over the user embeddings, memory-mapped on first use.
+    :return: IVFIndex: Index built by algorithms/ann_index.py
+    """
+    global _ann_index
+    if _ann_index is None:
+        _ann_index = IVFIndex.load(INDEX_PATH)
+    return _ann_index
+
+
+def _ann_neighbours(user_id, k, similarity_cutoff):
+    """
+    :return: list[int]: IDs of the most similar users in the ANN index (empty for unknown users)
+    """
+    try:
+        similar_ids, _ = get_ann_index().search_user(user_id, k=k, similarity_cutoff=similarity_cutoff)
+    except KeyError:
+        return []
+    return similar_ids.tolist()
+
+
+@cached("knn")
+def recommend_books_ann(user_id, top_k=20, similarity_cutoff=0.8):
+    """
+    Same as recommend_books, but the similar users are looked up in the ANN index at request time.
+    :param user_id (str): ID of the target user.
+    :param top_k (int): Number of similar users taken into account.
+    :param similarity_cutoff (float): Minimum cosine similarity of a similar user.
+    :return: list[dict]: A list of up to 3 recommended books with average rating and number of votes.
+    """
+    # the index and the User.id property both hold integers; UI and HTTP layers may pass strings
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return []
+    similar_ids = _ann_neighbours(user_id, top_k, similarity_cutoff)
+    query = """
+            MATCH (target:User {id: $userId})
+            UNWIND $similarIds AS similarId
+            MATCH (sim:User {id: similarId})-[r:RATED]->(book:Book)
+            WHERE NOT (target)-[:RATED]->(book)
+            WITH book, avg(r.rating) AS avgRating, count(*) AS votes
+            ORDER BY avgRating DESC, votes DESC
+            LIMIT 3
+            RETURN book.title AS title, book.author AS author, avgRating, votes
+            """
+    return run_read(query, userId=user_id, similarIds=similar_ids)
+
+
+@cached("knn")
+def get_similar_users_ann(user_id, similarity_cutoff=0.8):
+    """
+    Same as get_similar_users, but the similar users are looked up in the ANN index at request time.
+    :param user_id (str): ID of the target user.
+    :param similarity_cutoff (float): Minimum cosine similarity of a similar user.
+    :return: list[dict]: List of similar users with their IDs, location, and age.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return []
+    similar_ids = _ann_neighbours(user_id, 3, similarity_cutoff)
+    query = """
+            UNWIND range(0, size($similarIds) - 1) AS position
+            MATCH (u:User {id: $similarIds[position]})
+            RETURN u.id AS userId, u.location AS location, u.age AS age
+            ORDER BY position
+            """
+    return run_read(query, similarIds=similar_ids)
 
 
 def build_graph(graph_data):
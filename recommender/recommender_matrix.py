@@ -0,0 +1,349 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import graph_db
+from algorithms.embedding_store import EmbeddingStore
+from algorithms.fastrp_local import load_user_embeddings
+from recommender.graph_view import MAX_BOOKS, MAX_EDGES, MAX_USERS, graph_view
+from recommender.recommender_knn import build_graph  # noqa: F401 (same visualization as the KNN module)
+
+# Location of the filtered CSV files used by the default engine
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+# Embeddings written by algorithms/fastrp_local.py (used if present)
+EMBEDDINGS = os.path.join(DATA_DIR, "embeddings", "fastrp")
+
+
+class MatrixRecommender:
+    """
+    In-memory counterpart of recommender_knn: holds the user x book ratings as a CSR matrix
+    and (optionally) the user embeddings as a dense float32 array, and answers the same
+    recommend_books / get_similar_users / get_graph_data calls without a Neo4j round-trip.
+    Without embeddings, users are compared on their normalized rating vectors instead.
+    """
+
+    def __init__(self, users, books, ratings, embeddings=None, top_k=20, similarity_cutoff=0.8):
+        """
+        :param users (pd.DataFrame): One row per user with columns id, location, age
+        :param books (pd.DataFrame): One row per book with columns isbn, title, author, publisher, year
+        :param ratings (pd.DataFrame): Columns userId, isbn, rating
+        :param embeddings (np.ndarray): Optional user embeddings, one row per entry of `users`
+        :param top_k (int): Number of similar users per user (topK of gds.knn.write)
+        :param similarity_cutoff (float): Minimum cosine similarity (similarityCutoff of gds.knn.write)
+        """
+        self.users = users.reset_index(drop=True)
+        self.books = books.reset_index(drop=True)
+        self.top_k = top_k
+        self.similarity_cutoff = similarity_cutoff
+
+        self.user_index = pd.Index(self.users["id"])
+        self.book_index = pd.Index(self.books["isbn"])
+        rows = self.user_index.get_indexer(ratings["userId"])
+        cols = self.book_index.get_indexer(ratings["isbn"])
+        known = (rows >= 0) & (cols >= 0)
+        # RATED is unique per (user, book): keep the last rating of duplicates like MERGE + SET does
+        entries = pd.DataFrame({"row": rows[known], "col": cols[known],
+                                "rating": ratings["rating"].to_numpy()[known]})
+        entries = entries.drop_duplicates(["row", "col"], keep="last")
+        self.ratings = sparse.csr_matrix(
+            (entries["rating"].to_numpy(np.float32), (entries["row"].to_numpy(), entries["col"].to_numpy())),
+            shape=(len(self.users), len(self.books)),
+        )
+
+        if embeddings is not None:
+            vectors = np.asarray(embeddings, dtype=np.float32)
+        else:
+            vectors = self.ratings
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel()
+                        if sparse.issparse(vectors) else (vectors * vectors).sum(axis=1))
+        norms[norms == 0] = 1.0
+        if sparse.issparse(vectors):
+            self.vectors = sparse.csr_matrix(sparse.diags(1.0 / norms).dot(vectors), dtype=np.float32)
+        else:
+            self.vectors = vectors / norms[:, None].astype(np.float32)
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR, embeddings=None, **kwargs):
+        """
+        Builds the engine from the filtered CSV files.
+        :param data_dir (str): Folder with filtered_users.csv, filtered_books.csv and filtered_ratings.csv
+        :param embeddings (dict[int, list[float]]): Optional user embeddings keyed by user ID
+        :return: MatrixRecommender
+        """
+        users = pd.read_csv(os.path.join(data_dir, "filtered_users.csv"), encoding="latin-1")
+        books = pd.read_csv(os.path.join(data_dir, "filtered_books.csv"), encoding="latin-1",
+                            dtype={"ISBN": object, "Year-Of-Publication": object})
+        ratings = pd.read_csv(os.path.join(data_dir, "filtered_ratings.csv"), encoding="latin-1",
+                              dtype={"ISBN": object})
+        users = users.rename(columns={"User-ID": "id", "Location": "location", "Age": "age"})
+        books = books.rename(columns={"ISBN": "isbn", "Book-Title": "title", "Book-Author": "author",
+                                      "Publisher": "publisher", "Year-Of-Publication": "year"})
+        books["year"] = pd.to_numeric(books["year"], errors="coerce")
+        ratings = ratings.rename(columns={"User-ID": "userId", "ISBN": "isbn", "Book-Rating": "rating"})
+        users = users.drop_duplicates("id", keep="last")
+        books = books.drop_duplicates("isbn", keep="last")
+
+        vectors = None
+        if embeddings is not None:
+            dim = len(next(iter(embeddings.values())))
+            vectors = np.zeros((len(users), dim), dtype=np.float32)
+            for row, user_id in enumerate(users["id"]):
+                if user_id in embeddings:
+                    vectors[row] = embeddings[user_id]
+        return cls(users, books, ratings, vectors, **kwargs)
+
+    @classmethod
+    def from_graph(cls, driver=None, store=None, **kwargs):
+        """
+        Builds the engine from a one-off export of the graph (nodes and RATED edges), with the user
+        embeddings of the active version of the embedding store if there is one.
+        :param driver: Neo4j driver (defaults to the shared driver of graph_db)
+        :param store (EmbeddingStore): Embedding store (defaults to data/embeddings/store)
+        :return: MatrixRecommender
+        """
+        with graph_db.session(driver) as session:
+            users = pd.DataFrame(session.run("""
+                MATCH (u:User)
+                RETURN u.id AS id, u.location AS location, u.age AS age
+                """).data())
+            books = pd.DataFrame(session.run("""
+                MATCH (b:Book)
+                RETURN b.isbn AS isbn, b.title AS title, b.author AS author,
+                       b.publisher AS publisher, b.year AS year
+                """).data())
+            ratings = pd.DataFrame(session.run("""
+                MATCH (u:User)-[r:RATED]->(b:Book)
+                RETURN u.id AS userId, b.isbn AS isbn, r.rating AS rating
+                """).data())
+
+        store = store or EmbeddingStore()
+        vectors = store.open().user_vectors_for(users["id"]) if store.current() else None
+        return cls(users, books, ratings, vectors, **kwargs)
+
+    # --- Lookups ---
+    def _user(self, row):
+        user = self.users.iloc[row]
+        age = user["age"]
+        return {"id": int(user["id"]), "location": user["location"],
+                "age": None if pd.isna(age) else int(age)}
+
+    def _book(self, col):
+        book = self.books.iloc[col]
+        year = book["year"]
+        return {"isbn": book["isbn"], "title": book["title"], "author": book["author"],
+                "publisher": book["publisher"], "year": None if pd.isna(year) else int(year)}
+
+    def user_row(self, user_id):
+        """
+        :param user_id (int): ID of the target user (numeric strings are accepted like in the UI)
+        :return: int: Row of the user, -1 if unknown (the Cypher queries then match nothing)
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return -1
+        return int(self.user_index.get_indexer([user_id])[0])
+
+    def similar_users(self, user_id):
+        """
+        Finds the nearest users by cosine similarity, like the SIMILAR_TO edges written by gds.knn.write.
+        :param user_id (int): ID of the target user
+        :return: tuple[np.ndarray, np.ndarray]: Row indices and similarities, most similar first (empty if unknown)
+        """
+        target = self.user_row(user_id)
+        if target == -1:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if sparse.issparse(self.vectors):
+            scores = self.vectors.dot(self.vectors[target].T).toarray().ravel()
+        else:
+            scores = self.vectors @ self.vectors[target]
+        scores[target] = -np.inf
+
+        k = min(self.top_k, len(scores) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[scores[candidates] >= self.similarity_cutoff]
+        order = np.argsort(-scores[candidates], kind="stable")
+        return candidates[order], scores[candidates[order]]
+
+    def recommend_indices(self, user_id, limit=3):
+        """
+        Books rated by similar users that the target user has not rated yet, as column indices.
+        :param user_id (int): ID of the target user
+        :param limit (int): Number of recommendations
+        :return: tuple[np.ndarray]: Book columns, average ratings and votes, best first
+        """
+        similar, _ = self.similar_users(user_id)
+        if len(similar) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)
+        neighbour_ratings = self.ratings[similar]
+        totals = np.asarray(neighbour_ratings.sum(axis=0)).ravel()
+        votes = np.diff(neighbour_ratings.tocsc().indptr)
+
+        candidates = np.flatnonzero(votes)
+        rated = self.ratings[self.user_row(user_id)].indices
+        candidates = np.setdiff1d(candidates, rated, assume_unique=True)
+        avg = totals[candidates] / votes[candidates]
+        top = candidates[np.lexsort((-votes[candidates], -avg))][:limit]
+        return top, totals[top] / votes[top], votes[top]
+
+    # --- Same API as recommender_knn ---
+    def recommend_books(self, user_id, limit=3):
+        """
+        Recommends books rated by similar users that the target user has not rated yet.
+        :param user_id (int): ID of the target user
+        :param limit (int): Number of recommendations
+        :return: list[dict]: Books with title, author, average rating and number of votes
+        """
+        result = []
+        for col, avg, votes in zip(*self.recommend_indices(user_id, limit)):
+            book = self._book(col)
+            result.append({"title": book["title"], "author": book["author"],
+                           "avgRating": float(avg), "votes": int(votes)})
+        return result
+
+    def get_similar_users(self, user_id, limit=3):
+        """
+        Retrieves the most similar users of the given user.
+        :param user_id (int): ID of the target user
+        :param limit (int): Number of users
+        :return: list[dict]: Users with their IDs, location, and age
+        """
+        similar, _ = self.similar_users(user_id)
+        result = []
+        for row in similar[:limit]:
+            user = self._user(row)
+            result.append({"userId": user["id"], "location": user["location"], "age": user["age"]})
+        return result
+
+    def get_graph_data(self, user_id):
+        """
+        Returns the target user, the similar users and the books rated by each, in the record
+        layout of recommender_knn.get_graph_data (one row per edge instead of a row product).
+        :param user_id (int): ID of the target user
+        :return: list[dict]: Records for recommender_knn.build_graph
+        """
+        target_row = self.user_row(user_id)
+        if target_row == -1:
+            return []
+        target = self._user(target_row)
+        records = []
+        row = self.ratings[target_row]
+        for col, rating in zip(row.indices, row.data):
+            records.append({"u1": target, "u2": None, "book1": self._book(col), "rating1": int(rating),
+                            "book2": None, "rating2": None, "similarityScore": None})
+
+        similar, scores = self.similar_users(user_id)
+        for sim_row, score in zip(similar, scores):
+            sim_user = self._user(sim_row)
+            row = self.ratings[sim_row]
+            books = list(zip(row.indices, row.data)) or [(None, None)]
+            for col, rating in books:
+                records.append({"u1": target, "u2": sim_user, "book1": None, "rating1": None,
+                                "book2": self._book(col) if col is not None else None,
+                                "rating2": int(rating) if rating is not None else None,
+                                "similarityScore": float(score)})
+        return records
+
+    def get_graph_view(self, user_id, max_users=MAX_USERS, max_books=MAX_BOOKS, max_edges=MAX_EDGES):
+        """
+        Bounded view like recommender_knn.get_graph_view: the `max_users` most similar users and
+        the `max_books` books most of them rated (then by best rating).
+        :param user_id (int): ID of the target user
+        :param max_users (int): Maximum number of users besides the target user
+        :param max_books (int): Maximum number of books
+        :param max_edges (int): Maximum number of edges
+        :return: dict: Result of graph_view.graph_view
+        """
+        target_row = self.user_row(user_id)
+        if target_row == -1:
+            return graph_view([], [], max_edges)
+        similar, scores = self.similar_users(user_id)
+        rows = np.concatenate([[target_row], similar[:max_users]])
+        users = [{**self._user(row), "similarity": None if i == 0 else float(scores[i - 1])}
+                 for i, row in enumerate(rows)]
+
+        sampled = self.ratings[rows].tocsc()
+        raters = np.diff(sampled.indptr)
+        best = sampled.max(axis=0).toarray().ravel()
+        candidates = np.flatnonzero(raters)
+        top = candidates[np.lexsort((-best[candidates], -raters[candidates]))][:max_books]
+        books = []
+        for col in top:
+            column = slice(sampled.indptr[col], sampled.indptr[col + 1])
+            books.append({**self._book(col), "ratings": [
+                {"userId": users[i]["id"], "rating": int(rating)}
+                for i, rating in zip(sampled.indices[column], sampled.data[column])]})
+        return graph_view(users, books, max_edges)
+
+
+# --- Module-level API (drop-in replacement for recommender_knn) ---
+_engine = None
+
+
+def get_engine():
+    """
+    Returns the shared engine, loading it from the filtered CSV files on first use (with the
+    embeddings of the active store version, or else the local FastRP embeddings if they exist).
+    :return: MatrixRecommender
+    """
+    global _engine
+    if _engine is None:
+        store = EmbeddingStore()
+        if store.current():
+            version = store.open()
+            embeddings = dict(zip(version.user_ids.tolist(), version.user_vectors))
+        elif os.path.exists(f"{EMBEDDINGS}.npy"):
+            embeddings = load_user_embeddings(EMBEDDINGS)
+        else:
+            embeddings = None
+        _engine = MatrixRecommender.from_csv(embeddings=embeddings)
+    return _engine
+
+
+def set_engine(engine):
+    """
+    Replaces the shared engine, e.g. with one built from a graph export or with embeddings.
+    :param engine (MatrixRecommender): Engine used by the module-level functions
+    """
+    global _engine
+    _engine = engine
+
+
+def recommend_books(user_id):
+    """
+    Recommends books for a given user based on books rated by similar users.
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: A list of up to 3 recommended books with average rating and number of votes.
+    """
+    return get_engine().recommend_books(user_id)
+
+
+def get_similar_users(user_id):
+    """
+    Retrieves up to 3 users who are most similar to the given user.
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: List of similar users with their IDs, location, and age.
+    """
+    return get_engine().get_similar_users(user_id)
+
+
+def get_graph_data(user_id):
+    """
+    Retrieves graph data for visualization (target user, similar users and their books).
+    :param user_id (str): ID of the target user.
+    :return: list[dict]: Records in the layout expected by build_graph.
+    """
+    return get_engine().get_graph_data(user_id)
+
+
+def get_graph_view(user_id):
+    """
+    Retrieves a bounded graph view (sampled users and books, deduplicated nodes and edges).
+    :param user_id (str): ID of the target user.
+    :return: dict: 'nodes', 'edges' and 'truncated', ready for graph_view.build_graph_view.
+    """
+    return get_engine().get_graph_view(user_id)
@@ -0,0 +1,310 @@
+"""
+Standalone HTTP recommendation service.
+
+Serves recommend_books and get_similar_users of the KNN and community recommenders, and of
+KNN with the similar users from the ANN index at request time (knn-ann, see algorithms/ann_index.py):
+
+    GET /recommendations?user=<id>&algorithm=knn|community|knn-ann
+    GET /similar-users?user=<id>&algorithm=knn|community|knn-ann
+    GET /stats      latency percentiles, batch sizes and coalesced requests
+    GET /health
+
+Requests are not sent to Neo4j one by one. A Batcher per (algorithm, function) collects them
+for a short window: requests for the same user share one pending result (coalescing), and
+all distinct users of the window are answered by a single `UNWIND $userIds` query (batching).
+The backend is pluggable; StubBackend answers without a database for tests and load runs.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import recommender.recommender_community as community
+import recommender.recommender_knn as knn
+from graph_db import run_read
+from graph_schema import ensure_schema
+
+# --- Service settings ---
+DEFAULT_PORT = 8000
+BATCH_WINDOW = 0.005  # seconds a batch stays open for further requests
+MAX_BATCH_SIZE = 256
+FLUSH_WORKERS = 4  # batches that may be in flight at the same time per endpoint
+LATENCY_SAMPLES = 10000  # latencies kept per endpoint for the percentiles
+
+ENDPOINTS = {"/recommendations": "recommend_books", "/similar-users": "get_similar_users"}
+
+BATCH_QUERIES = {
+    "knn": {"recommend_books": knn.RECOMMEND_BOOKS_BATCH_QUERY,
+            "get_similar_users": knn.SIMILAR_USERS_BATCH_QUERY},
+    "community": {"recommend_books": community.RECOMMEND_BOOKS_BATCH_QUERY,
+                  "get_similar_users": community.SIMILAR_USERS_BATCH_QUERY},
+}
+# Served per user: the neighbours come from the ANN index, not from a batched graph query
+PER_USER_FUNCTIONS = {
+    "knn-ann": {"recommend_books": knn.recommend_books_ann, "get_similar_users": knn.get_similar_users_ann},
+}
+ALGORITHMS = (*BATCH_QUERIES, *PER_USER_FUNCTIONS)
+
+
+# --- BACKENDS ---
+class Neo4jBackend:
+    """
+    Answers a whole batch of users with one UNWIND query over the shared driver.
+    """
+
+    def fetch(self, algorithm, function, user_ids):
+        """
+        :param algorithm (str): 'knn', 'community' or 'knn-ann'
+        :param function (str): 'recommend_books' or 'get_similar_users'
+        :param user_ids (list[int]): Distinct user IDs of the batch
+        :return: dict[int, list[dict]]: Result rows per user (users without a result are missing)
+        """
+        if algorithm in PER_USER_FUNCTIONS:
+            return {user_id: PER_USER_FUNCTIONS[algorithm][function](user_id) for user_id in user_ids}
+        if algorithm == "community" and function == "recommend_books" and community.USE_TABLES:
+            return {user_id: community.recommend_books_precomputed(user_id) for user_id in user_ids}
+        records = run_read(BATCH_QUERIES[algorithm][function], userIds=user_ids)
+        return {record["userId"]: record["rows"] for record in records}
+
+
+class StubBackend:
+    """
+    In-memory backend without a database: deterministic results per user and a simulated
+    round-trip of `latency` seconds plus `per_user` seconds for every user in the batch.
+    """
+
+    def __init__(self, latency=0.01, per_user=0.0001):
+        self.latency = latency
+        self.per_user = per_user
+        self.queries = 0
+
+    def fetch(self, algorithm, function, user_ids):
+        """
+        :param algorithm (str): 'knn', 'community' or 'knn-ann'
+        :param function (str): 'recommend_books' or 'get_similar_users'
+        :param user_ids (list[int]): Distinct user IDs of the batch
+        :return: dict[int, list[dict]]: Result rows per user
+        """
+        time.sleep(self.latency + self.per_user * len(user_ids))
+        self.queries += 1
+        if function == "recommend_books":
+            return {user_id: [{"title": f"Book {(user_id * 7 + i) % 1000}", "author": f"Author {i}",
+                               "votes": 3 - i} for i in range(3)] for user_id in user_ids}
+        return {user_id: [{"userId": user_id + i + 1, "location": "stub", "age": None} for i in range(3)]
+                for user_id in user_ids}
+
+
+# --- BATCHING ---
+class LatencyRecorder:
+    """
+    Keeps the most recent latencies of an endpoint and reports percentiles.
+    """
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentiles(self):
+        """
+        :return: dict: Request count and p50 / p95 / p99 latency in milliseconds
+        """
+        with self._lock:
+            samples = np.array(self._samples)
+        if len(samples) == 0:
+            return {"count": self.count}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {"count": self.count, "p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+
+class Batcher:
+    """
+    Collects requests of one (algorithm, function) pair for `window` seconds and sends the
+    distinct user IDs to the backend as one batch. Requests for a user that is already
+    pending share its Future.
+    """
+
+    def __init__(self, backend, algorithm, function, window=BATCH_WINDOW, max_batch=MAX_BATCH_SIZE,
+                 workers=FLUSH_WORKERS):
+        self.backend = backend
+        self.algorithm = algorithm
+        self.function = function
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        threading.Thread(target=self._collect, name=f"batcher-{algorithm}-{function}", daemon=True).start()
+
+    def submit(self, user_id):
+        """
+        :param user_id (int): ID of the target user
+        :return: Future: Resolves to the result rows of the user
+        """
+        with self._condition:
+            self.requests += 1
+            future = self._pending.get(user_id)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._pending[user_id] = Future()
+            self._condition.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # keep the batch open for the window unless it is already full
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+                user_ids = list(self._pending)[:self.max_batch]
+                batch = {user_id: self._pending.pop(user_id) for user_id in user_ids}
+                self.batches += 1
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        try:
+            results = self.backend.fetch(self.algorithm, self.function, list(batch))
+        except Exception as error:
+            for future in batch.values():
+                future.set_exception(error)
+            return
+        for user_id, future in batch.items():
+            future.set_result(results.get(user_id, []))
+
+    def stats(self):
+        """
+        :return: dict: Request, coalescing and batch counters
+        """
+        return {"requests": self.requests, "coalesced": self.coalesced, "batches": self.batches,
+                "avg_batch_size": round((self.requests - self.coalesced) / self.batches, 2) if self.batches else 0}
+
+
+class RecommendationService:
+    """
+    Routes requests to one Batcher per (algorithm, function) and records their latencies.
+    """
+
+    def __init__(self, backend=None, window=BATCH_WINDOW, max_batch=MAX_BATCH_SIZE):
+        self.backend = backend or Neo4jBackend()
+        self.batchers = {(algorithm, function): Batcher(self.backend, algorithm, function, window, max_batch)
+                         for algorithm in ALGORITHMS for function in ENDPOINTS.values()}
+        self.latencies = {key: LatencyRecorder() for key in self.batchers}
+
+    def get(self, algorithm, function, user_id, timeout=30):
+        """
+        :param algorithm (str): 'knn', 'community' or 'knn-ann'
+        :param function (str): 'recommend_books' or 'get_similar_users'
+        :param user_id (int): ID of the target user
+        :param timeout (float): Maximum wait in seconds
+        :return: list[dict]: Result rows
+        """
+        start = time.perf_counter()
+        result = self.batchers[(algorithm, function)].submit(user_id).result(timeout)
+        self.latencies[(algorithm, function)].record(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        """
+        :return: dict: Latency percentiles and batch counters per endpoint
+        """
+        return {f"{algorithm}/{function}": {**self.latencies[(algorithm, function)].percentiles(),
+                                            **batcher.stats()}
+                for (algorithm, function), batcher in self.batchers.items()}
+
+
+# --- HTTP ---
+def make_handler(service):
+    """
+    :param service (RecommendationService): Service answering the requests
+    :return: type: Request handler class for http.server
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == "/health":
+                return self._send(200, {"status": "ok"})
+            if url.path == "/stats":
+                return self._send(200, service.stats())
+            if url.path not in ENDPOINTS:
+                return self._send(404, {"error": f"unknown path {url.path}"})
+            algorithm = params.get("algorithm", ["knn"])[0]
+            if algorithm not in ALGORITHMS:
+                return self._send(400, {"error": f"unknown algorithm {algorithm}"})
+            try:
+                user_id = int(params["user"][0])
+            except (KeyError, ValueError):
+                return self._send(400, {"error": "parameter 'user' must be an integer"})
+            try:
+                self._send(200, service.get(algorithm, ENDPOINTS[url.path], user_id))
+            except Exception as error:
+                self._send(503, {"error": str(error)})
+
+        def _send(self, status, body):
+            payload = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would dominate the load tests
+
+    return Handler
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 stalls connects under load
+
+
+def create_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    :param service (RecommendationService): Service answering the requests
+    :param host (str): Interface to bind
+    :param port (int): Port (0 picks a free one)
+    :return: RecommendationServer: Server, not yet started (call serve_forever)
+    """
+    return RecommendationServer((host, port), make_handler(service))
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP recommendation service with request batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--window", type=float, default=BATCH_WINDOW, help="Batch window in seconds")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--stub", action="store_true", help="Serve from the in-memory stub backend")
+    args = parser.parse_args()
+
+    if not args.stub:
+        ensure_schema()
+    backend = StubBackend() if args.stub else Neo4jBackend()
+    server = create_server(RecommendationService(backend, args.window, args.max_batch), args.host, args.port)
+    print(f"Recommendation service listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
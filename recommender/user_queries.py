@@ -0,0 +1,63 @@
+"""
+Cypher of the user lookups in streamlit_app.py, kept importable for benchmarks and schema checks
+(importing the app itself would run the UI).
+"""
+from instrumentation import register_queries
+
+LARGE_COMMUNITIES_QUERY = """
+            MATCH (u:User)
+            WHERE u.community IS NOT NULL
+            WITH u.community AS communityId, COUNT(*) AS size
+            WHERE size > 1
+            RETURN communityId
+            ORDER BY communityId
+            """
+
+# Largest value of the integer User.id property
+MAX_USER_ID = 2 ** 63 - 1
+
+# The ID search seeks the User.id index once per range of id_prefix_ranges (the ranges are disjoint)
+COUNT_USERS_QUERY = """
+            UNWIND $idRanges AS idRange
+            MATCH (u:User)
+            WHERE u.id >= idRange[0] AND u.id < idRange[1] AND u.community IN $communities
+            RETURN COUNT(u) AS total
+            """
+
+USERS_PAGE_QUERY = """
+            UNWIND $idRanges AS idRange
+            MATCH (u:User)
+            WHERE u.id >= idRange[0] AND u.id < idRange[1] AND u.community IN $communities
+            RETURN u.id AS userId, u.location AS location, u.age AS age, u.community AS communityId
+            ORDER BY communityId, userId
+            SKIP $skip
+            LIMIT $limit
+            """
+
+USER_RATED_BOOKS_QUERY = """
+            MATCH (u:User {id: $userId})-[r:RATED]->(b:Book)
+            RETURN b.title AS title, b.author AS author, r.rating AS rating
+            ORDER BY r.rating DESC
+            """
+
+register_queries("app", globals())
+
+
+def id_prefix_ranges(search):
+    """
+    Translates a prefix of the decimal user ID into the ID ranges it matches, e.g. '27' into
+    [27, 28), [270, 280), [2700, 2800), ..., so the search needs no string conversion of every ID.
+    :param search (str): Prefix of the user ID ('' for all users)
+    :return: list[list[int]]: Half-open [low, high) ranges (empty if no ID can match)
+    """
+    if not search:
+        return [[-MAX_USER_ID - 1, MAX_USER_ID]]
+    if not (search.isascii() and search.isdigit()):
+        return []
+    if search[0] == "0":
+        return [[0, 1]] if search == "0" else []
+    prefix, scale, ranges = int(search), 1, []
+    while prefix * scale <= MAX_USER_ID:
+        ranges.append([prefix * scale, min((prefix + 1) * scale, MAX_USER_ID)])
+        scale *= 10
+    return ranges
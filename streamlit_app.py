@@ -1,61 +1,138 @@
 import streamlit as st
 import pandas as pd
 import streamlit.components.v1 as components
-from neo4j import GraphDatabase
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Connection configuration for Neo4j
-URI = "bolt://localhost:7687"
-USERNAME = "neo4j"
-PASSWORD = "SuperPasswort"
-driver = GraphDatabase.driver(URI, auth=(USERNAME, PASSWORD))
+import graph_db
+from graph_db import run_read
+from graph_schema import ensure_schema
+from recommender.cache import cache_stats
+from recommender.graph_view import build_graph_view
+from recommender.recommender_async import recommend_all, run
+from recommender.user_queries import (COUNT_USERS_QUERY, LARGE_COMMUNITIES_QUERY, USER_RATED_BOOKS_QUERY,
+                                      USERS_PAGE_QUERY, id_prefix_ranges)
 
+USERS_PER_PAGE = 50
+# How long user lists and rated books are reused across reruns and sessions (seconds)
+DATA_TTL = 600
 
-def get_users_in_large_communities():
+
+@st.cache_resource
+def get_driver():
+    """
+    Opens the pooled Neo4j driver once per server process (shared by all sessions and reruns)
+    and makes sure the indexes the user lookups rely on exist.
+    :return: neo4j.Driver
+    """
+    driver = graph_db.get_driver()
+    ensure_schema()
+    return driver
+
+
+@st.cache_resource
+def get_prefetch_pool():
+    """
+    :return: ThreadPoolExecutor: Background workers that fetch recommendations ahead of the click
+    """
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+@st.cache_data(ttl=DATA_TTL)
+def get_large_communities():
+    """
+    Retrieves the IDs of all communities with more than one member.
+    :return: list[int]: Community IDs
+    """
+    return [record["communityId"] for record in run_read(LARGE_COMMUNITIES_QUERY)]
+
+
+@st.cache_data(ttl=DATA_TTL)
+def count_users(search):
+    """
+    Counts the users in large communities whose ID starts with `search`.
+    :param search (str): Prefix of the user ID ('' for all users)
+    :return: int: Number of matching users
     """
-    Retrieves all users who belong to a community with more than one member.
+    return run_read(COUNT_USERS_QUERY, communities=get_large_communities(),
+                    idRanges=id_prefix_ranges(search))[0]["total"]
+
+
+@st.cache_data(ttl=DATA_TTL)
+def get_users_page(search, page):
+    """
+    Retrieves one page of users who belong to a community with more than one member.
+    :param search (str): Prefix of the user ID ('' for all users)
+    :param page (int): Page number, starting at 0
     :return: list[dict]: A list of dictionaries containing userId, location, age, and communityId.
     """
-    query = """
-            MATCH (u:User)
-            WITH u.community AS communityId, COLLECT(u) AS users, COUNT(u) AS size
-            WHERE size > 1
-            UNWIND users AS user
-            RETURN user.id AS userId, user.location AS location, user.age AS age, communityId
-            ORDER BY communityId, userId
-            """
-    with driver.session() as session:
-        result = session.run(query)
-        return [record.data() for record in result]
+    return run_read(USERS_PAGE_QUERY, communities=get_large_communities(), idRanges=id_prefix_ranges(search),
+                    skip=page * USERS_PER_PAGE, limit=USERS_PER_PAGE)
 
 
+@st.cache_data(ttl=DATA_TTL)
 def get_user_rated_books(user_id):
     """
     Retrieves all books rated by a specific user, including title, author, and rating.
     :param user_id (str): The ID of the user.
     :return: list[dict]: A list of rated books with title, author, and rating.
     """
-    query = """
-            MATCH (u:User {id: $userId})-[r:RATED]->(b:Book)
-            RETURN b.title AS title, b.author AS author, r.rating AS rating
-            ORDER BY r.rating DESC
-            """
-    with driver.session() as session:
-        result = session.run(query, userId=user_id)
-        return [record.data() for record in result]
+    return run_read(USER_RATED_BOOKS_QUERY, userId=user_id)
+
+
+def fetch_recommendations(user_id, algo):
+    """
+    Recommendations, similar users and the bounded graph view of a user. KNN and Community run
+    their Neo4j queries concurrently; results land in the recommendation cache either way.
+    :param user_id (int): The ID of the user.
+    :param algo (str): 'KNN', 'Community' or 'Matrix'
+    :return: dict: recommendations, similarUsers, graphView and the fetch time in seconds
+    """
+    start_time = time.time()
+    if algo == "Matrix":
+        import recommender.recommender_matrix as rec
+        result = {"recommendations": rec.recommend_books(user_id), "similarUsers": rec.get_similar_users(user_id),
+                  "graphView": rec.get_graph_view(user_id)}
+    else:
+        result = run(recommend_all(user_id, algo.lower()))
+    return {**result, "seconds": time.time() - start_time}
+
+
+def prefetch(user_id, algo):
+    """
+    Starts fetching the recommendations of the selected user in the background, so the button
+    mostly finds them ready. Reruns with the same selection reuse the running or finished fetch.
+    :return: Future: Result of fetch_recommendations
+    """
+    key, future = st.session_state.get("prefetched", (None, None))
+    if key != (user_id, algo) or (future.done() and future.exception() is not None):
+        future = get_prefetch_pool().submit(fetch_recommendations, user_id, algo)
+        st.session_state["prefetched"] = ((user_id, algo), future)
+    return future
 
 
 # --- Streamlit UI ---
 st.set_page_config(layout="wide")
 st.title("Book Recommendation System")
-
-# Load users and prepare selection options
-users = get_users_in_large_communities()
+get_driver()
+
+# Searchable, paginated user picker (only one page of users is loaded at a time)
+search_col, page_col = st.columns([3, 1])
+search = search_col.text_input("Search user ID:", placeholder="e.g. 2766").strip()
+pages = max(1, -(-count_users(search) // USERS_PER_PAGE))
+page = page_col.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1) - 1
+users = get_users_page(search, int(page))
+if not users:
+    st.info("No user matches the search.")
+    st.stop()
 user_options = {f"User {u['userId']} (Community {u['communityId']})": u for u in users}
 selected = st.selectbox("Select a user:", options=list(user_options.keys()))
 selected_user = user_options[selected]
 
+# Choose recommendation algorithm and start fetching its results right away
+algo = st.selectbox("Choose recommendation algorithm:", ["KNN", "Community", "Matrix"], index=0)
+prefetched = prefetch(selected_user['userId'], algo)
+
 # Display selected user information
 st.subheader("👤 User Info")
 st.write(f"**Location:** {selected_user['location']}")
@@ -66,22 +143,13 @@ rated_books = get_user_rated_books(selected_user['userId'])
 st.subheader("Books Rated by User")
 st.table(pd.DataFrame(rated_books))
 
-# Choose recommendation algorithm
-algo = st.selectbox("Choose recommendation algorithm:", ["KNN", "Community"], index=0)
-
-# Dynamically import the appropriate recommendation module
-if algo == "Community":
-    import recommender.recommender_community as rec
-else:
-    import recommender.recommender_knn as rec
-
 # Run recommendation when button is clicked
 if st.button("Recommend Books"):
     start_time = time.time() # Start timer
 
-    # Get recommendations and similar users
-    recs = rec.recommend_books(selected_user['userId'])
-    sims = rec.get_similar_users(selected_user['userId'])
+    # Get recommendations, similar users and graph data (usually already prefetched)
+    result = prefetched.result()
+    recs, sims, graph_view = result["recommendations"], result["similarUsers"], result["graphView"]
 
     end_time = time.time() # End timer
     duration = end_time - start_time
@@ -96,19 +164,12 @@ if st.button("Recommend Books"):
 
     # Display graph visualization
     st.subheader("Graph Visualization")
-    graph_data = rec.get_graph_data(selected_user['userId'])
-    net = rec.build_graph(graph_data)
-
-    # Create temporary HTML file for graph visualization
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp_file:
-        path = tmp_file.name
-        net.show(path, notebook=False)
-    with open(path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    components.html(html_content, height=700, scrolling=True)
-
-    # Optional: Delete temp file after use
-    # os.unlink(path)
+    net = build_graph_view(graph_view)
+    if graph_view["truncated"]:
+        st.caption(f"Showing a sample of {len(graph_view['nodes'])} nodes and {len(graph_view['edges'])} edges.")
+    components.html(net.generate_html(notebook=False), height=700, scrolling=True)
 
     # Display execution time for the algorithm
-    st.success(f"Execution time for '{algo}' recommendation: {duration:.2f} seconds")
\ No newline at end of file
+    st.success(f"Execution time for '{algo}' recommendation: {result['seconds']:.2f} seconds "
+               f"(waited {duration:.2f} seconds after the click)")
+    st.caption(f"Recommendation cache: {cache_stats()}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported from the project root, as with `python -m` (see README)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from algorithms.ann_index import IVFIndex, normalize
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(11)
+    centres = rng.normal(size=(20, 16))
+    vectors = (centres[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 16))).astype(np.float32)
+    ids = rng.permutation(np.arange(10_000, 12_000))
+    return ids, vectors
+
+
+def exact_top_k(ids, vectors, user, k):
+    normalized = normalize(vectors)
+    row = int(np.flatnonzero(ids == user)[0])
+    scores = normalized @ normalized[row]
+    scores[row] = -np.inf
+    return set(ids[np.argsort(-scores, kind="stable")[:k]])
+
+
+def recall(index, ids, vectors, nprobe, k=10, queries=50):
+    users = ids[:queries]
+    found = sum(len(set(index.search_user(user, k=k, nprobe=nprobe)[0]) & exact_top_k(ids, vectors, user, k))
+                for user in users)
+    return found / (k * queries)
+
+
+def test_recall_against_exact_search(data):
+    ids, vectors = data
+    index = IVFIndex.build(ids, vectors, lists=32, seed=1)
+    assert recall(index, ids, vectors, nprobe=8) >= 0.9
+    # probing every list is an exact search
+    assert recall(index, ids, vectors, nprobe=32) == 1.0
+
+
+def test_search_user_excludes_the_user_and_sorts(data):
+    ids, vectors = data
+    index = IVFIndex.build(ids, vectors, lists=32, seed=1)
+    neighbours, similarities = index.search_user(ids[0], k=10, nprobe=4, similarity_cutoff=0.5)
+    assert ids[0] not in neighbours
+    assert np.all(np.diff(similarities) <= 0) and np.all(similarities >= 0.5)
+    with pytest.raises(KeyError):
+        index.vector(1)
+
+
+def test_save_and_load_round_trip(data, tmp_path):
+    ids, vectors = data
+    index = IVFIndex.build(ids, vectors, lists=16, seed=1)
+    index.save(str(tmp_path / "ivf"))
+    loaded = IVFIndex.load(str(tmp_path / "ivf"))
+    for user in ids[:5]:
+        expected, _ = index.search_user(user, k=5)
+        found, _ = loaded.search_user(user, k=5)
+        assert list(found) == list(expected)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from recommender.batch_recommendations import rating_matrices, recommend_block, run_batch, similarity_matrix
+
+USERS = 20
+BOOKS = 15
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.default_rng(3)
+    # integer ratings and similarities that are exact in float32, so averages tie exactly like in the naive sums
+    ratings = sparse.random(USERS, BOOKS, density=0.3, format="csr", random_state=rng,
+                            data_rvs=lambda size: rng.integers(1, 11, size)).astype(np.float32)
+    sources, targets = rng.integers(0, USERS, 80), rng.integers(0, USERS, 80)
+    edges = pd.DataFrame({"source": sources + 100, "target": targets + 100,
+                          "similarity": rng.choice([0.5, 0.75, 1.0], 80)}).drop_duplicates(["source", "target"])
+    return np.arange(100, 100 + USERS), ratings, edges
+
+
+def naive(ratings, edges, weighted, limit):
+    """
+    recommend_books per user: average rating of the neighbours per book the user has not rated.
+    :return: dict[int, list[tuple]]: (book, avgRating, votes) per user row, best first
+    """
+    dense = ratings.toarray()
+    result = {}
+    for row in range(USERS):
+        neighbours = edges[(edges["source"] == row + 100) & (edges["target"] != row + 100)]
+        scores = []
+        for book in range(BOOKS):
+            if dense[row, book]:
+                continue
+            votes = [(1.0 if not weighted else similarity, dense[target - 100, book])
+                     for target, similarity in zip(neighbours["target"], neighbours["similarity"])
+                     if dense[target - 100, book]]
+            if votes:
+                count = sum(weight for weight, _ in votes)
+                scores.append((book, sum(weight * rating for weight, rating in votes) / count, count))
+        scores.sort(key=lambda score: (-score[1], -score[2], score[0]))
+        result[row] = scores[:limit]
+    return result
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_recommend_block_matches_naive_aggregation(inputs, weighted):
+    user_ids, ratings, edges = inputs
+    similar = similarity_matrix(edges, user_ids, weighted)
+    ratings, rated = rating_matrices(ratings)
+    found = {row: [] for row in range(USERS)}
+    for block in (np.arange(0, 7), np.arange(7, USERS)):
+        rows, rank, books, average, votes = recommend_block(similar, ratings, rated, block, limit=3)
+        for row, position, book, avg, count in zip(rows, rank, books, average, votes):
+            assert position == len(found[row]) + 1
+            found[row].append((int(book), float(avg), float(count)))
+    expected = naive(inputs[1], edges, weighted, 3)
+    assert found == {row: [(book, pytest.approx(avg), pytest.approx(count)) for book, avg, count in scores]
+                     for row, scores in expected.items()}
+
+
+def test_resume_refuses_other_inputs(inputs, tmp_path):
+    user_ids, ratings, edges = inputs
+    isbns = np.array([f"isbn{col}" for col in range(BOOKS)])
+    first = run_batch(user_ids, isbns, ratings, edges, str(tmp_path), block_size=8, workers=1)
+    again = run_batch(user_ids, isbns, ratings, edges, str(tmp_path), block_size=8, workers=1)
+    assert first["blocks"] == 3 and again["blocks"] == 0 and again["skipped_blocks"] == 3
+
+    changed = ratings.copy()
+    changed.data[0] += 1
+    with pytest.raises(ValueError, match="other ratings or SIMILAR_TO edges"):
+        run_batch(user_ids, isbns, changed, edges, str(tmp_path), block_size=8, workers=1)
+    with pytest.raises(ValueError, match="other ratings or SIMILAR_TO edges"):
+        run_batch(user_ids, isbns, ratings, edges.iloc[1:], str(tmp_path), block_size=8, workers=1)
+    with pytest.raises(ValueError, match="other settings"):
+        run_batch(user_ids, isbns, ratings, edges, str(tmp_path), block_size=8, workers=1, limit=5)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from recommender import cache
+from recommender.cache import LRUCache, cached
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "GENERATION_FILE", str(tmp_path / "generation"))
+    monkeypatch.setattr(cache, "_local", LRUCache())
+    monkeypatch.setattr(cache, "_shared", None)
+    return tmp_path
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == (True, 1)
+    lru.set("c", 3)
+    assert lru.get("b") == (False, None)
+    assert lru.get("a") == (True, 1) and lru.get("c") == (True, 3)
+    assert lru.stats() == {"hits": 3, "misses": 1, "entries": 2}
+
+
+def test_entries_expire_after_ttl():
+    assert LRUCache(ttl=60).get("a") == (False, None)
+    fresh, expired = LRUCache(ttl=60), LRUCache(ttl=-1)
+    fresh.set("a", 1)
+    expired.set("a", 1)
+    assert fresh.get("a") == (True, 1)
+    assert expired.get("a") == (False, None) and expired.stats()["entries"] == 0
+
+
+def test_cached_results_are_isolated_copies():
+    calls = []
+
+    @cached("test")
+    def rows(user_id):
+        calls.append(user_id)
+        return [{"userId": user_id}]
+    first = rows(1)
+    first.append({"userId": 99})
+    first[0]["userId"] = 5
+    second = rows(1)
+    assert second == [{"userId": 1}] and calls == [1]
+    second[0]["userId"] = 7
+    assert rows(1) == [{"userId": 1}]
+
+
+def test_every_invalidation_changes_the_generation():
+    generations = {cache.current_generation()}
+    for _ in range(20):
+        cache.invalidate()
+        generations.add(cache.current_generation())
+    assert len(generations) == 21
+
+
+def test_invalidation_from_another_process(isolated_cache):
+    calls = []
+
+    @cached("test")
+    def rows(user_id):
+        calls.append(user_id)
+        return [{"userId": user_id, "call": len(calls)}]
+    assert rows(1) == rows(1) and calls == [1]
+    subprocess.run([sys.executable, "-c", "from recommender.cache import invalidate; invalidate()"], cwd=ROOT,
+                   env={**os.environ, "RECOMMENDER_CACHE_DIR": str(isolated_cache)}, check=True)
+    # the entry of the old generation is still in this process's LRU, but no longer matches the key
+    assert rows(1) == [{"userId": 1, "call": 2}] and calls == [1, 1]
@@ -0,0 +1,102 @@
+import pytest
+from neo4j.exceptions import TransientError
+
+import graph_db
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def data(self):
+        return list(self.rows)
+
+
+class FakeTx:
+    def run(self, query, parameters=None, **kwargs):
+        return FakeResult([{"query": query, "params": parameters}])
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args, **kwargs):
+        self.driver.calls.append(("read", getattr(work, "timeout", None)))
+        return work(FakeTx(), *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        self.driver.calls.append(("write", getattr(work, "timeout", None)))
+        return work(FakeTx(), *args, **kwargs)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.calls = []
+        self.sessions = []
+
+    def session(self, **kwargs):
+        self.sessions.append(kwargs)
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    fake = FakeDriver()
+    monkeypatch.setattr(graph_db, "_driver", None)
+    graph_db.set_driver(fake)
+    return fake
+
+
+def test_get_driver_leaves_retries_to_the_driver(monkeypatch):
+    created = {}
+
+    def fake_driver(uri, **kwargs):
+        created.update(kwargs, uri=uri)
+        return FakeDriver()
+    monkeypatch.setattr(graph_db, "_driver", None)
+    monkeypatch.setattr(graph_db.GraphDatabase, "driver", fake_driver)
+    graph_db.get_driver()
+    assert created["uri"] == graph_db.URI
+    assert created["max_transaction_retry_time"] == graph_db.MAX_RETRY_TIME
+    assert created["max_connection_pool_size"] == graph_db.MAX_POOL_SIZE
+    assert graph_db.get_driver() is graph_db.get_driver()
+
+
+def test_run_read_and_write_use_managed_transactions_with_timeouts(driver):
+    assert graph_db.run_read("RETURN $x AS x", x=1) == [{"query": "RETURN $x AS x", "params": {"x": 1}}]
+    graph_db.run_write("CREATE (n)", timeout=5)
+    assert driver.calls == [("read", graph_db.QUERY_TIMEOUT), ("write", 5)]
+
+
+def test_transient_error_is_not_retried_around_the_driver(driver):
+    attempts = []
+
+    def work(tx):
+        attempts.append(tx)
+        raise TransientError("deadlock")
+    # the driver's managed transaction has given up already: no second attempt on top of it
+    with pytest.raises(TransientError):
+        graph_db.write(work)
+    assert len(attempts) == 1
+
+
+def test_sessions_open_on_configured_database(driver, monkeypatch):
+    monkeypatch.setattr(graph_db, "DATABASE", None)
+    graph_db.run_read("RETURN 1")
+    monkeypatch.setattr(graph_db, "DATABASE", "books")
+    graph_db.run_read("RETURN 1")
+    other = FakeDriver()
+    with graph_db.session(other, fetch_size=10):
+        pass
+    assert driver.sessions == [{}, {"database": "books"}]
+    assert other.sessions == [{"fetch_size": 10, "database": "books"}]
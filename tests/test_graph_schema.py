@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import graph_db
+import graph_schema
+from graph_schema import plan_operators, scans
+
+# Shapes of EXPLAIN plans as the driver returns them (operator names carry the runtime suffix)
+INDEXED_PLAN = {
+    "operatorType": "ProduceResults@neo4j",
+    "children": [{
+        "operatorType": "Top@neo4j",
+        "children": [{
+            "operatorType": "Expand(All)@neo4j",
+            "children": [{"operatorType": "NodeUniqueIndexSeek@neo4j", "children": []}],
+        }],
+    }],
+}
+SCANNING_PLAN = {
+    "operatorType": "ProduceResults@neo4j",
+    "children": [{
+        "operatorType": "CartesianProduct@neo4j",
+        "children": [
+            {"operatorType": "NodeIndexSeek@neo4j", "children": []},
+            {"operatorType": "Filter@neo4j",
+             "children": [{"operatorType": "NodeByLabelScan@neo4j", "children": []}]},
+        ],
+    }],
+}
+
+
+def test_plan_operators_depth_first_without_suffix():
+    assert plan_operators(INDEXED_PLAN) == ["ProduceResults", "Top", "Expand(All)", "NodeUniqueIndexSeek"]
+    assert plan_operators(SCANNING_PLAN) == ["ProduceResults", "CartesianProduct", "NodeIndexSeek", "Filter",
+                                             "NodeByLabelScan"]
+
+
+def test_scans_reports_full_scans_only():
+    assert scans(INDEXED_PLAN) == []
+    assert scans(SCANNING_PLAN) == ["NodeByLabelScan"]
+    assert scans({"operatorType": "AllNodesScan@neo4j"}) == ["AllNodesScan"]
+    assert scans(SCANNING_PLAN, forbidden=("NodeIndexSeek",)) == ["NodeIndexSeek"]
+
+
+def test_schema_statements_are_idempotent():
+    statements = graph_schema.schema_statements(rating_index=False)
+    assert set(statements) == {"user_id", "book_isbn", "user_community", "user_dirty"}
+    assert "rated_rating" in graph_schema.schema_statements(rating_index=True)
+    assert all("IF NOT EXISTS" in statement for statement in statements.values())
+
+
+def test_ensure_schema_runs_once_per_process(monkeypatch):
+    written = []
+    monkeypatch.setattr(graph_schema, "_ensured", False)
+    monkeypatch.setattr(graph_db, "run_write", lambda query, **params: written.append(query))
+    monkeypatch.setattr(graph_db, "run_read", lambda query, **params: [])
+    graph_schema.ensure_schema(rating_index=False)
+    graph_schema.ensure_schema(rating_index=False)
+    assert written == list(graph_schema.schema_statements(rating_index=False).values())
+    graph_schema.ensure_schema(rating_index=False, force=True)
+    assert len(written) == 2 * len(graph_schema.CONSTRAINTS) + 2 * len(graph_schema.INDEXES)
+
+
+@pytest.mark.skipif(not os.environ.get("NEO4J_URI"), reason="needs a Neo4j server (set NEO4J_URI)")
+def test_hot_path_queries_are_index_backed():
+    from benchmarks.check_query_plans import check_plans
+    try:
+        graph_schema.ensure_schema()
+        results = check_plans()
+    finally:
+        graph_db.close_driver()
+    assert {name: result["scans"] for name, result in results.items() if result["scans"]} == {}
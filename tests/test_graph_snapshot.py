@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from algorithms.fastrp_local import build_rating_graph
+from data.graph_snapshot import GraphSnapshot
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    pd.DataFrame({"User-ID": [30, 10, 20, 40], "Location": ["köln, germany", "a", "b", "c"],
+                  "Age": [25, None, 40, 31]}).to_csv(tmp_path / "filtered_users.csv", index=False,
+                                                      encoding="latin-1")
+    pd.DataFrame({"ISBN": ["0375", "0060", "038X", "0451"], "Book-Title": ["Café", "B", "C", "D"],
+                  "Book-Author": ["W", "X", "Y", "Z"], "Year-Of-Publication": [1999, 0, 2001, 1987],
+                  "Publisher": ["P", "Q", "R", "S"]}).to_csv(tmp_path / "filtered_books.csv", index=False,
+                                                              encoding="latin-1")
+    # the second (30, 0375) rating replaces the first; user 99 and ISBN 9999 are not in the filtered files
+    pd.DataFrame({"User-ID": [30, 10, 20, 30, 40, 99, 10, 30],
+                  "ISBN": ["0375", "0060", "038X", "0451", "0375", "0060", "9999", "0375"],
+                  "Book-Rating": [5, 8, 10, 7, 9, 6, 4, 3]}).to_csv(tmp_path / "filtered_ratings.csv",
+                                                                    index=False, encoding="latin-1")
+    return tmp_path
+
+
+def test_saved_snapshot_matches_build_rating_graph(data_dir):
+    GraphSnapshot.from_csv(str(data_dir)).save(str(data_dir / "snapshot"))
+    snapshot = GraphSnapshot.open(str(data_dir / "snapshot"), mmap=True)
+    assert isinstance(snapshot.user_offsets, np.memmap)
+
+    user_ids, isbns, ratings = build_rating_graph(str(data_dir))
+    rows, cols = np.argsort(user_ids), np.argsort(isbns)
+    assert snapshot.user_ids.tolist() == user_ids[rows].tolist()
+    assert snapshot.isbn_strings().tolist() == isbns[cols].tolist()
+    assert (snapshot.ratings_matrix().toarray() == ratings[rows][:, cols].toarray()).all()
+    assert snapshot.meta["ratings"] == ratings.nnz == 5
+
+
+def test_lookups_and_strings_survive_the_round_trip(data_dir):
+    GraphSnapshot.from_csv(str(data_dir)).save(str(data_dir / "snapshot"))
+    snapshot = GraphSnapshot.open(str(data_dir / "snapshot"), mmap=True)
+    assert snapshot.user_index([20, 99, 40]).tolist() == [1, -1, 3]
+    assert snapshot.book_index(["0375", "9999"]).tolist() == [1, -1]
+    assert snapshot.user(0) == {"id": 10, "location": "a", "age": None, "community": None}
+    assert snapshot.book(1) == {"isbn": "0375", "title": "Café", "author": "W", "publisher": "P", "year": 1999}
+    books, ratings = snapshot.books_of(snapshot.user_index(30)[0])
+    assert snapshot.isbn_strings()[books].tolist() == ["0375", "0451"] and ratings.tolist() == [3, 7]
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+import pytest
+
+import instrumentation
+from benchmarks.bench_instrumentation import FakeAsyncDriver, FakeDriver, FakeResult, FakeSession, fetch, per_query_us
+from instrumentation import MemorySink, instrument, instrument_async, phase
+from recommender.recommender_knn import RECOMMEND_BOOKS_QUERY
+
+# Generous bound for shared CI machines; benchmarks/bench_instrumentation.py checks 2 us
+MAX_DISABLED_OVERHEAD_US = 10.0
+
+
+@pytest.fixture(autouse=True)
+def tracing_disabled():
+    instrumentation.disable()
+    instrumentation._last_profiled.clear()
+    yield
+    instrumentation.disable()
+
+
+def write_rating(tx, user_id):
+    tx.run("MATCH (u:User {id: $userId}) SET u.dirty = true", userId=user_id)
+
+
+def test_disabled_driver_hands_out_plain_sessions():
+    driver = instrument(FakeDriver())
+    assert type(driver.session()) is FakeSession
+    assert instrument(driver) is driver and instrument(None) is None
+
+
+def test_disabled_overhead_per_query():
+    raw = per_query_us(FakeDriver(), 2000)
+    disabled = per_query_us(instrument(FakeDriver()), 2000)
+    assert disabled - raw <= MAX_DISABLED_OVERHEAD_US
+
+
+def test_spans_are_named_counted_and_phased():
+    sink = MemorySink()
+    instrumentation.enable(sink)
+    driver = instrument(FakeDriver())
+    with phase("job"), driver.session() as session:
+        records = session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 1})
+        session.execute_write(write_rating, 7)
+        list(session.run("MATCH (b:Book) RETURN b.title AS title"))
+    query, write, auto, job = sink.spans
+    assert len(records) == 3
+    assert query["name"] == "knn.recommend_books" and query["rows"] == 3
+    assert query["params_hash"] == instrumentation.params_hash({"userId": 1})
+    # the write result is never consumed by the caller, the span is finished with the transaction
+    assert write["name"] == "test_instrumentation.write_rating"
+    assert write["counters"] == {"properties_set": 5}
+    assert auto["rows"] == 3 and auto["phase"] == "job"
+    assert job["kind"] == "phase" and job["name"] == "job"
+
+
+def test_slow_queries_get_plans_without_running_writes_twice():
+    sink = MemorySink()
+    instrumentation.enable(sink, profile_threshold=0.005)
+    slow = FakeDriver(delay=0.01)
+    driver = instrument(slow)
+    with driver.session() as session:
+        session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 2})
+        session.execute_write(write_rating, 8)
+    instrumentation.disable()  # waits for the background plan captures
+    spans = {span["name"]: span for span in sink.spans}
+    assert spans["knn.recommend_books"]["db_hits"] == 2
+    assert any(query.startswith("PROFILE") for query in slow.log)
+    assert "plan" in spans["test_instrumentation.write_rating"]
+    assert any(query.startswith("EXPLAIN") for query in slow.log)
+    assert sum(query.startswith("MATCH (u:User") for query in slow.log) == 1
+
+
+def test_async_read_span():
+    async def run():
+        driver = instrument_async(FakeAsyncDriver())
+
+        async def work(tx, user_id):
+            return await (await tx.run(RECOMMEND_BOOKS_QUERY, {"userId": user_id})).data()
+        async with driver.session() as session:
+            return await session.execute_read(work, 3)
+    sink = MemorySink()
+    instrumentation.enable(sink)
+    records = asyncio.run(run())
+    assert len(records) == 3
+    assert len(sink.spans) == 1 and sink.spans[0]["rows"] == 3
+
+
+def test_async_slow_queries_get_plans():
+    async def run():
+        driver = instrument_async(slow)
+
+        async def work(tx, user_id):
+            return await (await tx.run(RECOMMEND_BOOKS_QUERY, {"userId": user_id})).data()
+
+        async def write(tx, user_id):
+            await tx.run("MATCH (u:User {id: $userId}) SET u.dirty = true", userId=user_id)
+        async with driver.session() as session:
+            await session.execute_read(work, 5)
+            await session.execute_write(write, 9)
+        await asyncio.gather(*instrumentation._profile_tasks)
+    sink = MemorySink()
+    instrumentation.enable(sink, profile_threshold=0.005)
+    slow = FakeAsyncDriver(delay=0.01)
+    asyncio.run(run())
+    spans = {span["name"]: span for span in sink.spans}
+    assert spans["knn.recommend_books"]["db_hits"] == 2
+    assert spans["test_instrumentation.write"]["counters"] == {"properties_set": 5}
+    assert "plan" in spans["test_instrumentation.write"]
+    assert [query.split()[0] for query in slow.log] == ["MATCH", "MATCH", "PROFILE", "EXPLAIN"]
+
+
+def test_failed_reads_finish_their_span_with_the_error(monkeypatch):
+    def broken(self):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(FakeResult, "data", broken)
+    sink = MemorySink()
+    instrumentation.enable(sink)
+    with instrument(FakeDriver()).session() as session:
+        with pytest.raises(RuntimeError, match="connection lost"):
+            session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 6})
+        assert len(list(session.run(RECOMMEND_BOOKS_QUERY, userId=6))) == 3
+    failed, iterated = sink.spans
+    assert failed["error"] == "RuntimeError" and failed["rows"] == 0
+    assert iterated["error"] is None and iterated["rows"] == 3
+
+
+@pytest.mark.parametrize("trace", ["bogus", "prometheus", "log,nope:x"])
+def test_malformed_trace_only_warns(trace, caplog):
+    with caplog.at_level(logging.WARNING, logger="instrumentation"):
+        assert instrumentation.configure_from_env(trace) is False
+    assert not instrumentation.enabled()
+    assert "Tracing disabled" in caplog.text
+
+
+def test_trace_log_sink(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    assert instrumentation.configure_from_env(f"log:{path}")
+    with instrument(FakeDriver()).session() as session:
+        session.execute_read(fetch, RECOMMEND_BOOKS_QUERY, {"userId": 4})
+    instrumentation.disable()
+    assert "knn.recommend_books" in path.read_text()
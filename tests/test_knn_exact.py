@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from algorithms.knn_exact import exact_knn, source_batches, top_k_block, write_similar_to
+
+
+def brute_force(vectors, top_k, similarity_cutoff):
+    """
+    :return: dict[int, dict[int, float]]: Neighbours and similarities per row
+    """
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ normalized.T
+    neighbours = {}
+    for row, row_scores in enumerate(scores):
+        others = [col for col in np.argsort(-row_scores, kind="stable") if col != row][:top_k]
+        neighbours[row] = {col: row_scores[col] for col in others if row_scores[col] >= similarity_cutoff}
+    return neighbours
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(7).normal(size=(60, 8)).astype(np.float32)
+
+
+def as_neighbours(sources, targets, similarities):
+    neighbours = {}
+    for source, target, similarity in zip(sources, targets, similarities):
+        neighbours.setdefault(int(source), {})[int(target)] = similarity
+    return neighbours
+
+
+def assert_same(found, expected):
+    assert {row: set(targets) for row, targets in found.items()} == \
+           {row: set(targets) for row, targets in expected.items() if targets}
+    for row, targets in found.items():
+        for target, similarity in targets.items():
+            assert similarity == pytest.approx(expected[row][target], abs=1e-5)
+
+
+def test_top_k_block_matches_brute_force(vectors):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    found = as_neighbours(*top_k_block(normalized, 10, 25, top_k=5, similarity_cutoff=-1.0))
+    expected = {row: targets for row, targets in brute_force(vectors, 5, -1.0).items() if 10 <= row < 25}
+    assert_same(found, expected)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_exact_knn_matches_brute_force(vectors, workers):
+    ids = np.arange(100, 160)
+    edges = exact_knn(ids, vectors, top_k=4, similarity_cutoff=0.3, block_size=16, workers=workers)
+    found = as_neighbours(edges["source"] - 100, edges["target"] - 100, edges["similarity"])
+    assert_same(found, brute_force(vectors, 4, 0.3))
+
+
+def test_source_batches_keep_all_edges_of_a_source_together():
+    edges = pd.DataFrame({"source": [3, 1, 3, 1, 2], "target": [1, 2, 2, 3, 1], "similarity": 0.9})
+    batches = list(source_batches(np.array([1, 2, 3, 4]), edges, users_per_batch=2))
+    assert [sources for sources, _ in batches] == [[1, 2], [3, 4]]
+    assert [sorted(row["source"] for row in batch) for _, batch in batches] == [[1, 1, 2], [3, 3]]
+
+
+def test_write_similar_to_deletes_old_edges_of_its_sources_first():
+    class Tx:
+        def __init__(self):
+            self.runs = []
+
+        def run(self, query, **params):
+            self.runs.append((query, params))
+    tx = Tx()
+    write_similar_to(tx, [{"source": 1, "target": 2, "similarity": 0.9}], sources=[1, 4])
+    (delete, delete_params), (merge, merge_params) = tx.runs
+    assert "DELETE s" in delete and delete_params == {"sources": [1, 4]}
+    assert "MERGE" in merge and merge_params["rows"][0]["target"] == 2
@@ -0,0 +1,97 @@
+import threading
+
+import pandas as pd
+
+import graph_db
+from data.load_data import (LOAD_BOOKS_QUERY, LOAD_RATINGS_QUERY, LOAD_USERS_QUERY, BatchSizeTuner, load_parallel,
+                            load_users, run_phase)
+
+
+class FakeTx:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, **params):
+        with self.driver.lock:
+            self.driver.batches.append((query, params["rows"]))
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(FakeTx(self.driver), *args, **kwargs)
+
+
+class FakeDriver:
+    """
+    Records every written batch and the arguments of every session.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    def session(self, **kwargs):
+        with self.lock:
+            self.sessions.append(kwargs)
+        return FakeSession(self)
+
+    def rows(self, query):
+        return [row for batch_query, rows in self.batches if batch_query == query for row in rows]
+
+
+def frames(users=250, books=120, ratings=900):
+    users_df = pd.DataFrame({"User-ID": range(users), "Location": "somewhere", "Age": 30})
+    books_df = pd.DataFrame({"ISBN": [str(i) for i in range(books)], "Book-Title": "Title",
+                             "Book-Author": "Author", "Year-Of-Publication": 2000, "Publisher": "Publisher"})
+    ratings_df = pd.DataFrame({"User-ID": [i % users for i in range(ratings)],
+                               "ISBN": [str(i % books) for i in range(ratings)], "Book-Rating": 8})
+    return users_df, books_df, ratings_df
+
+
+def test_run_phase_writes_every_row_once():
+    driver = FakeDriver()
+    users_df, _, _ = frames(users=1003)
+    stats = run_phase(driver, "Users", load_users, users_df, workers=3, tuner=BatchSizeTuner(initial=100))
+    assert stats["rows"] == 1003
+    assert sorted(row["User-ID"] for row in driver.rows(LOAD_USERS_QUERY)) == list(range(1003))
+    # one session per batch
+    assert len(driver.sessions) == len(driver.batches)
+
+
+def test_load_parallel_writes_ratings_after_users_and_books():
+    driver = FakeDriver()
+    users_df, books_df, ratings_df = frames()
+    stats = load_parallel(driver, users_df, books_df, ratings_df, workers=2, batch_size=50)
+    assert [phase["phase"] for phase in stats] == ["Users", "Books", "Ratings"]
+    assert [phase["rows"] for phase in stats] == [250, 120, 900]
+    assert len(driver.rows(LOAD_USERS_QUERY)) == 250 and len(driver.rows(LOAD_BOOKS_QUERY)) == 120
+    assert len(driver.rows(LOAD_RATINGS_QUERY)) == 900
+    queries = [query for query, _ in driver.batches]
+    first_rating = queries.index(LOAD_RATINGS_QUERY)
+    assert LOAD_USERS_QUERY not in queries[first_rating:] and LOAD_BOOKS_QUERY not in queries[first_rating:]
+
+
+def test_load_parallel_opens_sessions_on_configured_database(monkeypatch):
+    monkeypatch.setattr(graph_db, "DATABASE", "books")
+    driver = FakeDriver()
+    load_parallel(driver, *frames(users=10, books=10, ratings=10), workers=2, batch_size=5)
+    assert driver.sessions and all(kwargs == {"database": "books"} for kwargs in driver.sessions)
+
+
+def test_batch_size_tuner_stays_within_bounds():
+    tuner = BatchSizeTuner(initial=1000, minimum=100, maximum=4000, window=1)
+    for seconds in (1.0, 0.5, 0.25, 0.125, 0.1, 0.1):
+        tuner.record(1000, seconds)
+        assert 100 <= tuner.size <= 4000
+    # throughput kept improving, so the size grew up to the maximum
+    assert tuner.size == 4000
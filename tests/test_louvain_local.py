@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from algorithms.louvain_local import co_rating_graph, louvain, modularity
+
+
+def graph(nodes, edges):
+    rows, cols, weights = zip(*edges)
+    upper = sparse.coo_matrix((weights, (rows, cols)), shape=(nodes, nodes))
+    return (upper + upper.T).tocsr()
+
+
+def two_cliques(size, bridge_weight):
+    clique = [(a, b, 1.0) for a in range(size) for b in range(a + 1, size)]
+    return graph(2 * size, clique + [(a + size, b + size, w) for a, b, w in clique]
+                 + [(size - 1, size, bridge_weight)])
+
+
+def test_modularity_matches_hand_computed_value():
+    # two triangles joined by one edge: 2m = 14, 12 of it inside the communities, both degrees 7
+    weights = two_cliques(3, 1.0)
+    labels = np.array([0, 0, 0, 1, 1, 1])
+    assert modularity(weights, labels) == pytest.approx(12 / 14 - 2 * (7 / 14) ** 2)
+    assert modularity(weights, np.zeros(6, int)) == pytest.approx(0.0)
+    assert modularity(weights, labels, resolution=0.5) == pytest.approx(12 / 14 - 0.5 * 2 * (7 / 14) ** 2)
+
+
+def test_louvain_recovers_planted_cliques():
+    labels, score = louvain(two_cliques(8, 0.5), seed=3)
+    assert len(set(labels[:8])) == 1 and len(set(labels[8:])) == 1 and labels[0] != labels[8]
+    assert score == pytest.approx(modularity(two_cliques(8, 0.5), labels))
+
+
+def test_co_rating_graph_counts_shared_positive_ratings():
+    ratings = sparse.csr_matrix(np.array([[8, 7, 0, 9],
+                                          [6, 9, 0, 0],
+                                          [7, 2, 10, 9]], dtype=np.float32))
+    assert co_rating_graph(ratings).toarray().tolist() == [[0, 2, 2], [2, 0, 1], [2, 1, 0]]
+    # book 0 has three positive raters and is dropped under a cap of two
+    assert co_rating_graph(ratings, max_book_raters=2).toarray().tolist() == [[0, 1, 1], [1, 0, 0], [1, 0, 0]]
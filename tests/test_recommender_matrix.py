@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import recommender.recommender_matrix as matrix
+from recommender.recommender_matrix import MatrixRecommender
+
+USERS = pd.DataFrame({"id": [1, 2, 3, 4], "location": ["a", "b", "c", "d"], "age": [30, None, 40, 50]})
+BOOKS = pd.DataFrame({"isbn": ["A", "B", "C", "D"], "title": ["Book A", "Book B", "Book C", "Book D"],
+                      "author": "Author", "publisher": "Publisher", "year": 2000})
+# Cosine similarity of the rating vectors: (1, 3) = 100 / (10 * sqrt(125)) ~ 0.89,
+# (1, 2) = 100 / (10 * sqrt(181)) ~ 0.74, (1, 4) = 0
+RATINGS = pd.DataFrame([(1, "A", 8), (1, "B", 6),
+                        (2, "A", 8), (2, "B", 6), (2, "C", 9),
+                        (3, "A", 8), (3, "B", 6), (3, "D", 5),
+                        (4, "C", 5)], columns=["userId", "isbn", "rating"])
+
+
+@pytest.fixture
+def engine():
+    return MatrixRecommender(USERS, BOOKS, RATINGS, top_k=2, similarity_cutoff=0.5)
+
+
+def test_similar_users_by_cosine(engine):
+    assert engine.get_similar_users(1) == [{"userId": 3, "location": "c", "age": 40},
+                                           {"userId": 2, "location": "b", "age": None}]
+
+
+def test_recommend_books_from_similar_users(engine):
+    # C (9 from user 2) and D (5 from user 3); A and B are rated by user 1 already
+    assert engine.recommend_books(1) == [
+        {"title": "Book C", "author": "Author", "avgRating": 9.0, "votes": 1},
+        {"title": "Book D", "author": "Author", "avgRating": 5.0, "votes": 1},
+    ]
+
+
+def test_string_ids_match_numeric_ids(engine):
+    assert engine.recommend_books("1") == engine.recommend_books(1)
+    assert engine.get_similar_users("1") == engine.get_similar_users(1)
+
+
+@pytest.mark.parametrize("user_id", [99, "99", "abc", None])
+def test_unknown_users_get_empty_results(engine, user_id):
+    assert engine.recommend_books(user_id) == []
+    assert engine.get_similar_users(user_id) == []
+    assert engine.get_graph_data(user_id) == []
+    assert engine.get_graph_view(user_id)["nodes"] == []
+
+
+def test_module_functions_pass_ids_through(engine, monkeypatch):
+    monkeypatch.setattr(matrix, "_engine", engine)
+    assert matrix.recommend_books("abc") == []
+    assert matrix.get_similar_users("abc") == []
+    assert matrix.get_graph_data("abc") == []
+    assert matrix.get_graph_view("abc")["nodes"] == []
+    assert matrix.recommend_books("1") == engine.recommend_books(1)
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from recommender.service import Batcher, RecommendationService, StubBackend
+
+# Long enough that every request of a test lands in the same window
+WINDOW = 0.2
+
+
+class RecordingBackend(StubBackend):
+    def __init__(self, error=None):
+        super().__init__(latency=0, per_user=0)
+        self.calls = []
+        self.error = error
+
+    def fetch(self, algorithm, function, user_ids):
+        self.calls.append(sorted(user_ids))
+        if self.error is not None:
+            raise self.error
+        return super().fetch(algorithm, function, user_ids)
+
+
+def test_concurrent_requests_for_one_user_share_a_backend_call():
+    backend = RecordingBackend()
+    batcher = Batcher(backend, "knn", "recommend_books", window=WINDOW)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: batcher.submit(5).result(5), range(8)))
+    assert backend.calls == [[5]]
+    assert all(result == results[0] for result in results) and len(results[0]) == 3
+    assert batcher.stats()["coalesced"] == 7
+
+
+def test_distinct_users_of_one_window_are_fetched_in_one_batch():
+    backend = RecordingBackend()
+    batcher = Batcher(backend, "knn", "get_similar_users", window=WINDOW)
+    futures = {user_id: batcher.submit(user_id) for user_id in range(1, 21)}
+    results = {user_id: future.result(5) for user_id, future in futures.items()}
+    assert backend.calls == [list(range(1, 21))]
+    assert all(result[0]["userId"] == user_id + 1 for user_id, result in results.items())
+
+
+def test_batches_are_split_at_max_batch():
+    backend = RecordingBackend()
+    batcher = Batcher(backend, "knn", "recommend_books", window=WINDOW, max_batch=4)
+    futures = [batcher.submit(user_id) for user_id in range(10)]
+    for future in futures:
+        future.result(5)
+    assert sorted(user_id for call in backend.calls for user_id in call) == list(range(10))
+    assert all(len(call) <= 4 for call in backend.calls)
+
+
+def test_backend_errors_reach_every_waiter():
+    backend = RecordingBackend(error=RuntimeError("database unavailable"))
+    service = RecommendationService(backend, window=WINDOW)
+    batcher = service.batchers[("community", "recommend_books")]
+    futures = [batcher.submit(user_id) for user_id in (1, 1, 2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="database unavailable"):
+            future.result(5)
+    assert backend.calls == [[1, 2]]
+
+
+def test_service_records_latencies():
+    service = RecommendationService(RecordingBackend(), window=0.001)
+    assert len(service.get("community", "recommend_books", 7)) == 3
+    assert service.stats()["community/recommend_books"]["count"] == 1